@@ -0,0 +1,197 @@
+"""
+Account profiles: several Telegram accounts exported from one process
+"""
+
+import asyncio
+from pathlib import Path
+
+# Import configuration
+try:
+    from config import API_ID, API_HASH, PHONE, OUTPUT_DIR, SESSION_NAME
+except ImportError:
+    API_ID = API_HASH = PHONE = None
+    OUTPUT_DIR = 'telegram_saved_messages_exports'
+    SESSION_NAME = 'telegram_session'
+
+try:
+    from config import ACCOUNTS
+except ImportError:
+    ACCOUNTS = None
+
+try:
+    from config import EXPORT_CHATS
+except ImportError:
+    EXPORT_CHATS = []
+
+DEFAULT_ACCOUNT_NAME = 'default'
+
+
+class AccountProfile:
+    """Credentials, session and output tree of one Telegram account."""
+
+    def __init__(self, name, api_id, api_hash, phone, session_name=None, output_dir=None, chats=None):
+        self.name = name
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.phone = phone
+        # Every account needs its own session file and export tree
+        self.session_name = session_name or f"{SESSION_NAME}_{name}"
+        self.output_dir = output_dir or str(Path(OUTPUT_DIR) / name)
+        self.chats = list(chats or [])
+
+    def is_configured(self):
+        """Check that real API credentials were filled in."""
+        return bool(self.api_id and self.api_hash
+                    and self.api_id != 'YOUR_API_ID' and self.api_hash != 'YOUR_API_HASH')
+
+    def create_client(self):
+        """Create (but do not start) the TelegramClient of this account."""
+        from telethon import TelegramClient
+        return TelegramClient(self.session_name, self.api_id, self.api_hash)
+
+    def to_dict(self):
+        """Public description of the profile (no credentials)."""
+        return {
+            'name': self.name,
+            'phone': self.phone,
+            'session_name': self.session_name,
+            'output_dir': self.output_dir,
+            'chats': self.chats
+        }
+
+
+def load_accounts():
+    """Load the account profiles from config.py.
+
+    ``ACCOUNTS`` is a list of dicts with the keys name, api_id, api_hash,
+    phone and optionally session_name, output_dir and chats. Without it the
+    single API_ID/API_HASH/PHONE/SESSION_NAME/OUTPUT_DIR configuration is
+    used as the one 'default' account, with its existing session and
+    output directory.
+
+    Returns:
+        List of AccountProfile
+    """
+    if not ACCOUNTS:
+        return [AccountProfile(DEFAULT_ACCOUNT_NAME, API_ID, API_HASH, PHONE,
+                               session_name=SESSION_NAME, output_dir=OUTPUT_DIR, chats=EXPORT_CHATS)]
+
+    profiles = []
+    for entry in ACCOUNTS:
+        profiles.append(AccountProfile(
+            entry['name'],
+            entry.get('api_id', API_ID),
+            entry.get('api_hash', API_HASH),
+            entry.get('phone'),
+            session_name=entry.get('session_name'),
+            output_dir=entry.get('output_dir'),
+            chats=entry.get('chats')
+        ))
+
+    names = [profile.name for profile in profiles]
+    duplicates = {name for name in names if names.count(name) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate account name(s) in ACCOUNTS: {', '.join(sorted(duplicates))}")
+    return profiles
+
+
+def get_account(name, profiles=None):
+    """Find an account profile by name.
+
+    Raises:
+        KeyError: If no account has this name
+    """
+    for profile in profiles if profiles is not None else load_accounts():
+        if profile.name == name:
+            return profile
+    raise KeyError(f"Unknown account '{name}'")
+
+
+async def export_account(profile, client, from_date=None, force_reexport=False, cancel_event=None,
+                         run_budget=None, aggregator=None):
+    """Export one account with an already started client.
+
+    Every account has its own client, so flood waits and the adaptive
+    download limit apply per account and never slow the others down. A
+    ``run_budget`` is shared by all accounts of the run. With an
+    ``aggregator`` (progress.ProgressAggregator) the progress of this
+    account is reported there instead of the process-wide one.
+
+    Returns:
+        Dictionary with the account name, output_dir, db_path and the
+        export statistics
+    """
+    from database import init_database
+    from exporter import export_saved_messages, export_chats
+    from progress import use_aggregator
+
+    if aggregator is not None:
+        use_aggregator(aggregator)
+    db_path = init_database(profile.output_dir)
+    result = {'account': profile.name, 'output_dir': profile.output_dir, 'db_path': str(db_path)}
+    if profile.chats:
+        result['chats'] = await export_chats(client, profile.chats, output_dir=profile.output_dir,
+                                             from_date=from_date, force_reexport=force_reexport,
+                                             cancel_event=cancel_event, run_budget=run_budget)
+    else:
+        result['stats'] = await export_saved_messages(client, db_path, from_date=from_date,
+                                                      force_reexport=force_reexport,
+                                                      output_dir=profile.output_dir, cancel_event=cancel_event,
+                                                      run_budget=run_budget)
+    return result
+
+
+async def export_accounts(profiles, from_date=None, force_reexport=False, cancel_event=None, run_budget=None):
+    """Export several accounts concurrently on one event loop.
+
+    Clients are started one after another, because a first login asks for
+    the code on the console, and the exports then run in parallel.
+
+    Returns:
+        Dictionary mapping account name to its export_account result (or
+        {'error': ...} if it failed)
+    """
+    results = {}
+    clients = {}
+    try:
+        for profile in profiles:
+            if not profile.is_configured():
+                print(f"⚠️ Account '{profile.name}' has no API credentials, skipping")
+                results[profile.name] = {'account': profile.name, 'error': 'API credentials not configured'}
+                continue
+            print(f"🔐 Connecting account '{profile.name}'...")
+            client = profile.create_client()
+            try:
+                await client.start(phone=profile.phone)
+            except Exception as e:
+                print(f"❌ Could not connect account '{profile.name}': {e}")
+                results[profile.name] = {'account': profile.name, 'error': str(e)}
+                continue
+            clients[profile.name] = client
+
+        async def run(profile):
+            print(f"\n👤 Exporting account '{profile.name}' → {profile.output_dir}")
+            try:
+                results[profile.name] = await export_account(profile, clients[profile.name], from_date,
+                                                             force_reexport, cancel_event, run_budget)
+            except Exception as e:
+                print(f"❌ Export of account '{profile.name}' failed: {e}")
+                results[profile.name] = {'account': profile.name, 'error': str(e)}
+
+        await asyncio.gather(*(run(profile) for profile in profiles if profile.name in clients))
+    finally:
+        for client in clients.values():
+            await client.disconnect()
+
+    print("\n" + "="*60)
+    print("ACCOUNT EXPORT SUMMARY")
+    print("="*60)
+    for name, result in results.items():
+        if result.get('error'):
+            print(f"  {name}: ❌ {result['error']}")
+        elif 'stats' in result:
+            print(f"  {name}: {result['stats']['exported']} exported, {result['stats']['failed']} failed")
+        else:
+            exported = sum(stats['exported'] for stats in result['chats'].values())
+            print(f"  {name}: {exported} exported in {len(result['chats'])} chat(s)")
+    return results
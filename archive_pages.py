@@ -0,0 +1,221 @@
+"""
+Paginated archive pages
+
+Besides one message.html per message folder, an export can be browsed as
+chat-style pages holding a month (ARCHIVE_PAGE_BY = 'month') or about
+ARCHIVE_PAGE_SIZE messages (ARCHIVE_PAGE_BY = 'count') each, with older/newer
+navigation and an index page. They live in the ``archive`` folder of the
+export.
+
+Every exported message stores its rendered bubble in the database, which
+marks its page as changed. After a run only the changed pages (and the
+neighbours whose navigation links moved) are written again, from the stored
+bubbles, so the cost follows the number of new messages and not the size of
+the history.
+"""
+
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+
+from database import (ARCHIVE_SUBDIR, store_archive_fragment, assign_archive_pages, get_archive_pages, get_archive_fragments,
+                      mark_archive_page_rendered, get_archive_layout, repaginate_archive,
+                      get_exported_without_fragment)
+from formatters import HTML_MINIFY, INLINE_STYLES, html_context, message_text, stylesheet_href
+from templates import get_template
+from layout import relative_folder
+from utils import write_atomic
+
+# Import configuration
+try:
+    from config import ARCHIVE_PAGES
+except ImportError:
+    ARCHIVE_PAGES = False
+
+try:
+    from config import ARCHIVE_PAGE_BY
+except ImportError:
+    ARCHIVE_PAGE_BY = 'month'
+
+try:
+    from config import ARCHIVE_PAGE_SIZE
+except ImportError:
+    ARCHIVE_PAGE_SIZE = 500
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
+VIDEO_EXTENSIONS = {'.mp4', '.webm', '.mov', '.m4v'}
+
+# Styles of the archive pages on top of the message styles
+ARCHIVE_CSS = (
+    ".archive-nav{display:flex;justify-content:space-between;padding:10px 20px;font-size:13px}"
+    ".archive-day{text-align:center;color:#8596a8;font-size:12px;margin:16px 0 4px}"
+    ".archive-page{display:flex;justify-content:space-between;padding:10px 20px;color:#ffffff;"
+    "text-decoration:none;border-bottom:1px solid #2f3c4c}"
+    ".archive-page:hover{background:#2b5278}"
+    ".message-image video{width:100%;display:block}"
+)
+
+
+def page_filename(page_key):
+    return f"{page_key}.html"
+
+
+def page_title(page):
+    """Heading of a page: the month, or the message ID range of a numbered page."""
+    if ARCHIVE_PAGE_BY == 'month':
+        return datetime.strptime(page['page_key'], '%Y-%m').strftime('%B %Y')
+    return f"Page {int(page['page_key'])} (messages {page['first_id']}-{page['last_id']})"
+
+
+def render_fragment(message, folder_name, media_filename=None, text=None, minify=None):
+    """Render the chat bubble of a message as it appears on its archive page.
+
+    Args:
+        message: Telegram message
+        folder_name: Message folder relative to the export directory (layout.relative_folder),
+            or None if the message has no folder (only bulk sinks enabled)
+        media_filename: Downloaded media file in that folder, or None
+        text: Result of formatters.message_text, if already rendered
+        minify: Drop indentation and line breaks (default HTML_MINIFY)
+    """
+    if minify is None:
+        minify = HTML_MINIFY
+    context = html_context(message, media_filename, text=text)
+    folder_href = f"../{quote(folder_name)}" if folder_name else None
+    extension = Path(media_filename).suffix.lower() if media_filename else ''
+    context.update({
+        'message_href': f"{folder_href}/message.html" if folder_href else None,
+        'media_href': f"{folder_href}/{quote(media_filename)}" if folder_href and media_filename else None,
+        'media_image': extension in IMAGE_EXTENSIONS,
+        'media_video': extension in VIDEO_EXTENSIONS,
+    })
+    return get_template('archive_message.html', minify)(context)
+
+
+def archive_entry(message, folder_name, media_filename=None, text=None):
+    """Arguments of database.store_archive_fragment for an exported message.
+
+    Returns:
+        Tuple (message_id, message_date, fragment, page_key)
+    """
+    fragment = render_fragment(message, folder_name, media_filename, text)
+    # Numbered pages are assigned in ID order by update_archive_pages
+    page_key = message.date.strftime('%Y-%m') if ARCHIVE_PAGE_BY == 'month' else None
+    return message.id, message.date.isoformat(), fragment, page_key
+
+
+def store_archive_message(db_path, message, folder_name, media_filename=None, text=None):
+    """Render and store the bubble of an exported message; its page is rewritten on the next update."""
+    store_archive_fragment(db_path, *archive_entry(message, folder_name, media_filename, text))
+
+
+def _group_by_day(fragments):
+    days = []
+    for _, message_date, fragment in fragments:
+        day = message_date[:10]
+        if not days or days[-1]['key'] != day:
+            days.append({'key': day, 'date': datetime.strptime(day, '%Y-%m-%d').strftime('%A, %d %B %Y'),
+                         'fragments': []})
+        days[-1]['fragments'].append(fragment)
+    return days
+
+
+def update_archive_pages(output_dir, db_path, chat_title="Saved Messages", minify=None):
+    """Write the archive pages that changed since the last update.
+
+    A page is written when messages were added to it or edited, when its
+    older or newer neighbour changed, or when its file is missing. The index
+    page is written whenever any page was.
+
+    Returns:
+        Dictionary with 'pages_written' and 'pages_total'
+    """
+    if minify is None:
+        minify = HTML_MINIFY
+    archive_dir = Path(output_dir) / ARCHIVE_SUBDIR
+    archive_dir.mkdir(parents=True, exist_ok=True)
+
+    layout = (ARCHIVE_PAGE_BY, ARCHIVE_PAGE_SIZE)
+    stored_layout = get_archive_layout(db_path)
+    if stored_layout != layout:
+        if stored_layout is not None:
+            print(f"📚 Archive pagination changed to {ARCHIVE_PAGE_BY}, regrouping the archive pages...")
+            for old_page in archive_dir.glob('*.html'):
+                old_page.unlink()
+        repaginate_archive(db_path, *layout)
+    elif ARCHIVE_PAGE_BY != 'month':
+        assign_archive_pages(db_path, ARCHIVE_PAGE_SIZE)
+
+    href = stylesheet_href(output_dir, archive_dir)
+    style = f'<link rel="stylesheet" href="{href}">' if href else INLINE_STYLES[minify]
+    render_page = get_template('archive_page.html', minify)
+    pages = get_archive_pages(db_path)
+    written = 0
+    for index, page in enumerate(pages):
+        prev_key = pages[index - 1]['page_key'] if index > 0 else None
+        next_key = pages[index + 1]['page_key'] if index + 1 < len(pages) else None
+        path = archive_dir / page_filename(page['page_key'])
+        if (page['version'] == page['rendered_version'] and (prev_key, next_key) == (page['prev_key'], page['next_key'])
+                and path.exists()):
+            continue
+
+        content = render_page({
+            'chat_title': chat_title,
+            'title': page_title(page),
+            'style': style,
+            'archive_css': ARCHIVE_CSS,
+            'prev_href': page_filename(prev_key) if prev_key else None,
+            'next_href': page_filename(next_key) if next_key else None,
+            'days': _group_by_day(get_archive_fragments(db_path, page['page_key'])),
+        })
+        write_atomic(path, content)
+        # Messages stored meanwhile raised the version again, so their page is written next time
+        mark_archive_page_rendered(db_path, page['page_key'], page['version'], prev_key, next_key)
+        written += 1
+
+    index_path = archive_dir / 'index.html'
+    if written or not index_path.exists():
+        write_atomic(index_path, get_template('archive_index.html', minify)({
+            'chat_title': chat_title,
+            'style': style,
+            'archive_css': ARCHIVE_CSS,
+            'message_count': sum(page['message_count'] for page in pages),
+            # Newest first, like the chat list in Telegram
+            'pages': [{'href': page_filename(page['page_key']), 'title': page_title(page),
+                       'message_count': page['message_count']} for page in reversed(pages)],
+        }))
+    return {'pages_written': written, 'pages_total': len(pages)}
+
+
+async def build_archive_pages(client, db_path, output_dir, chat_title="Saved Messages"):
+    """Add messages exported before ARCHIVE_PAGES was enabled to the archive pages.
+
+    The messages are fetched again by ID (100 per request); media is not
+    downloaded again, the pages link the files in the existing message
+    folders.
+
+    Returns:
+        Dictionary with 'added' and 'missing' counts plus the page update stats
+    """
+    from exporter import fetch_messages_by_ids
+
+    rows = get_exported_without_fragment(db_path)
+    print(f"📚 {len(rows)} exported message(s) are not on the archive pages yet")
+    entity = await client.get_entity('me')
+    added = missing = 0
+    for start in range(0, len(rows), 1000):
+        batch = rows[start:start + 1000]
+        fetched = await fetch_messages_by_ids(client, entity, [row[0] for row in batch])
+        for message_id, file_path, media_filename in batch:
+            message = fetched.get(message_id)
+            # Messages deleted in Telegram only keep their files
+            if message is None or not file_path:
+                missing += 1
+                continue
+            store_archive_message(db_path, message, relative_folder(file_path), media_filename,
+                                  message_text(message))
+            added += 1
+        print(f"  Added {added}/{len(rows)} message(s)...")
+    stats = update_archive_pages(output_dir, db_path, chat_title)
+    stats.update(added=added, missing=missing)
+    return stats
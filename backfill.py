@@ -0,0 +1,235 @@
+"""
+Multi-process backfill of the Saved Messages history
+"""
+
+import asyncio
+import multiprocessing
+import shutil
+import time
+from pathlib import Path
+
+# Import configuration
+try:
+    from config import API_ID, API_HASH, OUTPUT_DIR, SESSION_NAME
+except ImportError:
+    print("⚠️  ERROR: config.py file not found!")
+    exit(1)
+
+try:
+    from config import BACKFILL_WORKERS
+except ImportError:
+    BACKFILL_WORKERS = 4
+
+try:
+    from config import BACKFILL_SHARDS_PER_WORKER
+except ImportError:
+    BACKFILL_SHARDS_PER_WORKER = 4
+
+from database import (init_database, is_message_exported, create_backfill_shards, has_unfinished_backfill,
+                      claim_backfill_shard, get_backfill_shard_min_id, begin_backfill_batch, update_backfill_cursor,
+                      finish_backfill_shard, release_backfill_shards, get_backfill_progress,
+                      set_export_watermark, get_export_checkpoint, clear_export_checkpoint)
+
+# Messages fetched and exported per step of a worker
+BACKFILL_BATCH_SIZE = 100
+
+
+def plan_shards(newest_id, shard_count):
+    """Split message IDs 1..newest_id into contiguous (min_id, max_id) ranges."""
+    shard_count = max(1, min(shard_count, newest_id))
+    size = -(-newest_id // shard_count)
+    return [(start, min(start + size - 1, newest_id)) for start in range(1, newest_id + 1, size)]
+
+
+def session_copy_path(session_name, worker):
+    """Session file used by one worker process."""
+    return f"{session_name}_backfill_{worker}"
+
+
+def copy_session(session_name, workers):
+    """Give every worker its own copy of the logged-in session file.
+
+    Telethon keeps the session in SQLite, which cannot be shared by several
+    connected clients, so each worker connects with a copy of the same
+    authorization.
+    """
+    source = Path(f"{session_name}.session")
+    if not source.exists():
+        raise FileNotFoundError(f"Session file {source} not found - log in once with python main.py first")
+    copies = []
+    for worker in range(workers):
+        target = Path(f"{session_copy_path(session_name, worker)}.session")
+        shutil.copy2(source, target)
+        copies.append(target)
+    return copies
+
+
+async def backfill_shard(client, entity, db_path, output_path, shard, worker):
+    """Export one shard from its newest to its oldest message.
+
+    The lower bound is read again before every batch, because the
+    coordinator may hand the older half of this shard to an idle worker.
+    """
+    from telethon.tl.types import Message
+    from exporter import export_message_queue
+
+    cursor = shard['cursor']
+    while True:
+        min_id = get_backfill_shard_min_id(db_path, shard['shard_id'])
+        if min_id is None or cursor <= min_id:
+            break
+
+        batch = []
+        lowest = cursor
+        async for message in client.iter_messages(entity, max_id=cursor, min_id=min_id - 1,
+                                                  limit=BACKFILL_BATCH_SIZE):
+            lowest = min(lowest, message.id)
+            batch.append(message)
+        if not batch:
+            break
+
+        # Another worker may have taken IDs below min_id while this batch was fetched;
+        # from here on a split stays below the batch until its cursor is saved
+        min_id = begin_backfill_batch(db_path, shard['shard_id'], lowest)
+        if min_id is None:
+            break
+        messages = [message for message in batch
+                    if isinstance(message, Message) and message.id >= min_id
+                    and not is_message_exported(db_path, message.id)]
+        exported = 0
+        if messages:
+            stats = await export_message_queue(client, entity, messages, db_path, output_path)
+            exported = stats['exported']
+
+        cursor = max(lowest, min_id)
+        update_backfill_cursor(db_path, shard['shard_id'], cursor, exported)
+        print(f"[worker {worker}] shard {shard['shard_id']}: down to ID {cursor}, +{exported} exported")
+
+    finish_backfill_shard(db_path, shard['shard_id'])
+
+
+async def run_backfill_worker(worker, db_path, output_dir, session_name, api_id, api_hash):
+    """Connect with the worker's session copy and export shards until none are left."""
+    from telethon import TelegramClient
+
+    client = TelegramClient(session_copy_path(session_name, worker), api_id, api_hash)
+    await client.connect()
+    try:
+        if not await client.is_user_authorized():
+            raise RuntimeError("Session copy is not authorized")
+        entity = await client.get_entity('me')
+        output_path = Path(output_dir)
+        while True:
+            shard = claim_backfill_shard(db_path, worker)
+            if shard is None:
+                break
+            print(f"[worker {worker}] claimed shard {shard['shard_id']}: IDs {shard['min_id']}-{shard['cursor'] - 1}")
+            await backfill_shard(client, entity, db_path, output_path, shard, worker)
+    finally:
+        await client.disconnect()
+
+
+def _worker_main(worker, db_path, output_dir, session_name, api_id, api_hash):
+    """Entry point of a worker process."""
+    try:
+        asyncio.run(run_backfill_worker(worker, db_path, output_dir, session_name, api_id, api_hash))
+    except KeyboardInterrupt:
+        pass
+
+
+async def backfill_saved_messages(client, db_path, output_dir=None, workers=BACKFILL_WORKERS,
+                                  session_name=SESSION_NAME, api_id=API_ID, api_hash=API_HASH):
+    """Export the whole Saved Messages history with several worker processes.
+
+    The coordinator splits the ID space into shards stored in the
+    backfill_shards table and starts ``workers`` processes, each with its own
+    session copy and connection. Workers claim shards through the database;
+    when no shard is pending, an idle worker splits the busiest running
+    shard. A worker that dies returns its shards to the pool and is
+    restarted once. An interrupted backfill continues from the shard cursors
+    on the next run.
+
+    Args:
+        client: Connected TelegramClient (used for planning only)
+        db_path: Export database shared by all workers
+        output_dir: Output directory shared by all workers
+        workers: Number of worker processes
+        session_name, api_id, api_hash: Account the planning client is logged in with
+
+    Returns:
+        Backfill progress dictionary (see get_backfill_progress)
+    """
+    if output_dir is None:
+        output_dir = OUTPUT_DIR
+    db_path = str(init_database(output_dir)) if db_path is None else str(db_path)
+
+    if has_unfinished_backfill(db_path):
+        # Shards of a crashed run were still marked running
+        release_backfill_shards(db_path)
+        print("🔄 Resuming the unfinished backfill")
+    else:
+        latest = await client.get_messages('me', limit=1)
+        if not latest:
+            print("Saved Messages is empty, nothing to backfill")
+            return get_backfill_progress(db_path)
+        newest_id = latest[0].id
+        ranges = plan_shards(newest_id, workers * BACKFILL_SHARDS_PER_WORKER)
+        create_backfill_shards(db_path, ranges)
+        print(f"📋 Planned {len(ranges)} shards over message IDs 1-{newest_id}")
+
+    # The planning client must release the session file before it is copied
+    await client.disconnect()
+    copy_session(session_name, workers)
+    worker_args = (db_path, str(output_dir), session_name, api_id, api_hash)
+
+    print(f"🚀 Starting {workers} backfill worker process(es)")
+    processes = {}
+    restarted = set()
+    for worker in range(workers):
+        process = multiprocessing.Process(target=_worker_main, args=(worker, *worker_args))
+        process.start()
+        processes[worker] = process
+
+    started = time.time()
+    try:
+        while processes:
+            await asyncio.sleep(5)
+            for worker, process in list(processes.items()):
+                if process.is_alive():
+                    continue
+                del processes[worker]
+                if process.exitcode != 0:
+                    print(f"\n⚠️ Backfill worker {worker} exited with code {process.exitcode}")
+                    release_backfill_shards(db_path, worker)
+                    if worker not in restarted:
+                        restarted.add(worker)
+                        process = multiprocessing.Process(target=_worker_main, args=(worker, *worker_args))
+                        process.start()
+                        processes[worker] = process
+
+            progress = get_backfill_progress(db_path)
+            elapsed = time.time() - started
+            print(f"\n*** Backfill: {progress['done']}/{progress['shards']} shards done, "
+                  f"{progress['running']} running, {progress['exported']} exported, "
+                  f"{progress['remaining_ids']} IDs left | {elapsed/60:.1f}min ***\n")
+    finally:
+        for process in processes.values():
+            process.terminate()
+            process.join()
+        # Running shards of terminated workers are picked up by the next run
+        release_backfill_shards(db_path)
+        for worker in range(workers):
+            Path(f"{session_copy_path(session_name, worker)}.session").unlink(missing_ok=True)
+
+    progress = get_backfill_progress(db_path)
+    if progress['done'] == progress['shards']:
+        # The whole history up to the planned newest ID is scanned, so normal runs only fetch newer
+        # messages (failed ones sit in the retry queue)
+        set_export_watermark(db_path, progress['high_water'])
+        checkpoint = get_export_checkpoint(db_path)
+        if checkpoint and checkpoint['high_water'] <= progress['high_water']:
+            clear_export_checkpoint(db_path)
+        print(f"\n✓ Backfill complete: {progress['exported']} messages exported")
+    else:
+        print(f"\n⚠️ Backfill stopped with {progress['shards'] - progress['done']} shard(s) left - run --backfill again to continue")
+    return progress
@@ -0,0 +1,189 @@
+"""
+Pipelined export → Google Drive backup → local eviction under a disk budget
+"""
+
+import asyncio
+from pathlib import Path
+
+from utils import folder_size
+from page_store import page_store_path, changed_since_backup
+from progress import format_size
+
+
+class DiskBudget:
+    """Local disk space allowed for exported folders that are not uploaded yet.
+
+    Downloads call ``reserve()`` with the expected media size and wait while
+    the working set (finished folders waiting for upload plus reservations
+    of running downloads) would exceed the limit. Reservations are replaced
+    by the real folder size once a message is written, and space is given
+    back when the backup stage evicts the folder.
+
+    A reservation that alone is larger than the limit is still granted once
+    nothing else is held, so a single huge file cannot block the export
+    forever. Archives created by the backup stage are charged without
+    waiting, because uploading is what frees space.
+    """
+
+    def __init__(self, limit_bytes, used_bytes=0):
+        self.limit = limit_bytes
+        self.used = used_bytes
+        self.peak = used_bytes
+        self.waits = 0
+        self._reservations = {}
+        self._condition = asyncio.Condition()
+
+    def _fits(self, size):
+        return self.used + size <= self.limit or self.used == 0
+
+    async def reserve(self, key, size):
+        """Wait until ``size`` bytes fit into the budget and hold them for ``key``."""
+        async with self._condition:
+            if not self._fits(size):
+                self.waits += 1
+                print(f"\n⏸️ Disk budget full ({format_size(self.used)}/{format_size(self.limit)}), "
+                      f"waiting for uploads before downloading {format_size(size)}...")
+                await self._condition.wait_for(lambda: self._fits(size))
+            self._reservations[key] = self._reservations.get(key, 0) + size
+            self._add(size)
+
+    async def commit(self, key, actual_size):
+        """Replace the reservation of ``key`` with the size actually written."""
+        async with self._condition:
+            self._add(actual_size - self._reservations.pop(key, 0))
+            self._condition.notify_all()
+
+    async def cancel(self, key):
+        """Drop the reservation of a download that produced nothing."""
+        await self.commit(key, 0)
+
+    async def charge(self, size):
+        """Account space without waiting (e.g. a temporary archive)."""
+        async with self._condition:
+            self._add(size)
+
+    async def free(self, size):
+        """Give back space after a folder or archive was deleted."""
+        async with self._condition:
+            self.used = max(self.used - size, 0)
+            self._condition.notify_all()
+
+    def _add(self, size):
+        self.used = max(self.used + size, 0)
+        self.peak = max(self.peak, self.used)
+
+    def snapshot(self):
+        """Current budget state for progress output and the run report."""
+        return {'limit': self.limit, 'used': self.used, 'peak': self.peak, 'waits': self.waits}
+
+
+class BackupPipeline:
+    """Back up message folders while the export is still running.
+
+    Finished folders are queued by the exporter and handed, one at a time,
+    to ``GoogleDriveBackup.backup_folder`` on a worker thread. After a
+    confirmed upload the folder and its archive are deleted and their space
+    is returned to the disk budget, which lets paused downloads continue.
+
+    With a ``run_budget`` folders queued after it is used up stay on disk for
+    the next run; their space is released so no download waits for them.
+    """
+
+    def __init__(self, backup_handler, db_path, budget, run_budget=None):
+        self.backup_handler = backup_handler
+        self.db_path = db_path
+        self.budget = budget
+        self.run_budget = run_budget
+        self.queue = asyncio.Queue()
+        self.stats = {'success': 0, 'failed': 0, 'skipped': 0}
+        self._task = None
+
+    def start(self, pending_folders=()):
+        """Start the upload worker, first queueing folders left from earlier runs."""
+        for folder in pending_folders:
+            self.queue.put_nowait(Path(folder))
+        self._task = asyncio.ensure_future(self._run())
+
+    def submit(self, folder):
+        """Queue a finished message folder for upload (exporter callback)."""
+        self.queue.put_nowait(Path(folder))
+
+    async def _run(self):
+        while True:
+            folder = await self.queue.get()
+            if folder is None:
+                break
+            if not folder.is_dir():
+                continue
+            size = folder_size(folder)
+            if self.run_budget is not None and self.run_budget.should_stop(size):
+                self.stats['skipped'] += 1
+                self.stats['stopped'] = self.run_budget.reason
+                print(f"\n⏸️ {folder.name} left for the next run ({self.run_budget.reason})")
+                await self.budget.free(size)
+                continue
+            print(f"\n📤 Backing up {folder.name} ({format_size(size)}, "
+                  f"{self.queue.qsize()} more waiting)")
+            # The archive needs about as much space again until it is deleted
+            await self.budget.charge(size)
+            result = await asyncio.to_thread(self.backup_handler.backup_folder, folder, self.db_path, True)
+            self.stats[result if result != 'cancelled' else 'skipped'] += 1
+            if self.run_budget is not None and result == 'success':
+                self.run_budget.add_bytes(size)
+            if result != 'success':
+                # Keeping a failed folder inside the budget could stall the export for good
+                print(f"  ⚠️ {folder.name} stays on disk outside the disk budget (retry with --backup-only)")
+            await self.budget.free(size * 2)
+
+    async def finish(self):
+        """Wait until every queued folder has been processed.
+
+        Returns:
+            Backup statistics like backup_individual_folders
+        """
+        if self._task is not None:
+            await self.queue.put(None)
+            await self._task
+        self.stats['stalls'] = self.backup_handler.watchdog.stats['stalls']
+        self.stats['disk_budget'] = self.budget.snapshot()
+        export_dir = Path(self.db_path).parent
+        pages_changed = changed_since_backup(page_store_path(export_dir))
+        if self.stats['success'] > 0 or pages_changed:
+            await asyncio.to_thread(self.backup_handler.upload_stylesheets, export_dir, self.db_path)
+            if pages_changed:
+                self.stats['page_store_backed_up'] = bool(
+                    await asyncio.to_thread(self.backup_handler.upload_page_store, export_dir))
+            print("\n📊 Backing up database file...")
+            self.stats['database_backed_up'] = bool(
+                await asyncio.to_thread(self.backup_handler.upload_database_file, self.db_path))
+        return self.stats
+
+
+async def export_with_pipelined_backup(client, db_path, output_dir, backup_handler, budget_bytes,
+                                       from_date=None, force_reexport=False, cancel_event=None, run_budget=None):
+    """Export Saved Messages while backing up and evicting finished folders.
+
+    Folders left over from earlier runs count against the budget and are
+    uploaded first. ``run_budget`` limits export and uploads together.
+
+    Returns:
+        Tuple (export stats, backup stats)
+    """
+    from database import get_folders_to_backup
+    from exporter import export_saved_messages
+
+    pending = get_folders_to_backup(db_path, output_dir) if Path(output_dir).exists() else []
+    budget = DiskBudget(budget_bytes, used_bytes=sum(folder_size(folder) for folder in pending))
+    print(f"💾 Disk budget: {format_size(budget.limit)} "
+          f"({format_size(budget.used)} used by {len(pending)} folder(s) not backed up yet)")
+
+    pipeline = BackupPipeline(backup_handler, db_path, budget, run_budget)
+    pipeline.start(pending)
+    try:
+        export_stats = await export_saved_messages(client, db_path, from_date=from_date,
+                                                   force_reexport=force_reexport, output_dir=output_dir,
+                                                   cancel_event=cancel_event, budget=budget,
+                                                   on_exported=pipeline.submit, run_budget=run_budget)
+    finally:
+        backup_stats = await pipeline.finish()
+    return export_stats, backup_stats
@@ -0,0 +1,152 @@
+"""
+Synthetic Saved Messages for the benchmarks
+
+Builds lightweight stand-ins for Telethon messages with the attributes the
+formatters read, so benchmarks run without a Telegram account or Telethon.
+The mix is deterministic for a given seed.
+"""
+
+import random
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+# Benchmarks import the project modules from the repository root
+REPO_DIR = Path(__file__).resolve().parent.parent
+if str(REPO_DIR) not in sys.path:
+    sys.path.insert(0, str(REPO_DIR))
+
+WORDS = ("the quick brown fox jumps over lazy dog export message saved note link photo "
+         "video draft idea meeting tomorrow remember check later read article project").split()
+
+# Share of message kinds in the generated history
+KIND_WEIGHTS = {'text': 0.55, 'media': 0.30, 'forwarded': 0.15}
+
+
+class MessageMediaPhoto:
+    """Stand-in for a photo; formatters only use the type name."""
+
+
+class MessageMediaDocument:
+    """Stand-in for a document or video."""
+
+
+class MessageEntity:
+    """Stand-in for a Telethon entity; the renderer reads the class name."""
+
+    def __init__(self, offset, length):
+        self.offset = offset
+        self.length = length
+
+
+class MessageEntityBold(MessageEntity):
+    pass
+
+
+class MessageEntityCode(MessageEntity):
+    pass
+
+
+class MessageEntityUrl(MessageEntity):
+    pass
+
+
+class PeerChannel:
+    def __init__(self, channel_id):
+        self.channel_id = channel_id
+
+
+class Forward:
+    def __init__(self, from_name, date, channel_id=None, channel_post=None):
+        self.from_name = from_name
+        self.date = date
+        self.from_id = PeerChannel(channel_id) if channel_id else None
+        self.channel_post = channel_post
+
+
+class SyntheticMessage:
+    """Message with the fields read by formatters and exporter helpers."""
+
+    def __init__(self, message_id, date, text, media=None, forward=None, entities=None):
+        self.id = message_id
+        self.date = date
+        self.text = text
+        self.message = text
+        self.raw_text = text
+        self.entities = entities or []
+        self.media = media
+        self.forward = forward
+        self.web_preview = None
+        self.file = None
+
+
+def random_text(rng, min_words=3, max_words=60):
+    """Text with some bold, code and a link, like typical notes.
+
+    Returns:
+        Tuple (plain text, entities)
+    """
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    styles = {}
+    if rng.random() < 0.3:
+        styles[rng.randrange(len(words))] = MessageEntityBold
+    if rng.random() < 0.2:
+        styles[rng.randrange(len(words))] = MessageEntityCode
+    if rng.random() < 0.3:
+        words.append(f"https://example.com/{rng.choice(WORDS)}/{rng.randint(1, 99999)}")
+        styles[len(words) - 1] = MessageEntityUrl
+    entities, offset = [], 0
+    for position, word in enumerate(words):
+        if position in styles:
+            entities.append(styles[position](offset, len(word)))
+        offset += len(word) + 1
+    return ' '.join(words), entities
+
+
+def make_message(kind, message_id, rng, start=datetime(2020, 1, 1, tzinfo=timezone.utc)):
+    """Build one message of the given kind ('text', 'media', 'forwarded' or 'long')."""
+    date = start + timedelta(minutes=message_id * 7)
+    if kind == 'media':
+        media = rng.choice((MessageMediaPhoto, MessageMediaDocument))()
+        text, entities = random_text(rng, 1, 12) if rng.random() < 0.5 else ('', [])
+        return SyntheticMessage(message_id, date, text, media=media, entities=entities)
+    if kind == 'forwarded':
+        forward = Forward(f"Channel {rng.randint(1, 50)}", date - timedelta(days=1),
+                          channel_id=rng.randint(10 ** 9, 2 * 10 ** 9), channel_post=rng.randint(1, 50000))
+        text, entities = random_text(rng)
+        return SyntheticMessage(message_id, date, text, forward=forward, entities=entities)
+    if kind == 'long':
+        # An article pasted into Saved Messages: many paragraphs, each with some formatting
+        text, entities = '', []
+        for _ in range(30):
+            paragraph, paragraph_entities = random_text(rng, 40, 80)
+            for entity in paragraph_entities:
+                entity.offset += len(text)
+            text += paragraph + '\n\n'
+            entities.extend(paragraph_entities)
+        return SyntheticMessage(message_id, date, text.rstrip(), entities=entities)
+    text, entities = random_text(rng)
+    return SyntheticMessage(message_id, date, text, entities=entities)
+
+
+def synthetic_messages(count, seed=42, kinds=None):
+    """Generate ``count`` messages with IDs 1..count.
+
+    Args:
+        count: Number of messages
+        seed: Random seed, the same seed gives the same history
+        kinds: Optional single kind for every message instead of the mix
+
+    Returns:
+        List of (message, media_filename) tuples; media messages get a
+        downloaded file name like the exporter passes to the formatters
+    """
+    rng = random.Random(seed)
+    names, weights = zip(*KIND_WEIGHTS.items())
+    messages = []
+    for message_id in range(1, count + 1):
+        kind = kinds or rng.choices(names, weights)[0]
+        message = make_message(kind, message_id, rng)
+        media_filename = f"media_{message_id}.jpg" if message.media is not None else None
+        messages.append((message, media_filename))
+    return messages
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Size of the HTML output per style mode over a synthetic export
+
+Renders a synthetic history with every combination of HTML_STYLE_MODE and
+HTML_MINIFY and reports what ends up on disk and, deflated like the
+per-folder zip archives, what is uploaded to Google Drive.
+
+Usage:
+    python benchmarks/html_size.py
+    python benchmarks/html_size.py --count 10000
+"""
+
+import argparse
+import asyncio
+import time
+import zlib
+
+from _synthetic import synthetic_messages
+
+from formatters import MESSAGE_CSS, MESSAGE_CSS_MINIFIED, STYLESHEET_NAME, message_to_html_with_media
+from progress import format_size
+
+# (label, shared stylesheet, minify)
+MODES = [
+    ('inline', False, False),
+    ('inline + minify', False, True),
+    ('shared', True, False),
+    ('shared + minify', True, True),
+]
+
+
+async def measure_mode(messages, shared, minify):
+    """Render every message once.
+
+    Returns:
+        Tuple (raw bytes, deflated bytes, seconds), including the stylesheet
+        file in shared mode
+    """
+    href = f"../{STYLESHEET_NAME}" if shared else None
+    raw = deflated = 0
+    started = time.perf_counter()
+    for message, media_filename in messages:
+        page = (await message_to_html_with_media(message, media_filename, "Saved Messages", href, minify)).encode('utf-8')
+        raw += len(page)
+        # Each message folder is its own zip archive, so pages are deflated one by one
+        deflated += len(zlib.compress(page, 6))
+    seconds = time.perf_counter() - started
+    if shared:
+        stylesheet = (MESSAGE_CSS_MINIFIED if minify else MESSAGE_CSS + "\n").encode('utf-8')
+        raw += len(stylesheet)
+        deflated += len(zlib.compress(stylesheet, 6))
+    return raw, deflated, seconds
+
+
+async def run(count, seed):
+    messages = synthetic_messages(count, seed)
+    print(f"Rendering {count} synthetic messages per mode...\n")
+    print(f"{'mode':<18}{'on disk':>12}{'per page':>11}{'deflated':>12}{'vs inline':>11}{'render':>9}")
+    baseline = None
+    for label, shared, minify in MODES:
+        raw, deflated, seconds = await measure_mode(messages, shared, minify)
+        baseline = baseline or raw
+        print(f"{label:<18}{format_size(raw):>12}{raw / count:>9.0f} B{format_size(deflated):>12}"
+              f"{raw / baseline - 1:>+10.0%}{seconds:>8.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare HTML output size of the style modes')
+    parser.add_argument('--count', type=int, default=100000, help='Synthetic messages (default: 100000)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the synthetic history')
+    args = parser.parse_args()
+    asyncio.run(run(args.count, args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Cold-start import cost of the entry points
+
+Runs every entry point in a fresh interpreter with ``python -X importtime``
+and reports the wall time of the process and the cumulative import time of
+its top-level imports. Results can be saved as a baseline and later runs
+compared against it, so a heavy import that sneaks back onto the --stats
+path is caught.
+
+Usage:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --runs 10 --json baseline.json
+    python benchmarks/import_time.py --baseline baseline.json --max-regression 0.25
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+
+def entry_points(output_dir):
+    """Name and command line (without the interpreter) of every measured entry point."""
+    return {
+        'main.py --stats': [str(REPO_DIR / 'main.py'), '--stats', '--output', str(output_dir)],
+        # Importing is what an ASGI host or a health check pays; serving needs uvicorn on top
+        'web_server.py': ['-c', 'import web_server'],
+        'gui_visual.py': ['-c', 'import gui_visual'],
+    }
+
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output.
+
+    Returns:
+        Dictionary mapping each top-level import to its cumulative time in
+        microseconds
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        name = parts[2].rstrip()
+        # Nested imports are indented below the module that imported them
+        if len(name) - len(name.lstrip()) > 1:
+            continue
+        modules[name.strip()] = modules.get(name.strip(), 0) + int(parts[1])
+    return modules
+
+
+def measure(args, cwd):
+    """Run one entry point once.
+
+    Returns:
+        Tuple (wall seconds, import seconds, top-level modules, return code)
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(REPO_DIR), os.environ.get('PYTHONPATH')])))
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', *args], cwd=cwd, env=env,
+                            stdin=subprocess.DEVNULL, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    modules = parse_importtime(result.stderr)
+    return wall, sum(modules.values()) / 1e6, modules, result.returncode
+
+
+def run_benchmark(runs, top):
+    """Measure every entry point ``runs`` times and print a report."""
+    results = {}
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, args in entry_points(Path(cwd) / 'output').items():
+            walls, imports, heaviest, failed = [], [], {}, False
+            for _ in range(runs):
+                wall, import_seconds, modules, returncode = measure(args, cwd)
+                # A crashed import would look fast, so it is reported instead of measured
+                if returncode != 0:
+                    failed = True
+                    break
+                walls.append(wall)
+                imports.append(import_seconds)
+                for module, micros in modules.items():
+                    heaviest[module] = max(heaviest.get(module, 0), micros)
+            if failed:
+                print(f"❌ {name}: failed to start (missing dependency or config.py?)")
+                results[name] = {'error': 'failed to start'}
+                continue
+
+            results[name] = {
+                'wall_median': statistics.median(walls),
+                'wall_min': min(walls),
+                'import_median': statistics.median(imports),
+                'heaviest': sorted(heaviest.items(), key=lambda item: -item[1])[:top]
+            }
+            report = results[name]
+            print(f"\n{name}")
+            print(f"  wall: median {report['wall_median'] * 1000:.0f} ms, min {report['wall_min'] * 1000:.0f} ms "
+                  f"({runs} runs)")
+            print(f"  imports: median {report['import_median'] * 1000:.0f} ms")
+            for module, micros in report['heaviest']:
+                print(f"    {micros / 1000:8.1f} ms  {module}")
+    return results
+
+
+def compare(results, baseline, max_regression):
+    """Compare median import times with a saved baseline.
+
+    Returns:
+        List of entry point names that got slower than allowed
+    """
+    regressions = []
+    print("\n" + "=" * 60)
+    print(f"COMPARISON WITH BASELINE (allowed regression {max_regression:.0%})")
+    print("=" * 60)
+    for name, report in results.items():
+        before = baseline.get(name, {}).get('import_median')
+        if before is None or 'import_median' not in report:
+            continue
+        change = (report['import_median'] - before) / before if before else 0.0
+        status = "✓"
+        if change > max_regression:
+            status = "❌"
+            regressions.append(name)
+        print(f"  {status} {name}: {before * 1000:.0f} ms → {report['import_median'] * 1000:.0f} ms ({change:+.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure cold-start import time of the entry points')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per entry point (default: 5)')
+    parser.add_argument('--top', type=int, default=8, help='Heaviest top-level imports to list (default: 8)')
+    parser.add_argument('--json', type=str, help='Write the results to this file (e.g. as a new baseline)')
+    parser.add_argument('--baseline', type=str, help='Compare with results written earlier by --json')
+    parser.add_argument('--max-regression', type=float, default=0.25,
+                        help='Fail when an import time grows by more than this fraction (default: 0.25)')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.runs, args.top)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding='utf-8')
+        print(f"\n💾 Results written to {args.json}")
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding='utf-8'))
+        if compare(results, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
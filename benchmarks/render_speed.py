@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Message page rendering throughput
+
+Renders synthetic text-only, media, forwarded and long (article-sized)
+messages to HTML and Markdown and reports messages per second for each kind
+(best of several rounds, so a busy machine affects the result less).
+
+Usage:
+    python benchmarks/render_speed.py
+    python benchmarks/render_speed.py --count 20000 --rounds 5
+"""
+
+import argparse
+import asyncio
+import time
+
+from _synthetic import synthetic_messages
+
+from formatters import message_to_html_with_media, message_to_markdown
+
+KINDS = ('text', 'media', 'forwarded', 'long')
+# Long messages are ~100x the size of the others, so fewer of them are rendered
+COUNT_DIVISOR = {'long': 50}
+
+
+async def render_html(messages):
+    for message, media_filename in messages:
+        await message_to_html_with_media(message, media_filename, "Saved Messages")
+
+
+async def render_markdown(messages):
+    for message, _ in messages:
+        message_to_markdown(message)
+
+
+async def best_rate(render, messages, rounds):
+    """Messages per second of the fastest round."""
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        await render(messages)
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return len(messages) / best
+
+
+async def run(count, rounds, seed):
+    print(f"{count} messages per kind, best of {rounds} rounds\n")
+    print(f"{'kind':<12}{'HTML msg/s':>14}{'Markdown msg/s':>18}")
+    for kind in KINDS:
+        messages = synthetic_messages(max(1, count // COUNT_DIVISOR.get(kind, 1)), seed, kinds=kind)
+        html_rate = await best_rate(render_html, messages, rounds)
+        markdown_rate = await best_rate(render_markdown, messages, rounds)
+        print(f"{kind:<12}{html_rate:>14,.0f}{markdown_rate:>18,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure message rendering throughput')
+    parser.add_argument('--count', type=int, default=10000, help='Messages per kind (default: 10000)')
+    parser.add_argument('--rounds', type=int, default=3, help='Rounds per measurement (default: 3)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the synthetic messages')
+    args = parser.parse_args()
+    asyncio.run(run(args.count, args.rounds, args.seed))
+
+
+if __name__ == '__main__':
+    main()
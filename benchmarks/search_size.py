@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Build time and size of the offline search index over a synthetic export
+
+Fills a temporary database with a synthetic history, builds the static
+search index from it, then reports the size of the index files, how many
+bytes typical queries make the search page load, and the cost of an
+incremental update after a small run.
+
+Usage:
+    python benchmarks/search_size.py
+    python benchmarks/search_size.py --count 10000
+"""
+
+import argparse
+import random
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from _synthetic import make_message, synthetic_messages
+
+from database import init_database, get_search_shard
+from progress import format_size
+from search_index import DOC_BUCKET_SIZE, update_search_index, search_terms, shard_filename
+
+QUERIES = ['meeting', 'quick brown', 'proj', 'https', 'saved note tomorrow']
+# Results the search page shows, and so the result details it loads
+SHOWN_RESULTS = 100
+
+
+def store_messages(db_path, messages):
+    """Record messages as exported, like the exporter does after writing their folders."""
+    conn = sqlite3.connect(db_path)
+    conn.executemany('''
+        INSERT OR REPLACE INTO exported_messages
+        (message_id, message_date, message_text, has_media, media_filename, file_path, hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [(message.id, message.date.isoformat(), message.text, message.media is not None, media_filename,
+           f"/export/msg{message.id}/message.html", str(message.id)) for message, media_filename in messages])
+    conn.commit()
+    conn.close()
+
+
+def query_cost(search_dir, db_path, query):
+    """Bytes the search page loads for a query, and the number of matches."""
+    loaded, matches = 0, None
+    for term in search_terms(query):
+        shard = term[:2]
+        path = search_dir / 'terms' / shard_filename(shard)
+        loaded += path.stat().st_size if path.exists() else 0
+        ids = {message_id for indexed, message_ids in get_search_shard(db_path, shard).items()
+               if indexed.startswith(term) for message_id in message_ids}
+        matches = ids if matches is None else matches & ids
+    matches = sorted(matches or (), reverse=True)
+    for bucket in {message_id // DOC_BUCKET_SIZE for message_id in matches[:SHOWN_RESULTS]}:
+        loaded += (search_dir / 'docs' / f"{bucket}.js").stat().st_size
+    return loaded, len(matches)
+
+
+def run(count, seed):
+    with tempfile.TemporaryDirectory(prefix='search-bench-') as temp_dir:
+        measure(Path(temp_dir), count, seed)
+
+
+def measure(output_dir, count, seed):
+    db_path = init_database(str(output_dir))
+    store_messages(db_path, synthetic_messages(count, seed))
+    search_dir = output_dir / 'search'
+
+    print(f"Indexing {count} synthetic messages...\n")
+    started = time.perf_counter()
+    stats = update_search_index(output_dir, db_path)
+    seconds = time.perf_counter() - started
+    shards = sorted((path.stat().st_size, path.name) for path in (search_dir / 'terms').iterdir())
+    docs_size = sum(path.stat().st_size for path in (search_dir / 'docs').iterdir())
+    print(f"Full build:        {seconds:.1f}s ({count / seconds:,.0f} msg/s)")
+    print(f"Term shards:       {len(shards)} files, {format_size(sum(size for size, _ in shards))}, "
+          f"largest {format_size(shards[-1][0])} ({shards[-1][1]})")
+    print(f"Result details:    {stats['docs_written']} files, {format_size(docs_size)}\n")
+
+    print(f"{'query':<24}{'matches':>9}{'loaded':>12}")
+    for query in QUERIES:
+        loaded, matches = query_cost(search_dir, db_path, query)
+        print(f"{query:<24}{matches:>9}{format_size(loaded):>12}")
+
+    rng = random.Random(seed)
+    store_messages(db_path, [(make_message('text', count + offset, rng), None) for offset in range(1, 101)])
+    started = time.perf_counter()
+    stats = update_search_index(output_dir, db_path)
+    seconds = time.perf_counter() - started
+    print(f"\nIncremental update (100 new messages): {seconds:.2f}s, "
+          f"{stats['shards_written']} shard(s) and {stats['docs_written']} result file(s) written")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the offline search index')
+    parser.add_argument('--count', type=int, default=100000, help='Synthetic messages (default: 100000)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the synthetic history')
+    args = parser.parse_args()
+    run(args.count, args.seed)
+
+
+if __name__ == '__main__':
+    main()
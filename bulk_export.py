@@ -0,0 +1,187 @@
+"""
+Output sinks and the bulk NDJSON/CSV export
+
+OUTPUT_SINKS (config.py) or ``--sinks`` select what the exporter writes for
+every message:
+
+- ``html``: message.html in the message folder
+- ``markdown``: message.md in the message folder
+- ``ndjson``: one JSON line appended to ``messages.ndjson`` at the export root
+- ``csv``: one row appended to ``messages.csv`` at the export root
+
+The bulk files let analytics jobs read the whole archive sequentially
+instead of opening one file per message. Lines are appended as messages are
+exported, so each run adds only its own messages. A message exported again
+(--force, an edit seen by --watch) is appended again: the last line of an ID
+wins. ``main.py --rebuild-sinks`` writes both files from the message cache.
+
+Every record has the same fields (RECORD_FIELDS). Entity offsets and lengths
+count UTF-16 code units, as in the Telegram API.
+"""
+
+import csv
+import io
+import json
+import os
+import re
+from pathlib import Path
+
+from database import get_cached_messages, get_message_cache_stats
+from message_cache import message_data, load_data
+from layout import relative_folder
+
+SINKS = ('html', 'markdown', 'ndjson', 'csv')
+
+# Import configuration
+try:
+    from config import OUTPUT_SINKS
+except ImportError:
+    OUTPUT_SINKS = ('html', 'markdown')
+
+NDJSON_FILENAME = 'messages.ndjson'
+CSV_FILENAME = 'messages.csv'
+
+RECORD_FIELDS = ('id', 'date', 'text', 'entities', 'media_type', 'media_path', 'forward')
+# Nested fields are flattened in the CSV; entities stay JSON
+CSV_FIELDS = ('id', 'date', 'text', 'entities', 'media_type', 'media_path', 'forward_from', 'forward_date',
+              'forward_channel_id', 'forward_channel_post')
+
+ENTITY_PREFIX_RE = re.compile(r'^(Input)?MessageEntity')
+MEDIA_PREFIX_RE = re.compile(r'^MessageMedia')
+CAMEL_RE = re.compile(r'(?<!^)(?=[A-Z])')
+
+
+def parse_sinks(value):
+    """Parse "html,ndjson" (or a list) into a tuple of sink names.
+
+    Raises:
+        ValueError: For an unknown sink
+    """
+    names = value.split(',') if isinstance(value, str) else value
+    sinks = tuple(dict.fromkeys(name.strip().lower() for name in names if name.strip()))
+    unknown = [name for name in sinks if name not in SINKS]
+    if unknown:
+        raise ValueError(f"Unknown output sink(s): {', '.join(unknown)} (choose from {', '.join(SINKS)})")
+    return sinks
+
+
+def sink_enabled(name):
+    return name in OUTPUT_SINKS
+
+
+def _type_name(telethon_name, prefix_re):
+    """'MessageEntityTextUrl' -> 'text_url', 'MessageMediaPhoto' -> 'photo'."""
+    return CAMEL_RE.sub('_', prefix_re.sub('', telethon_name)).lower()
+
+
+def message_record(data, media_path=None):
+    """Bulk export record of a message.
+
+    Args:
+        data: message_cache.message_data of the message
+        media_path: Downloaded media relative to the export root, or None
+    """
+    forward = data.get('forward')
+    return {
+        'id': data['id'],
+        'date': data['date'],
+        'text': data.get('message') or '',
+        'entities': [dict(type=_type_name(name, ENTITY_PREFIX_RE), offset=offset, length=length, **extra)
+                     for name, offset, length, extra in data.get('entities', ())],
+        'media_type': _type_name(data['media']['type'], MEDIA_PREFIX_RE) if data.get('media') else None,
+        'media_path': media_path,
+        'forward': dict(forward) if forward else None,
+    }
+
+
+def ndjson_line(record):
+    return json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+def csv_row(record):
+    forward = record['forward'] or {}
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow([
+        record['id'], record['date'], record['text'],
+        json.dumps(record['entities'], ensure_ascii=False, separators=(',', ':')) if record['entities'] else '',
+        record['media_type'] or '', record['media_path'] or '',
+        forward.get('from_name') or '', forward.get('date') or '',
+        forward.get('channel_id') or '', forward.get('channel_post') or '',
+    ])
+    return buffer.getvalue()
+
+
+def csv_header():
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerow(CSV_FIELDS)
+    return buffer.getvalue()
+
+
+def _append(path, text, header=None):
+    """Append text with a single write, so lines of concurrent writers (backfill workers) never interleave."""
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if header and os.fstat(fd).st_size == 0:
+            text = header + text
+        os.write(fd, text.encode('utf-8'))
+    finally:
+        os.close(fd)
+
+
+def _media_path(folder_name, media_filename):
+    return f"{folder_name}/{media_filename}" if folder_name and media_filename else None
+
+
+def append_message(output_dir, message, folder_name, media_filename=None):
+    """Append an exported message to the enabled bulk files (ndjson, csv).
+
+    ``folder_name`` is the message folder relative to the export directory
+    (layout.relative_folder).
+    """
+    if not (sink_enabled('ndjson') or sink_enabled('csv')):
+        return
+    record = message_record(message_data(message), _media_path(folder_name, media_filename))
+    if sink_enabled('ndjson'):
+        _append(Path(output_dir) / NDJSON_FILENAME, ndjson_line(record))
+    if sink_enabled('csv'):
+        _append(Path(output_dir) / CSV_FILENAME, csv_row(record), csv_header())
+
+
+def rebuild_bulk_files(output_dir, db_path, sinks=None):
+    """Write the bulk files of an export again from the message cache, newest first.
+
+    Each file is written next to the old one and swapped in at the end.
+
+    Returns:
+        Dictionary with 'written' (messages), 'uncached' (exported before the
+        message cache existed, so missing from the files) and 'files' (paths written)
+    """
+    sinks = [sink for sink in (sinks or OUTPUT_SINKS) if sink in ('ndjson', 'csv')]
+    paths = {'ndjson': Path(output_dir) / NDJSON_FILENAME, 'csv': Path(output_dir) / CSV_FILENAME}
+    files = {sink: open(paths[sink].with_name(paths[sink].name + '.tmp'), 'w', encoding='utf-8', newline='')
+             for sink in sinks}
+    written = 0
+    try:
+        if 'csv' in files:
+            files['csv'].write(csv_header())
+        before_id = None
+        while files:
+            rows = get_cached_messages(db_path, before_id, 1000)
+            if not rows:
+                break
+            before_id = rows[-1][0]
+            for message_id, chat_title, data, media_filename, file_path, _ in rows:
+                folder_name = relative_folder(file_path) if file_path else None
+                record = message_record(load_data(data), _media_path(folder_name, media_filename))
+                if 'ndjson' in files:
+                    files['ndjson'].write(ndjson_line(record))
+                if 'csv' in files:
+                    files['csv'].write(csv_row(record))
+                written += 1
+    finally:
+        for file in files.values():
+            file.close()
+    for sink in files:
+        os.replace(paths[sink].with_name(paths[sink].name + '.tmp'), paths[sink])
+    return {'written': written, 'uncached': get_message_cache_stats(db_path)['uncached'],
+            'files': [str(paths[sink]) for sink in files]}
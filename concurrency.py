@@ -0,0 +1,199 @@
+"""
+Adaptive (AIMD) concurrency control for media downloads
+"""
+
+import asyncio
+import time
+import weakref
+
+# Import configuration
+try:
+    from config import DOWNLOAD_CONCURRENCY_INITIAL, DOWNLOAD_CONCURRENCY_MIN, DOWNLOAD_CONCURRENCY_MAX
+except ImportError:
+    DOWNLOAD_CONCURRENCY_INITIAL = 2
+    DOWNLOAD_CONCURRENCY_MIN = 1
+    DOWNLOAD_CONCURRENCY_MAX = 8
+
+try:
+    from config import CONCURRENCY_WINDOW_SECONDS
+except ImportError:
+    CONCURRENCY_WINDOW_SECONDS = 10
+
+
+class AdaptiveConcurrencyController:
+    """Additive-increase / multiplicative-decrease limit on concurrent downloads.
+
+    At the end of every measurement window the aggregate throughput is
+    compared with the previous window. If it improved, all slots were busy
+    and nothing went wrong, the limit grows by one. A flood wait, timeout or
+    stalled transfer halves the limit immediately (at most once per window).
+
+    Usage:
+        async with controller.slot():
+            await download(...)
+    """
+
+    def __init__(self, initial=DOWNLOAD_CONCURRENCY_INITIAL, minimum=DOWNLOAD_CONCURRENCY_MIN,
+                 maximum=DOWNLOAD_CONCURRENCY_MAX, window_seconds=CONCURRENCY_WINDOW_SECONDS,
+                 decrease_factor=0.5, improvement_threshold=0.05):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.window_seconds = window_seconds
+        self.decrease_factor = decrease_factor
+        self.improvement_threshold = improvement_threshold
+        self.active = 0
+        self.peak_limit = self.limit
+        self.decisions = []
+        self._condition = asyncio.Condition()
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+        self._window_saturated = False
+        self._window_congested = False
+        self._last_decrease = 0.0
+        self._previous_throughput = 0.0
+        self.throughput = 0.0
+
+    def slot(self):
+        """Async context manager holding one download slot."""
+        return _Slot(self)
+
+    async def acquire(self):
+        """Wait for a free download slot."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+            if self.active >= self.limit:
+                self._window_saturated = True
+        self._maybe_adjust()
+
+    async def release(self):
+        """Free a download slot."""
+        async with self._condition:
+            self.active -= 1
+            self._condition.notify_all()
+        self._maybe_adjust()
+
+    def add_bytes(self, count):
+        """Account downloaded bytes towards the current window's throughput."""
+        if count > 0:
+            self._window_bytes += count
+        self._maybe_adjust()
+
+    def record_congestion(self, reason):
+        """Cut the limit after a flood wait, timeout or stall."""
+        self._window_congested = True
+        now = time.monotonic()
+        if now - self._last_decrease < self.window_seconds:
+            return
+        self._last_decrease = now
+        new_limit = max(self.minimum, int(self.limit * self.decrease_factor))
+        self._set_limit(new_limit, f"decrease ({reason})")
+
+    def _maybe_adjust(self):
+        """Close the measurement window and apply additive increase if earned."""
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed < self.window_seconds:
+            return
+
+        self.throughput = self._window_bytes / elapsed
+        improved = self.throughput > self._previous_throughput * (1 + self.improvement_threshold)
+        if (improved and self._window_saturated and not self._window_congested
+                and self.limit < self.maximum):
+            self._set_limit(self.limit + 1, "increase (throughput improved)")
+
+        self._previous_throughput = self.throughput
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_saturated = self.active >= self.limit
+        self._window_congested = False
+
+    def _set_limit(self, new_limit, reason):
+        if new_limit == self.limit:
+            return
+        from media_handler import format_file_size
+        old_limit = self.limit
+        self.limit = new_limit
+        self.peak_limit = max(self.peak_limit, new_limit)
+        self.decisions.append({
+            'time': time.time(),
+            'from': old_limit,
+            'to': new_limit,
+            'reason': reason,
+            'throughput': self.throughput
+        })
+        print(f"\n  ⚙️ Download concurrency {old_limit} → {new_limit}: {reason}, "
+              f"{format_file_size(int(self.throughput))}/s")
+
+        # Wake waiters so a raised limit takes effect immediately
+        async def _notify():
+            async with self._condition:
+                self._condition.notify_all()
+        try:
+            asyncio.get_running_loop().create_task(_notify())
+        except RuntimeError:
+            pass
+
+    def snapshot(self):
+        """Current state for progress events and the run report."""
+        return {
+            'limit': self.limit,
+            'active': self.active,
+            'peak_limit': self.peak_limit,
+            'throughput': self.throughput,
+            'increases': sum(1 for d in self.decisions if d['to'] > d['from']),
+            'decreases': sum(1 for d in self.decisions if d['to'] < d['from']),
+            'decisions': list(self.decisions)
+        }
+
+
+class _Slot:
+    def __init__(self, controller):
+        self.controller = controller
+
+    async def __aenter__(self):
+        await self.controller.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.controller.release()
+        return False
+
+
+class FloodWaitGate:
+    """Account-wide pause after a flood wait.
+
+    Telegram applies flood waits to the whole account, so once one request
+    is told to wait, every other request on the same client waits as well
+    instead of running into the same limit again.
+    """
+
+    def __init__(self):
+        self.resume_at = 0.0
+
+    def block(self, seconds):
+        """Hold back all requests for ``seconds`` from now."""
+        self.resume_at = max(self.resume_at, time.monotonic() + seconds)
+
+    def remaining(self):
+        """Seconds left until requests may continue."""
+        return max(self.resume_at - time.monotonic(), 0.0)
+
+    async def wait(self):
+        """Sleep until the flood wait (if any) has passed."""
+        delay = self.remaining()
+        while delay > 0:
+            await asyncio.sleep(delay)
+            delay = self.remaining()
+
+
+_flood_gates = weakref.WeakKeyDictionary()
+
+
+def flood_gate_for(client):
+    """Return the flood-wait gate shared by everything using ``client``."""
+    gate = _flood_gates.get(client)
+    if gate is None:
+        gate = _flood_gates[client] = FloodWaitGate()
+    return gate
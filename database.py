@@ -5,6 +5,29 @@ Database operations for tracking exported messages
 import sqlite3
 from pathlib import Path
 
+from utils import normalize_for_search
+from layout import message_folder_path
+
+# Subdirectory of the output directory holding one export tree per chat
+CHATS_SUBDIR = 'chats'
+
+# Subdirectory of an export holding the paginated archive pages (ARCHIVE_PAGES)
+ARCHIVE_SUBDIR = 'archive'
+
+# Subdirectory of an export holding the static search page and index (SEARCH_INDEX)
+SEARCH_SUBDIR = 'search'
+
+# Seconds a connection waits for a lock held by another process (backfill workers)
+DB_BUSY_TIMEOUT = 30
+
+DB_FILENAME = 'export_history.db'
+
+
+def _connect(db_path):
+    """Open a connection that waits for concurrent writers instead of failing."""
+    return sqlite3.connect(db_path, timeout=DB_BUSY_TIMEOUT)
+
+
 def init_database(output_dir=None):
     """Initialize SQLite database to track exported messages."""
     if output_dir is None:
@@ -18,10 +41,13 @@ def init_database(output_dir=None):
     
     # Ensure output directory exists
     output_path = Path(output_dir)
-    output_path.mkdir(exist_ok=True)
+    output_path.mkdir(parents=True, exist_ok=True)
     
-    db_path = output_path / 'export_history.db'
-    conn = sqlite3.connect(db_path)
+    db_path = output_path / DB_FILENAME
+    conn = _connect(db_path)
+    
+    # WAL lets several processes read while one writes (persists in the file)
+    conn.execute('PRAGMA journal_mode=WAL')
     
     # Create table if it doesn't exist
     conn.execute('''
@@ -53,31 +79,191 @@ def init_database(output_dir=None):
         )
     ''')
     
+    # Create failed export queue (retried with main.py --retry-failed)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS failed_exports (
+            message_id INTEGER PRIMARY KEY,
+            error_class TEXT,
+            error_message TEXT,
+            attempts INTEGER DEFAULT 0,
+            first_failed TEXT DEFAULT CURRENT_TIMESTAMP,
+            last_failed TEXT DEFAULT CURRENT_TIMESTAMP,
+            next_eligible TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Create per-message stage journal so interrupted exports can resume
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS export_journal (
+            message_id INTEGER PRIMARY KEY,
+            folder_path TEXT,
+            folder_created BOOLEAN DEFAULT 0,
+            media_done BOOLEAN DEFAULT 0,
+            media_filename TEXT,
+            media_size INTEGER,
+            media_sha256 TEXT,
+            updated TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Highest message ID covered by a completed scan, so later runs only fetch newer messages
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS export_watermark (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            high_water INTEGER NOT NULL,
+            updated TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Where a run stopped by --max-duration/--max-bytes has to continue
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS export_checkpoint (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            offset_id INTEGER NOT NULL,
+            high_water INTEGER NOT NULL,
+            reason TEXT,
+            updated TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # ID shards of a multi-process backfill (main.py --backfill)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS backfill_shards (
+            shard_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            min_id INTEGER NOT NULL,
+            max_id INTEGER NOT NULL,
+            cursor INTEGER NOT NULL,
+            status TEXT DEFAULT 'pending',
+            worker INTEGER,
+            exported INTEGER DEFAULT 0,
+            updated TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Rendered message bubbles of the paginated archive, grouped into pages
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_fragments (
+            message_id INTEGER PRIMARY KEY,
+            page_key TEXT,
+            message_date TEXT NOT NULL,
+            fragment TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_fragments_page ON archive_fragments (page_key, message_id)')
+    
+    # Archive pages; a page is rewritten when version moves past rendered_version
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_pages (
+            page_key TEXT PRIMARY KEY,
+            message_count INTEGER DEFAULT 0,
+            first_id INTEGER,
+            last_id INTEGER,
+            version INTEGER DEFAULT 0,
+            rendered_version INTEGER DEFAULT 0,
+            prev_key TEXT,
+            next_key TEXT,
+            updated TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Pagination the archive pages were built with
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS archive_layout (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            page_by TEXT NOT NULL,
+            page_size INTEGER NOT NULL
+        )
+    ''')
+    
+    # Static search index: terms per message, grouped into shards by their first two characters
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_postings (
+            shard TEXT NOT NULL,
+            term TEXT NOT NULL,
+            message_id INTEGER NOT NULL,
+            PRIMARY KEY (shard, term, message_id)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_search_postings_message ON search_postings (message_id)')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_documents (
+            message_id INTEGER PRIMARY KEY,
+            hash TEXT
+        )
+    ''')
+    # Index files (term shards, document buckets) to write on the next update
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_stale (
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL,
+            PRIMARY KEY (kind, key)
+        )
+    ''')
+    
+    # Serialized raw messages (zlib-compressed JSON), so pages can be rendered again offline
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS message_cache (
+            message_id INTEGER PRIMARY KEY,
+            chat_title TEXT,
+            data BLOB NOT NULL,
+            cached TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Columns added after the first release
+    _ensure_column(conn, 'exported_messages', 'deleted_at', 'TEXT')
+    _ensure_column(conn, 'exported_messages', 'render_version', 'TEXT')
+    _ensure_column(conn, 'exported_messages', 'output_digest', 'TEXT')
+    _ensure_column(conn, 'exported_messages', 'media_id', 'INTEGER')
+    # Lowest ID of the batch a backfill worker is exporting right now; shards are only split below it
+    _ensure_column(conn, 'backfill_shards', 'in_flight', 'INTEGER')
+    
     conn.commit()
     conn.close()
     return db_path
 
 
+def export_directories(output_dir):
+    """The export directory and every chat subtree below it that has its own database."""
+    chats_dir = Path(output_dir) / CHATS_SUBDIR
+    chat_dirs = sorted(path.parent for path in chats_dir.glob(f'*/{DB_FILENAME}')) if chats_dir.is_dir() else []
+    return [Path(output_dir)] + chat_dirs
+
+
+def _ensure_column(conn, table, column, definition):
+    """Add a column to an existing table if an older database lacks it."""
+    columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+
 def is_message_exported(db_path, message_id):
     """Check if a message has already been exported."""
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.execute('SELECT 1 FROM exported_messages WHERE message_id = ?', (message_id,))
     exists = cursor.fetchone() is not None
     conn.close()
     return exists
 
 
-def mark_message_exported(db_path, message, media_filename=None, file_path=None):
-    """Mark a message as exported in the database."""
-    conn = sqlite3.connect(db_path)
+def mark_message_exported(db_path, message, media_filename=None, file_path=None, render_version=None,
+                          output_digest=None, media_id=None):
+    """Mark a message as exported in the database.
+    
+    ``render_version`` (formatters.render_version) and ``output_digest``
+    (formatters.output_digest) record how its pages were rendered;
+    ``media_id`` (media_handler.message_media_id) which media was downloaded.
+    """
+    conn = _connect(db_path)
     
     # Create a simple hash for change detection
     content_hash = str(hash(str(message.text or '') + str(message.date)))
     
     conn.execute('''
         INSERT OR REPLACE INTO exported_messages 
-        (message_id, message_date, message_text, has_media, media_filename, file_path, hash)
-        VALUES (?, ?, ?, ?, ?, ?, ?)
+        (message_id, message_date, message_text, has_media, media_filename, file_path, hash,
+         render_version, output_digest, media_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
     ''', (
         message.id,
         message.date.isoformat(),  # Convert datetime to string
@@ -85,13 +271,833 @@ def mark_message_exported(db_path, message, media_filename=None, file_path=None)
         bool(message.media),
         media_filename,
         file_path,
-        content_hash
+        content_hash,
+        render_version,
+        output_digest,
+        media_id
     ))
     
     conn.commit()
     conn.close()
 
 
+def get_latest_exported_id(db_path):
+    """Get the highest exported message ID (0 if nothing was exported yet)."""
+    conn = _connect(db_path)
+    row = conn.execute('SELECT MAX(message_id) FROM exported_messages').fetchone()
+    conn.close()
+    return row[0] or 0
+
+
+def get_exported_file_path(db_path, message_id):
+    """Get the recorded HTML path of an exported message, or None."""
+    conn = _connect(db_path)
+    row = conn.execute('SELECT file_path FROM exported_messages WHERE message_id = ?', (message_id,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def get_exported_media(db_path, message_id):
+    """Get the recorded media of an exported message.
+    
+    Returns:
+        Dictionary with 'media_id', 'media_filename' and 'file_path', or
+        None if the message was not exported
+    """
+    conn = _connect(db_path)
+    row = conn.execute('''
+        SELECT media_id, media_filename, file_path FROM exported_messages WHERE message_id = ?
+    ''', (message_id,)).fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {'media_id': row[0], 'media_filename': row[1], 'file_path': row[2]}
+
+
+def mark_messages_deleted(db_path, message_ids):
+    """Flag exported messages that were deleted in Telegram.
+    
+    The exported files are kept; only the database row records the deletion.
+    
+    Returns:
+        List of the given IDs that belong to exported messages
+    """
+    conn = _connect(db_path)
+    placeholders = ','.join('?' * len(message_ids))
+    rows = conn.execute(f'''
+        SELECT message_id FROM exported_messages
+        WHERE message_id IN ({placeholders}) AND deleted_at IS NULL
+    ''', list(message_ids)).fetchall()
+    deleted = [row[0] for row in rows]
+    if deleted:
+        conn.executemany('''
+            UPDATE exported_messages SET deleted_at = CURRENT_TIMESTAMP WHERE message_id = ?
+        ''', [(message_id,) for message_id in deleted])
+        conn.commit()
+    conn.close()
+    return deleted
+
+
+def get_export_watermark(db_path):
+    """Get the highest message ID covered by a completed full scan (0 if none)."""
+    conn = _connect(db_path)
+    row = conn.execute('SELECT high_water FROM export_watermark WHERE id = 1').fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def set_export_watermark(db_path, high_water):
+    """Record that every message up to ``high_water`` has been scanned."""
+    conn = _connect(db_path)
+    conn.execute('''
+        INSERT INTO export_watermark (id, high_water, updated) VALUES (1, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(id) DO UPDATE SET
+            high_water = MAX(high_water, excluded.high_water),
+            updated = excluded.updated
+    ''', (high_water,))
+    conn.commit()
+    conn.close()
+
+
+def get_export_checkpoint(db_path):
+    """Get the checkpoint left by a run that stopped at its budget.
+    
+    Returns:
+        Dictionary with 'offset_id', 'high_water', 'reason' and 'updated',
+        or None if the last run finished its scan
+    """
+    conn = _connect(db_path)
+    row = conn.execute('''
+        SELECT offset_id, high_water, reason, updated FROM export_checkpoint WHERE id = 1
+    ''').fetchone()
+    conn.close()
+    if not row:
+        return None
+    return {'offset_id': row[0], 'high_water': row[1], 'reason': row[2], 'updated': row[3]}
+
+
+def set_export_checkpoint(db_path, offset_id, high_water, reason=None):
+    """Record that messages below ``offset_id`` (down to the watermark) and
+    above ``high_water`` are still to be exported."""
+    conn = _connect(db_path)
+    conn.execute('''
+        INSERT OR REPLACE INTO export_checkpoint (id, offset_id, high_water, reason, updated)
+        VALUES (1, ?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (offset_id, high_water, reason))
+    conn.commit()
+    conn.close()
+
+
+def clear_export_checkpoint(db_path):
+    """Remove the checkpoint once the interrupted scan has been finished."""
+    conn = _connect(db_path)
+    conn.execute('DELETE FROM export_checkpoint')
+    conn.commit()
+    conn.close()
+
+
+def create_backfill_shards(db_path, ranges):
+    """Replace the backfill plan with new (min_id, max_id) shards."""
+    conn = _connect(db_path)
+    conn.execute('DELETE FROM backfill_shards')
+    conn.executemany('''
+        INSERT INTO backfill_shards (min_id, max_id, cursor) VALUES (?, ?, ?)
+    ''', [(min_id, max_id, max_id + 1) for min_id, max_id in ranges])
+    conn.commit()
+    conn.close()
+
+
+def has_unfinished_backfill(db_path):
+    """Check whether a previous backfill left shards to do."""
+    conn = _connect(db_path)
+    row = conn.execute("SELECT 1 FROM backfill_shards WHERE status != 'done' LIMIT 1").fetchone()
+    conn.close()
+    return row is not None
+
+
+# Smallest ID range of a running backfill shard that is still split for an idle worker
+BACKFILL_MIN_SPLIT = 200
+
+
+def claim_backfill_shard(db_path, worker, min_split=BACKFILL_MIN_SPLIT):
+    """Assign a shard to a worker, splitting a busy shard if none is pending.
+    
+    Pending shards are handed out newest first. Once they are gone, the
+    running shard with the most IDs left is split in half and the older half
+    goes to the idle worker, so workers that finish early take over work
+    from slower ones. The split point stays below the batch the running
+    worker is exporting (see begin_backfill_batch), and the claim runs in
+    one write transaction, so two workers never get the same IDs.
+    
+    Returns:
+        Shard dict (shard_id, min_id, max_id, cursor) or None if nothing is left
+    """
+    conn = _connect(db_path)
+    conn.row_factory = sqlite3.Row
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('''
+            SELECT * FROM backfill_shards WHERE status = 'pending' ORDER BY max_id DESC LIMIT 1
+        ''').fetchone()
+        if row is not None:
+            conn.execute('''
+                UPDATE backfill_shards SET status = 'running', worker = ?, updated = CURRENT_TIMESTAMP
+                WHERE shard_id = ?
+            ''', (worker, row['shard_id']))
+            shard = dict(row)
+        else:
+            busiest = conn.execute('''
+                SELECT *, MIN(cursor, COALESCE(in_flight, cursor)) AS upper FROM backfill_shards
+                WHERE status = 'running'
+                ORDER BY upper - min_id DESC LIMIT 1
+            ''').fetchone()
+            if busiest is None or busiest['upper'] - busiest['min_id'] < min_split:
+                conn.rollback()
+                return None
+            middle = (busiest['min_id'] + busiest['upper']) // 2
+            # The running worker keeps [middle, cursor), the idle one takes [min_id, middle)
+            conn.execute('''
+                UPDATE backfill_shards SET min_id = ?, updated = CURRENT_TIMESTAMP WHERE shard_id = ?
+            ''', (middle, busiest['shard_id']))
+            cursor = conn.execute('''
+                INSERT INTO backfill_shards (min_id, max_id, cursor, status, worker)
+                VALUES (?, ?, ?, 'running', ?)
+            ''', (busiest['min_id'], middle - 1, middle, worker))
+            shard = {'shard_id': cursor.lastrowid, 'min_id': busiest['min_id'],
+                     'max_id': middle - 1, 'cursor': middle}
+        conn.commit()
+        return {key: shard[key] for key in ('shard_id', 'min_id', 'max_id', 'cursor')}
+    finally:
+        conn.close()
+
+
+def get_backfill_shard_min_id(db_path, shard_id):
+    """Current lower bound of a shard (raised when another worker took its older half)."""
+    conn = _connect(db_path)
+    row = conn.execute('SELECT min_id FROM backfill_shards WHERE shard_id = ?', (shard_id,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def begin_backfill_batch(db_path, shard_id, lowest_id):
+    """Reserve the IDs of a batch before exporting it.
+
+    Records ``lowest_id`` as the in-flight bound of the shard, so a split
+    made while the batch is exported only hands out IDs below it.
+
+    Returns:
+        The lower bound of the shard at that moment; messages below it
+        belong to another worker. None if the shard is gone.
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT min_id FROM backfill_shards WHERE shard_id = ?', (shard_id,)).fetchone()
+        if row is not None:
+            conn.execute('''
+                UPDATE backfill_shards SET in_flight = ?, updated = CURRENT_TIMESTAMP WHERE shard_id = ?
+            ''', (max(lowest_id, row[0]), shard_id))
+        conn.commit()
+        return row[0] if row else None
+    finally:
+        conn.close()
+
+
+def update_backfill_cursor(db_path, shard_id, cursor, exported):
+    """Record that every ID from ``cursor`` up is done and add to the exported count."""
+    conn = _connect(db_path)
+    conn.execute('''
+        UPDATE backfill_shards SET cursor = ?, in_flight = NULL, exported = exported + ?,
+            updated = CURRENT_TIMESTAMP
+        WHERE shard_id = ?
+    ''', (cursor, exported, shard_id))
+    conn.commit()
+    conn.close()
+
+
+def finish_backfill_shard(db_path, shard_id):
+    """Mark a shard as completely exported."""
+    conn = _connect(db_path)
+    conn.execute('''
+        UPDATE backfill_shards SET status = 'done', cursor = min_id, updated = CURRENT_TIMESTAMP
+        WHERE shard_id = ?
+    ''', (shard_id,))
+    conn.commit()
+    conn.close()
+
+
+def release_backfill_shards(db_path, worker=None):
+    """Put the running shards of a worker (or of all workers) back to pending.
+    
+    Shards keep their cursor, so the next claim continues where the worker
+    stopped.
+    """
+    conn = _connect(db_path)
+    if worker is None:
+        conn.execute('''
+            UPDATE backfill_shards SET status = 'pending', worker = NULL, in_flight = NULL WHERE status = 'running'
+        ''')
+    else:
+        conn.execute('''
+            UPDATE backfill_shards SET status = 'pending', worker = NULL, in_flight = NULL
+            WHERE status = 'running' AND worker = ?
+        ''', (worker,))
+    conn.commit()
+    conn.close()
+
+
+def get_backfill_progress(db_path):
+    """Summary of the backfill plan.
+    
+    Returns:
+        Dictionary with 'shards', 'done', 'running', 'pending', 'exported',
+        'remaining_ids' and 'high_water' (the newest message ID of the plan)
+    """
+    conn = _connect(db_path)
+    row = conn.execute('''
+        SELECT COUNT(*),
+               SUM(status = 'done'), SUM(status = 'running'), SUM(status = 'pending'),
+               SUM(exported), SUM(MAX(cursor - min_id, 0)), MAX(max_id)
+        FROM backfill_shards
+    ''').fetchone()
+    conn.close()
+    return {
+        'shards': row[0],
+        'done': row[1] or 0,
+        'running': row[2] or 0,
+        'pending': row[3] or 0,
+        'exported': row[4] or 0,
+        'remaining_ids': row[5] or 0,
+        'high_water': row[6] or 0
+    }
+
+
+def _numbered_page_key(number):
+    return f"{number:06d}"
+
+
+def _add_to_archive_page(conn, page_key, message_id):
+    conn.execute('''
+        INSERT INTO archive_pages (page_key, message_count, first_id, last_id, version)
+        VALUES (?, 1, ?, ?, 1)
+        ON CONFLICT(page_key) DO UPDATE SET
+            message_count = message_count + 1,
+            first_id = MIN(first_id, excluded.first_id),
+            last_id = MAX(last_id, excluded.last_id),
+            version = version + 1,
+            updated = CURRENT_TIMESTAMP
+    ''', (page_key, message_id, message_id))
+
+
+def store_archive_fragment(db_path, message_id, message_date, fragment, page_key=None):
+    """Store the rendered bubble of a message and mark its archive page as changed.
+
+    A message keeps its page when it is stored again (edited or re-exported);
+    the page is only marked as changed when the bubble differs.
+    New messages go to ``page_key`` (month pages) or, with ``page_key=None``,
+    wait for assign_archive_pages to give them a numbered page.
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        row = conn.execute('SELECT page_key, fragment FROM archive_fragments WHERE message_id = ?',
+                           (message_id,)).fetchone()
+        if row is not None and row[1] == fragment:
+            # Unchanged (e.g. re-rendered with the same templates): the page stays as it is
+            pass
+        elif row is not None:
+            conn.execute('UPDATE archive_fragments SET message_date = ?, fragment = ? WHERE message_id = ?',
+                         (message_date, fragment, message_id))
+            conn.execute('''
+                UPDATE archive_pages SET version = version + 1, updated = CURRENT_TIMESTAMP WHERE page_key = ?
+            ''', (row[0],))
+        else:
+            conn.execute('''
+                INSERT INTO archive_fragments (message_id, page_key, message_date, fragment) VALUES (?, ?, ?, ?)
+            ''', (message_id, page_key, message_date, fragment))
+            if page_key is not None:
+                _add_to_archive_page(conn, page_key, message_id)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def assign_archive_pages(db_path, page_size):
+    """Put messages waiting for a numbered archive page on one.
+
+    Messages are taken in ID order: newer ones fill the last page and open a
+    new one every ``page_size`` messages, older ones (a backfill) join the
+    page covering their ID, so existing pages never shift.
+
+    Returns:
+        Number of messages assigned
+    """
+    conn = _connect(db_path)
+    try:
+        # One write transaction, so concurrent backfill workers agree on page numbers
+        conn.execute('BEGIN IMMEDIATE')
+        waiting = [row[0] for row in conn.execute('''
+            SELECT message_id FROM archive_fragments WHERE page_key IS NULL ORDER BY message_id
+        ''')]
+        last = conn.execute('''
+            SELECT page_key, message_count, last_id FROM archive_pages ORDER BY page_key DESC LIMIT 1
+        ''').fetchone()
+        last_key, last_count, last_id = last if last else (None, 0, 0)
+        for message_id in waiting:
+            if message_id < last_id:
+                page_key = conn.execute('''
+                    SELECT page_key FROM archive_pages WHERE last_id >= ? ORDER BY last_id LIMIT 1
+                ''', (message_id,)).fetchone()[0]
+            else:
+                if last_key is None or last_count >= page_size:
+                    last_key, last_count = _numbered_page_key(int(last_key or 0) + 1), 0
+                page_key = last_key
+                last_count, last_id = last_count + 1, message_id
+            conn.execute('UPDATE archive_fragments SET page_key = ? WHERE message_id = ?', (page_key, message_id))
+            _add_to_archive_page(conn, page_key, message_id)
+        conn.commit()
+        return len(waiting)
+    finally:
+        conn.close()
+
+
+ARCHIVE_PAGE_FIELDS = ('page_key', 'message_count', 'first_id', 'last_id', 'version',
+                       'rendered_version', 'prev_key', 'next_key')
+
+
+def get_archive_pages(db_path):
+    """All archive pages in reading order (oldest first), as dictionaries."""
+    conn = _connect(db_path)
+    rows = conn.execute(f'SELECT {", ".join(ARCHIVE_PAGE_FIELDS)} FROM archive_pages ORDER BY page_key').fetchall()
+    conn.close()
+    return [dict(zip(ARCHIVE_PAGE_FIELDS, row)) for row in rows]
+
+
+def get_archive_fragments(db_path, page_key):
+    """Messages of one archive page as (message_id, message_date, fragment), oldest first."""
+    conn = _connect(db_path)
+    rows = conn.execute('''
+        SELECT message_id, message_date, fragment FROM archive_fragments
+        WHERE page_key = ? ORDER BY message_id
+    ''', (page_key,)).fetchall()
+    conn.close()
+    return rows
+
+
+def mark_archive_page_rendered(db_path, page_key, version, prev_key, next_key):
+    """Record which version of a page was written and which pages it links to."""
+    conn = _connect(db_path)
+    conn.execute('''
+        UPDATE archive_pages SET rendered_version = ?, prev_key = ?, next_key = ? WHERE page_key = ?
+    ''', (version, prev_key, next_key, page_key))
+    conn.commit()
+    conn.close()
+
+
+def get_archive_layout(db_path):
+    """Pagination of the stored archive pages as (page_by, page_size), or None."""
+    conn = _connect(db_path)
+    row = conn.execute('SELECT page_by, page_size FROM archive_layout WHERE id = 1').fetchone()
+    conn.close()
+    return tuple(row) if row else None
+
+
+def repaginate_archive(db_path, page_by, page_size):
+    """Regroup the stored fragments after ARCHIVE_PAGE_BY or ARCHIVE_PAGE_SIZE changed.
+    
+    Every page is marked as changed; fragments are not rendered again.
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        if page_by == 'month':
+            # message_date is ISO formatted, so its first 7 characters are YYYY-MM
+            conn.execute('UPDATE archive_fragments SET page_key = substr(message_date, 1, 7)')
+        else:
+            ids = [row[0] for row in conn.execute('SELECT message_id FROM archive_fragments ORDER BY message_id')]
+            conn.executemany('UPDATE archive_fragments SET page_key = ? WHERE message_id = ?',
+                             [(_numbered_page_key(index // page_size + 1), message_id)
+                              for index, message_id in enumerate(ids)])
+        conn.execute('DELETE FROM archive_pages')
+        conn.execute('''
+            INSERT INTO archive_pages (page_key, message_count, first_id, last_id, version)
+            SELECT page_key, COUNT(*), MIN(message_id), MAX(message_id), 1
+            FROM archive_fragments GROUP BY page_key
+        ''')
+        conn.execute('''
+            INSERT INTO archive_layout (id, page_by, page_size) VALUES (1, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET page_by = excluded.page_by, page_size = excluded.page_size
+        ''', (page_by, page_size))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def get_exported_without_fragment(db_path):
+    """Exported messages that have no archive fragment yet.
+    
+    Returns:
+        List of (message_id, file_path, media_filename), oldest first
+    """
+    conn = _connect(db_path)
+    rows = conn.execute('''
+        SELECT message_id, file_path, media_filename FROM exported_messages
+        WHERE message_id NOT IN (SELECT message_id FROM archive_fragments)
+        ORDER BY message_id
+    ''').fetchall()
+    conn.close()
+    return rows
+
+
+def get_unindexed_messages(db_path, limit=5000):
+    """Exported messages missing from the search index or changed since they were indexed.
+
+    Returns:
+        List of (message_id, message_text, media_filename, hash)
+    """
+    conn = _connect(db_path)
+    rows = conn.execute('''
+        SELECT e.message_id, e.message_text, e.media_filename, e.hash
+        FROM exported_messages e LEFT JOIN search_documents d ON d.message_id = e.message_id
+        WHERE d.message_id IS NULL OR d.hash IS NOT e.hash
+        ORDER BY e.message_id
+        LIMIT ?
+    ''', (limit,)).fetchall()
+    conn.close()
+    return rows
+
+
+def store_search_terms(db_path, entries, bucket_size):
+    """Replace the indexed terms of messages and mark the affected index files as stale.
+
+    Args:
+        db_path: Path to database
+        entries: List of (message_id, hash, terms)
+        bucket_size: Message IDs per document file of the index
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        stale = set()
+        for message_id, content_hash, terms in entries:
+            # Shards that lose a term of an edited message change as well
+            stale.update(('shard', row[0]) for row in conn.execute(
+                'SELECT DISTINCT shard FROM search_postings WHERE message_id = ?', (message_id,)))
+            conn.execute('DELETE FROM search_postings WHERE message_id = ?', (message_id,))
+            conn.executemany('INSERT OR IGNORE INTO search_postings (shard, term, message_id) VALUES (?, ?, ?)',
+                             [(term[:2], term, message_id) for term in terms])
+            conn.execute('INSERT OR REPLACE INTO search_documents (message_id, hash) VALUES (?, ?)',
+                         (message_id, content_hash))
+            stale.update(('shard', term[:2]) for term in terms)
+            stale.add(('docs', str(message_id // bucket_size)))
+        conn.executemany('INSERT OR IGNORE INTO search_stale (kind, key) VALUES (?, ?)', sorted(stale))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def claim_stale_search_files(db_path):
+    """Take the list of index files to write and clear it.
+
+    A message indexed by another process meanwhile marks its files stale
+    again, so they are written by that process.
+
+    Returns:
+        Dictionary with 'shard' (term prefixes) and 'docs' (bucket numbers)
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        rows = conn.execute('SELECT kind, key FROM search_stale').fetchall()
+        conn.execute('DELETE FROM search_stale')
+        conn.commit()
+    finally:
+        conn.close()
+    stale = {'shard': [], 'docs': []}
+    for kind, key in rows:
+        stale[kind].append(key if kind == 'shard' else int(key))
+    return stale
+
+
+def get_all_search_files(db_path, bucket_size):
+    """Every shard and document bucket of the index, to write the index from scratch.
+
+    Returns:
+        Dictionary with 'shard' (term prefixes) and 'docs' (bucket numbers)
+    """
+    conn = _connect(db_path)
+    shards = [row[0] for row in conn.execute('SELECT DISTINCT shard FROM search_postings')]
+    buckets = [row[0] for row in conn.execute('SELECT DISTINCT message_id / ? FROM search_documents', (bucket_size,))]
+    conn.close()
+    return {'shard': shards, 'docs': buckets}
+
+
+def get_search_shard(db_path, shard):
+    """Terms of one index shard with their message IDs (ascending).
+
+    Returns:
+        Dictionary mapping term to list of message IDs
+    """
+    conn = _connect(db_path)
+    rows = conn.execute('''
+        SELECT term, message_id FROM search_postings WHERE shard = ? ORDER BY term, message_id
+    ''', (shard,)).fetchall()
+    conn.close()
+    terms = {}
+    for term, message_id in rows:
+        terms.setdefault(term, []).append(message_id)
+    return terms
+
+
+def get_search_documents(db_path, first_id, last_id):
+    """Result details of the indexed messages with IDs in [first_id, last_id].
+
+    Returns:
+        List of (message_id, message_date, message_text, media_filename, file_path)
+    """
+    conn = _connect(db_path)
+    rows = conn.execute('''
+        SELECT e.message_id, e.message_date, e.message_text, e.media_filename, e.file_path
+        FROM exported_messages e JOIN search_documents d ON d.message_id = e.message_id
+        WHERE e.message_id BETWEEN ? AND ?
+        ORDER BY e.message_id
+    ''', (first_id, last_id)).fetchall()
+    conn.close()
+    return rows
+
+
+def get_search_document_count(db_path):
+    """Number of messages in the search index."""
+    conn = _connect(db_path)
+    count = conn.execute('SELECT COUNT(*) FROM search_documents').fetchone()[0]
+    conn.close()
+    return count
+
+
+def store_cached_message(db_path, message_id, chat_title, data):
+    """Keep the serialized form of an exported message (replaces an older copy)."""
+    conn = _connect(db_path)
+    conn.execute('''
+        INSERT OR REPLACE INTO message_cache (message_id, chat_title, data, cached)
+        VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+    ''', (message_id, chat_title, data))
+    conn.commit()
+    conn.close()
+
+
+def get_cached_messages(db_path, before_id=None, limit=1000, stale_for=None):
+    """Cached messages with their export record, newest first.
+
+    Pass the lowest ID of a batch as ``before_id`` to get the next one.
+    With ``stale_for``, only messages whose pages were rendered with another
+    render version are returned.
+
+    Returns:
+        List of (message_id, chat_title, data, media_filename, file_path, output_digest)
+    """
+    conn = _connect(db_path)
+    rows = conn.execute('''
+        SELECT c.message_id, c.chat_title, c.data, e.media_filename, e.file_path, e.output_digest
+        FROM message_cache c JOIN exported_messages e ON e.message_id = c.message_id
+        WHERE c.message_id < ? AND (? IS NULL OR e.render_version IS NOT ?)
+        ORDER BY c.message_id DESC
+        LIMIT ?
+    ''', (before_id if before_id is not None else 2 ** 63 - 1, stale_for, stale_for, limit)).fetchall()
+    conn.close()
+    return rows
+
+
+def get_message_cache_stats(db_path):
+    """Exported messages with and without a cached copy.
+
+    Returns:
+        Dictionary with 'cached', 'uncached' and 'size' (bytes of cached data)
+    """
+    conn = _connect(db_path)
+    cached, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0) FROM message_cache').fetchone()
+    uncached = conn.execute('''
+        SELECT COUNT(*) FROM exported_messages e
+        WHERE NOT EXISTS (SELECT 1 FROM message_cache c WHERE c.message_id = e.message_id)
+    ''').fetchone()[0]
+    conn.close()
+    return {'cached': cached, 'uncached': uncached, 'size': size}
+
+
+def set_render_versions(db_path, render_version, entries):
+    """Record that the pages of messages were rendered again.
+
+    Args:
+        db_path: Path to database
+        render_version: formatters.render_version of the new pages
+        entries: List of (message_id, output_digest)
+    """
+    conn = _connect(db_path)
+    conn.executemany('UPDATE exported_messages SET render_version = ?, output_digest = ? WHERE message_id = ?',
+                     [(render_version, digest, message_id) for message_id, digest in entries])
+    conn.commit()
+    conn.close()
+
+
+def get_render_version_stats(db_path, render_version):
+    """Exported messages whose pages are up to date with ``render_version`` or behind it.
+
+    Returns:
+        Dictionary with 'current', 'stale' and 'stale_cached' (stale messages
+        that --rerender-stale can render from the message cache)
+    """
+    conn = _connect(db_path)
+    current, stale = conn.execute('''
+        SELECT COALESCE(SUM(render_version IS ?), 0), COALESCE(SUM(render_version IS NOT ?), 0)
+        FROM exported_messages
+    ''', (render_version, render_version)).fetchone()
+    stale_cached = conn.execute('''
+        SELECT COUNT(*) FROM exported_messages e JOIN message_cache c ON c.message_id = e.message_id
+        WHERE e.render_version IS NOT ?
+    ''', (render_version,)).fetchone()[0]
+    conn.close()
+    return {'current': current, 'stale': stale, 'stale_cached': stale_cached}
+
+
+# Pages are not journaled: they are rendered again on resume, since the message may have changed
+JOURNAL_FIELDS = ('folder_path', 'folder_created', 'media_done', 'media_filename',
+                  'media_size', 'media_sha256')
+
+
+def get_journal_entry(db_path, message_id):
+    """Get the stage journal of a partially exported message.
+    
+    Returns:
+        Dictionary with the journal fields, or None if the message has no
+        unfinished export
+    """
+    conn = _connect(db_path)
+    cursor = conn.execute(
+        f'SELECT {", ".join(JOURNAL_FIELDS)} FROM export_journal WHERE message_id = ?',
+        (message_id,)
+    )
+    row = cursor.fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return dict(zip(JOURNAL_FIELDS, row))
+
+
+def journal_stage(db_path, message_id, **fields):
+    """Record completion of one or more export stages for a message.
+    
+    Example:
+        journal_stage(db_path, 42, media_done=True, media_filename='media.jpg')
+    """
+    unknown = set(fields) - set(JOURNAL_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown journal fields: {', '.join(sorted(unknown))}")
+    
+    columns = list(fields)
+    conn = _connect(db_path)
+    conn.execute(f'''
+        INSERT INTO export_journal (message_id, {", ".join(columns)}, updated)
+        VALUES (?, {", ".join("?" for _ in columns)}, CURRENT_TIMESTAMP)
+        ON CONFLICT(message_id) DO UPDATE SET
+            {", ".join(f"{column} = excluded.{column}" for column in columns)},
+            updated = excluded.updated
+    ''', (message_id, *fields.values()))
+    conn.commit()
+    conn.close()
+
+
+def clear_journal_entry(db_path, message_id):
+    """Remove the stage journal of a message once its export is committed."""
+    conn = _connect(db_path)
+    conn.execute('DELETE FROM export_journal WHERE message_id = ?', (message_id,))
+    conn.commit()
+    conn.close()
+
+
+# Retry backoff for failed exports: 5 min, 10 min, 20 min, ... capped at one day
+FAILED_EXPORT_BASE_DELAY = 300
+FAILED_EXPORT_MAX_DELAY = 86400
+
+
+def record_export_failure(db_path, message_id, error):
+    """Record a failed message export and schedule its next retry.
+    
+    Each repeated failure doubles the delay before the message becomes
+    eligible for --retry-failed again.
+    """
+    conn = _connect(db_path)
+    row = conn.execute(
+        'SELECT attempts FROM failed_exports WHERE message_id = ?', (message_id,)
+    ).fetchone()
+    attempts = (row[0] if row else 0) + 1
+    delay = min(FAILED_EXPORT_BASE_DELAY * 2 ** (attempts - 1), FAILED_EXPORT_MAX_DELAY)
+    
+    conn.execute('''
+        INSERT INTO failed_exports 
+        (message_id, error_class, error_message, attempts, last_failed, next_eligible)
+        VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, datetime('now', ?))
+        ON CONFLICT(message_id) DO UPDATE SET
+            error_class = excluded.error_class,
+            error_message = excluded.error_message,
+            attempts = excluded.attempts,
+            last_failed = excluded.last_failed,
+            next_eligible = excluded.next_eligible
+    ''', (
+        message_id,
+        type(error).__name__,
+        str(error),
+        attempts,
+        f'+{delay} seconds'
+    ))
+    conn.commit()
+    conn.close()
+
+
+def clear_export_failure(db_path, message_id):
+    """Remove a message from the failed export queue."""
+    conn = _connect(db_path)
+    conn.execute('DELETE FROM failed_exports WHERE message_id = ?', (message_id,))
+    conn.commit()
+    conn.close()
+
+
+def get_failed_exports(db_path, eligible_only=True):
+    """Get IDs of messages waiting in the failed export queue.
+    
+    Args:
+        db_path: Path to database
+        eligible_only: Only return messages whose retry delay has passed
+    
+    Returns:
+        List of message IDs, newest first
+    """
+    conn = _connect(db_path)
+    query = 'SELECT message_id FROM failed_exports'
+    if eligible_only:
+        query += " WHERE next_eligible <= datetime('now')"
+    query += ' ORDER BY message_id DESC'
+    cursor = conn.execute(query)
+    message_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return message_ids
+
+
+def get_failed_export_stats(db_path):
+    """Get a summary of the failed export queue grouped by error class."""
+    conn = _connect(db_path)
+    cursor = conn.execute('''
+        SELECT 
+            error_class,
+            COUNT(*) as total,
+            COUNT(CASE WHEN next_eligible <= datetime('now') THEN 1 END) as due
+        FROM failed_exports
+        GROUP BY error_class
+        ORDER BY total DESC
+    ''')
+    rows = cursor.fetchall()
+    conn.close()
+    return [{'error_class': row[0], 'total': row[1], 'due': row[2]} for row in rows]
+
+
 def search_messages(db_path, text_query=None, filename_query=None, date_from=None, date_to=None):
     """Search exported messages by text or filename with flexible matching.
     
@@ -108,32 +1114,7 @@ def search_messages(db_path, text_query=None, filename_query=None, date_from=Non
     Returns:
         List of tuples: (message_id, message_date, message_text, media_filename, file_path)
     """
-    import re
-    
-    def normalize_for_search(text):
-        """Normalize text for flexible search - remove extra spaces, underscores, special chars
-        
-        Examples:
-            "ha__cker" -> "hacker"
-            "test___file___name" -> "testfilename"
-            "some-text_with__symbols" -> "some text with symbols"
-        """
-        if not text:
-            return ''
-        # Convert to lowercase
-        text = text.lower()
-        # First, remove ALL underscores completely (don't replace with spaces)
-        # This allows "ha__cker" to become "hacker"
-        text = text.replace('_', '')
-        # Replace hyphens with spaces for word separation
-        text = text.replace('-', ' ')
-        # Remove multiple spaces
-        text = re.sub(r'\s+', ' ', text)
-        # Remove special characters except spaces and alphanumeric
-        text = re.sub(r'[^\w\s]', '', text, flags=re.UNICODE)
-        return text.strip()
-    
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     
     # Build query
     query = 'SELECT message_id, message_date, message_text, media_filename, file_path FROM exported_messages WHERE 1=1'
@@ -183,7 +1164,7 @@ def search_messages(db_path, text_query=None, filename_query=None, date_from=Non
 
 def get_export_stats(db_path):
     """Get statistics about exported messages."""
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.execute('''
         SELECT 
             COUNT(*) as total,
@@ -216,7 +1197,7 @@ def get_export_stats(db_path):
 
 def is_folder_backed_up(db_path, folder_name):
     """Check if a folder has already been backed up to Google Drive."""
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.execute(
         'SELECT status FROM backup_history WHERE message_folder = ? AND status = ?', 
         (folder_name, 'completed')
@@ -228,7 +1209,7 @@ def is_folder_backed_up(db_path, folder_name):
 
 def mark_backup_started(db_path, folder_name, folder_path, archive_filename, archive_size):
     """Mark a folder backup as started."""
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     conn.execute('''
         INSERT OR REPLACE INTO backup_history 
         (message_folder, folder_path, archive_filename, archive_size_bytes, status)
@@ -240,7 +1221,7 @@ def mark_backup_started(db_path, folder_name, folder_path, archive_filename, arc
 
 def mark_backup_completed(db_path, folder_name, google_drive_file_id):
     """Mark a folder backup as completed with Google Drive file ID."""
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     conn.execute('''
         UPDATE backup_history 
         SET status = 'completed', 
@@ -254,7 +1235,7 @@ def mark_backup_completed(db_path, folder_name, google_drive_file_id):
 
 def mark_backup_failed(db_path, folder_name, error_message):
     """Mark a folder backup as failed with error message."""
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     conn.execute('''
         UPDATE backup_history 
         SET status = 'failed',
@@ -267,7 +1248,7 @@ def mark_backup_failed(db_path, folder_name, error_message):
 
 def get_backup_stats(db_path):
     """Get statistics about backups."""
-    conn = sqlite3.connect(db_path)
+    conn = _connect(db_path)
     cursor = conn.execute('''
         SELECT 
             COUNT(*) as total,
@@ -297,20 +1278,79 @@ def get_backup_stats(db_path):
 
 
 def get_folders_to_backup(db_path, export_dir):
-    """Get list of folders that haven't been backed up yet."""
-    from pathlib import Path
+    """Get list of message folders that haven't been backed up yet.
     
-    export_path = Path(export_dir)
-    all_folders = [f for f in export_path.iterdir() if f.is_dir()]
-    
-    conn = sqlite3.connect(db_path)
+    Folders are found through the recorded file_path of exported messages
+    (see layout.message_folder_path) rather than by listing the export
+    directory, so only folders that are not backed up yet are looked at,
+    whatever the layout.
+    """
+    conn = _connect(db_path)
     cursor = conn.execute(
         'SELECT message_folder FROM backup_history WHERE status = ?',
         ('completed',)
     )
     backed_up = {row[0] for row in cursor.fetchall()}
+    rows = conn.execute('''
+        SELECT file_path FROM exported_messages WHERE file_path IS NOT NULL ORDER BY message_id
+    ''').fetchall()
     conn.close()
     
-    # Return folders that haven't been backed up
-    folders_to_backup = [f for f in all_folders if f.name not in backed_up]
-    return folders_to_backup
\ No newline at end of file
+    # Return folders that haven't been backed up (and still exist locally)
+    folders_to_backup = []
+    for (file_path,) in rows:
+        if Path(file_path).parent.name in backed_up:
+            continue
+        folder = message_folder_path(export_dir, file_path)
+        if folder is not None:
+            folders_to_backup.append(folder)
+    return folders_to_backup
+
+
+def get_exported_file_paths(db_path):
+    """Recorded HTML path of every exported message.
+
+    Returns:
+        List of (message_id, file_path), oldest first
+    """
+    conn = _connect(db_path)
+    rows = conn.execute('''
+        SELECT message_id, file_path FROM exported_messages WHERE file_path IS NOT NULL ORDER BY message_id
+    ''').fetchall()
+    conn.close()
+    return rows
+
+
+def record_moved_folders(db_path, moves, bucket_size):
+    """Record message folders moved to another place in one transaction.
+
+    Archive bubbles linking the old folder are rewritten and their pages
+    marked as changed; the search index files listing the messages are
+    marked stale, so both are written again by the next update.
+
+    Args:
+        db_path: Path to database
+        moves: List of (message_id, file_path, old_href, new_href); the hrefs
+            are the folder links of the archive bubbles ('"../<folder>/')
+        bucket_size: Message IDs per document file of the search index
+    """
+    conn = _connect(db_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for message_id, file_path, old_href, new_href in moves:
+            conn.execute('UPDATE exported_messages SET file_path = ? WHERE message_id = ?', (file_path, message_id))
+            changed = conn.execute('''
+                UPDATE archive_fragments SET fragment = replace(fragment, ?, ?)
+                WHERE message_id = ? AND instr(fragment, ?) > 0
+            ''', (old_href, new_href, message_id, old_href)).rowcount
+            if changed:
+                conn.execute('''
+                    UPDATE archive_pages SET version = version + 1, updated = CURRENT_TIMESTAMP
+                    WHERE page_key = (SELECT page_key FROM archive_fragments WHERE message_id = ?)
+                ''', (message_id,))
+            if conn.execute('SELECT 1 FROM search_documents WHERE message_id = ?', (message_id,)).fetchone():
+                conn.execute('INSERT OR IGNORE INTO search_stale (kind, key) VALUES (?, ?)',
+                             ('docs', str(message_id // bucket_size)))
+        conn.commit()
+    finally:
+        conn.close()
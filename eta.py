@@ -0,0 +1,136 @@
+"""
+Byte-based ETA estimation for exports
+"""
+
+import time
+
+
+def message_media_size(message):
+    """Best known download size of a message's media in bytes (0 if none).
+
+    Documents carry an exact size. For photos the largest size variant is
+    used, which is what download_media fetches.
+    """
+    media = getattr(message, 'media', None)
+    if media is None:
+        return 0
+    try:
+        document = getattr(media, 'document', None)
+        if document is not None and getattr(document, 'size', None):
+            return document.size
+        photo = getattr(media, 'photo', None)
+        if photo is not None and getattr(photo, 'sizes', None):
+            largest = 0
+            for size in photo.sizes:
+                # PhotoSizeProgressive lists its progressive sizes in .sizes
+                value = getattr(size, 'size', None) or max(getattr(size, 'sizes', None) or [0])
+                largest = max(largest, value)
+            return largest
+    except (TypeError, ValueError):
+        pass
+    return 0
+
+
+class ExportEtaEstimator:
+    """Estimate the remaining export time from the bytes left in the queue.
+
+    The remaining time is the known media bytes still to download divided by
+    the measured download throughput, plus the remaining message count times
+    the measured per-message overhead (folder, render, database), spread over
+    the parallel workers. Until enough has been measured, conservative
+    defaults are used.
+    """
+
+    DEFAULT_THROUGHPUT = 1024 * 1024  # 1 MB/s until measured
+    DEFAULT_OVERHEAD = 0.05  # seconds per message until measured
+
+    def __init__(self, messages, workers=1, history_total=None):
+        self.workers = max(1, workers)
+        self.history_total = history_total
+        self._sizes = {message.id: message_media_size(message) for message in messages}
+        self.total_messages = len(self._sizes)
+        self.total_bytes = sum(self._sizes.values())
+        self.remaining_messages = self.total_messages
+        self.remaining_bytes = self.total_bytes
+        self.downloaded_bytes = 0
+        self.download_seconds = 0.0
+        self._overhead_total = 0.0
+        self._overhead_count = 0
+        self.started = time.monotonic()
+
+    def message_done(self, message_id, download_seconds=0.0, downloaded_bytes=None, total_seconds=0.0):
+        """Account an exported message.
+
+        Args:
+            message_id: ID of the message
+            download_seconds: Wall time spent downloading its media
+            downloaded_bytes: Bytes actually downloaded (defaults to the known size)
+            total_seconds: Wall time spent on the whole message
+        """
+        if message_id not in self._sizes:
+            return
+        size = self._sizes[message_id]
+        self.message_dropped(message_id)
+        if downloaded_bytes is None:
+            downloaded_bytes = size
+        if downloaded_bytes and download_seconds > 0:
+            self.downloaded_bytes += downloaded_bytes
+            self.download_seconds += download_seconds
+        self._overhead_total += max(total_seconds - download_seconds, 0.0)
+        self._overhead_count += 1
+
+    def message_dropped(self, message_id):
+        """Remove a failed or cancelled message from the queue without measuring it."""
+        if message_id not in self._sizes:
+            return
+        size = self._sizes.pop(message_id)
+        self.remaining_messages = max(self.remaining_messages - 1, 0)
+        self.remaining_bytes = max(self.remaining_bytes - size, 0)
+
+    def throughput(self, live_speed=None):
+        """Measured aggregate download throughput in bytes/second."""
+        elapsed = time.monotonic() - self.started
+        if self.downloaded_bytes >= 1024 * 1024 and elapsed > 0:
+            # Long-run average across all workers, nudged by the live rate
+            average = self.downloaded_bytes / elapsed
+            if live_speed:
+                return 0.8 * average + 0.2 * live_speed
+            return average
+        if live_speed:
+            return live_speed
+        return self.DEFAULT_THROUGHPUT
+
+    def overhead_per_message(self):
+        """Measured non-download cost per message in seconds."""
+        if self._overhead_count:
+            return self._overhead_total / self._overhead_count
+        return self.DEFAULT_OVERHEAD
+
+    def estimate(self, live_speed=None):
+        """Estimated seconds until the queue is finished."""
+        if self.remaining_messages == 0:
+            return 0.0
+        byte_seconds = self.remaining_bytes / max(self.throughput(live_speed), 1.0)
+        overhead_seconds = self.remaining_messages * self.overhead_per_message() / self.workers
+        return byte_seconds + overhead_seconds
+
+    def work_fraction(self):
+        """Share of the queue finished, weighted by bytes and message count."""
+        if self.total_messages == 0:
+            return 1.0
+        # One message counts like 64 KB so text-only queues still progress
+        unit = 64 * 1024
+        total = self.total_bytes + self.total_messages * unit
+        remaining = self.remaining_bytes + self.remaining_messages * unit
+        return 1.0 - remaining / total
+
+    def snapshot(self, live_speed=None):
+        """Values exposed to the CLI, GUI and web API."""
+        return {
+            'eta_seconds': self.estimate(live_speed),
+            'work_percent': self.work_fraction() * 100,
+            'remaining_messages': self.remaining_messages,
+            'remaining_bytes': self.remaining_bytes,
+            'queue_bytes': self.total_bytes,
+            'history_total': self.history_total
+        }
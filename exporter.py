@@ -6,10 +6,12 @@ import time
 import asyncio
 from pathlib import Path
 from telethon.tl.types import Message
+from telethon.utils import get_display_name
 from telethon.errors import (
     ServerError, 
     FloodWaitError,
-    TimedOutError
+    TimedOutError,
+    FileReferenceExpiredError
 )
 
 # Import configuration
@@ -19,10 +21,35 @@ except ImportError:
     print("⚠️  ERROR: config.py file not found!")
     exit(1)
 
-from utils import sanitize_filename
-from database import is_message_exported, mark_message_exported
-from formatters import message_to_html_with_media, message_to_markdown
-from media_handler import download_media
+try:
+    from config import EXPORT_CHAT_CONCURRENCY
+except ImportError:
+    EXPORT_CHAT_CONCURRENCY = 3
+
+from utils import sanitize_filename, folder_size
+from database import (CHATS_SUBDIR, export_directories, init_database, get_export_watermark, set_export_watermark,
+                      get_export_checkpoint, set_export_checkpoint, clear_export_checkpoint,
+                      is_message_exported, mark_message_exported,
+                      record_export_failure, clear_export_failure, get_failed_exports,
+                      get_journal_entry, journal_stage, clear_journal_entry, store_cached_message)
+from formatters import (message_text, render_message_pages, render_version, output_digest, write_shared_stylesheet,
+                        stylesheet_href)
+from archive_pages import ARCHIVE_PAGES, store_archive_message, update_archive_pages
+from search_index import SEARCH_INDEX, update_search_index
+from message_cache import MESSAGE_CACHE, serialize_message
+from bulk_export import sink_enabled, append_message
+from page_store import uses_page_store, check_storage_mode, store_exported_message, remove_inlined_media
+from layout import new_message_folder, relative_folder
+from media_handler import download_media, file_checksum, find_completed_media, format_file_size, message_media_id
+from transfer_watchdog import TransferWatchdog
+from concurrency import AdaptiveConcurrencyController, flood_gate_for
+from progress import get_aggregator
+from eta import ExportEtaEstimator, message_media_size
+
+# Telegram accepts at most 100 message IDs per get_messages request
+MESSAGE_ID_BATCH_SIZE = 100
+
+SAVED_MESSAGES_TITLE = "Saved Messages"
 
 
 async def reconnect_client(client, max_retries=3, delay=5):
@@ -50,14 +77,23 @@ async def reconnect_client(client, max_retries=3, delay=5):
     return False
 
 
-async def safe_operation(client, operation, *args, max_retries=3, **kwargs):
-    """Execute an operation with automatic reconnection on network errors."""
+async def safe_operation(client, operation, *args, max_retries=3, on_congestion=None, **kwargs):
+    """Execute an operation with automatic reconnection on network errors.
+    
+    ``on_congestion``, if given, is called with a short reason whenever a
+    flood wait or timeout is hit so callers can back off. Flood waits pause
+    every operation on the same client, not only the one that hit it.
+    """
+    flood_gate = flood_gate_for(client)
     for attempt in range(max_retries):
         try:
+            await flood_gate.wait()
             return await operation(*args, **kwargs)
             
         except (ConnectionError, TimedOutError, OSError) as e:
             print(f"⚠️ Connection error: {e}")
+            if on_congestion is not None:
+                on_congestion(type(e).__name__)
             
             if attempt < max_retries - 1:
                 print(f"🔄 Retrying operation (attempt {attempt + 2}/{max_retries})...")
@@ -75,9 +111,12 @@ async def safe_operation(client, operation, *args, max_retries=3, **kwargs):
                 
         except FloodWaitError as e:
             wait_time = e.seconds
+            if on_congestion is not None:
+                on_congestion("flood wait")
             print(f"⚠️ Flood wait error: need to wait {wait_time} seconds")
             print(f"⏳ Waiting {wait_time} seconds before retry...")
-            await asyncio.sleep(wait_time)
+            flood_gate.block(wait_time)
+            await flood_gate.wait()
             
         except ServerError as e:
             print(f"⚠️ Server error: {e}")
@@ -90,38 +129,166 @@ async def safe_operation(client, operation, *args, max_retries=3, **kwargs):
     raise Exception(f"Operation failed after {max_retries} attempts")
 
 
-async def export_saved_messages(client, db_path, from_date=None, force_reexport=False, output_dir=None, cancel_event=None):
-    """Export saved messages from Telegram with automatic reconnection."""
-    if output_dir is None:
-        output_dir = OUTPUT_DIR
-        
+async def fetch_messages_by_ids(client, entity, ids, batch_size=MESSAGE_ID_BATCH_SIZE):
+    """Fetch messages by ID in batched get_messages calls.
+    
+    Returns a dict mapping message ID to Message. IDs that no longer exist
+    (deleted messages or service entries) are left out.
+    """
+    fetched = {}
+    ids = list(ids)
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        result = await safe_operation(client, client.get_messages, entity, ids=batch)
+        for message in result or []:
+            if isinstance(message, Message):
+                fetched[message.id] = message
+    return fetched
+
+
+async def refresh_file_references(client, entity, messages, start_index):
+    """Re-fetch a batch of queued messages to renew expired file references.
+    
+    File references expire a few hours after a message was fetched, so when one
+    download fails the rest of the queue is likely stale too. This refreshes the
+    failing message together with the next queued messages that carry media in
+    a single request and swaps the fresh objects into ``messages`` in place.
+    
+    Returns the refreshed message at ``start_index``.
+    """
+    batch_indexes = []
+    for index in range(start_index, len(messages)):
+        if index == start_index or messages[index].media:
+            batch_indexes.append(index)
+        if len(batch_indexes) >= MESSAGE_ID_BATCH_SIZE:
+            break
+    
+    ids = [messages[index].id for index in batch_indexes]
+    print(f"  🔄 Refreshing file references for {len(ids)} message(s)...")
+    fetched = await fetch_messages_by_ids(client, entity, ids)
+    
+    for index in batch_indexes:
+        fresh = fetched.get(messages[index].id)
+        if fresh is not None:
+            messages[index] = fresh
+    
+    print(f"  ✓ Refreshed {len(fetched)}/{len(ids)} message(s)")
+    return messages[start_index]
+
+
+async def export_saved_messages(client, db_path, from_date=None, force_reexport=False, output_dir=None, cancel_event=None,
+                                budget=None, on_exported=None, run_budget=None):
+    """Export saved messages from Telegram with automatic reconnection.
+    
+    ``budget`` and ``on_exported`` are passed to export_message_queue for
+    the pipelined backup mode, ``run_budget`` limits the run (see export_chat).
+    """
     print("Fetching saved messages...")
     
     # Get saved messages (chat with yourself) with retry logic
-    me = await safe_operation(client, client.get_me)
     saved_messages = await safe_operation(client, client.get_entity, 'me')
+    return await export_chat(client, saved_messages, db_path, from_date, force_reexport, output_dir, cancel_event,
+                             budget=budget, on_exported=on_exported, run_budget=run_budget)
+
+
+async def export_chat(client, entity, db_path, from_date=None, force_reexport=False, output_dir=None,
+                      cancel_event=None, controller=None, chat_title=SAVED_MESSAGES_TITLE,
+                      budget=None, on_exported=None, run_budget=None):
+    """Export the messages of one chat with automatic reconnection.
+    
+    Only messages newer than the chat's watermark are fetched, unless the run
+    is forced or limited by date. The watermark advances after every scan
+    that ran to completion.
+    
+    A run stopped by ``run_budget`` saves a checkpoint instead: the ID below
+    which the scanned range still has to be exported and the newest ID it
+    covered. The next run first finishes that range, oldest part last, and
+    then exports whatever arrived above it.
+    
+    Args:
+        client: Connected TelegramClient
+        entity: Chat to export
+        db_path: Database of this chat
+        from_date: Only export messages from this date onwards
+        force_reexport: Re-export already exported messages
+        output_dir: Directory receiving the message folders
+        cancel_event: Optional event that stops the export
+        controller: Download concurrency controller shared with other chats
+        chat_title: Title shown in the HTML header
+        budget: Optional DiskBudget that pauses downloads when the disk is full
+        on_exported: Optional callback receiving each finished message folder
+        run_budget: Optional RunBudget limiting duration and transferred bytes
+    
+    Returns:
+        Dictionary with 'exported', 'failed' and 'stalls' counts, plus
+        'stopped' (the reason) and 'remaining' if the run budget ran out
+    """
+    if output_dir is None:
+        output_dir = OUTPUT_DIR
     
     # Create output directory
     output_path = Path(output_dir)
-    output_path.mkdir(exist_ok=True)
+    output_path.mkdir(parents=True, exist_ok=True)
+    
+    # Total history size is a single cheap request (limit=0 returns only the count)
+    history_total = None
+    try:
+        history_total = (await safe_operation(client, client.get_messages, entity, limit=0)).total
+        print(f"{chat_title} contains {history_total} messages")
+    except Exception as e:
+        print(f"⚠️ Could not get message count: {e}")
+    
+    use_watermark = not force_reexport and from_date is None
+    watermark = get_export_watermark(db_path) if use_watermark else 0
+    checkpoint = get_export_checkpoint(db_path) if use_watermark else None
+    # ID ranges to scan as (min_id, offset_id), each newest first; offset_id 0 starts at the newest message
+    if checkpoint:
+        scan_ranges = [(watermark, checkpoint['offset_id']), (checkpoint['high_water'], 0)]
+        print(f"Resuming {chat_title} below message ID {checkpoint['offset_id']} "
+              f"(previous run stopped: {checkpoint['reason'] or 'run budget reached'})")
+    else:
+        scan_ranges = [(watermark, 0)]
+        if watermark:
+            print(f"Fetching {chat_title} messages newer than ID {watermark}")
     
     # Fetch messages with connection handling
     messages = []
+    message_ranges = []
+    queued_ids = set()
     skipped_count = 0
+    scanned_count = 0
+    range_tops = [min_id for min_id, _ in scan_ranges]
+    scanned_ranges = 0
     
-    try:
-        async for message in client.iter_messages(saved_messages):
-            if isinstance(message, Message):
-                # Filter by date if specified
-                if from_date and message.date.date() < from_date:
-                    continue
-                
-                # Check if message was already exported (unless force reexport)
-                if not force_reexport and is_message_exported(db_path, message.id):
-                    skipped_count += 1
-                    continue
+    async def scan():
+        nonlocal skipped_count, scanned_count, scanned_ranges
+        while scanned_ranges < len(scan_ranges):
+            min_id, offset_id = scan_ranges[scanned_ranges]
+            async for message in client.iter_messages(entity, min_id=min_id, offset_id=offset_id):
+                scanned_count += 1
+                if history_total and scanned_count % 1000 == 0:
+                    print(f"  Scanned {scanned_count}/{history_total} messages...")
+                range_tops[scanned_ranges] = max(range_tops[scanned_ranges], message.id)
+                if isinstance(message, Message):
+                    # Filter by date if specified
+                    if from_date and message.date.date() < from_date:
+                        continue
                     
-                messages.append(message)
+                    # Check if message was already exported (unless force reexport)
+                    if not force_reexport and is_message_exported(db_path, message.id):
+                        skipped_count += 1
+                        continue
+                    
+                    if message.id not in queued_ids:
+                        queued_ids.add(message.id)
+                        messages.append(message)
+                        message_ranges.append(scanned_ranges)
+            scanned_ranges += 1
+    
+    scan_complete = False
+    try:
+        await scan()
+        scan_complete = True
     except (ConnectionError, OSError) as e:
         print(f"⚠️ Connection lost while fetching messages: {e}")
         print("🔄 Attempting to reconnect and continue...")
@@ -129,124 +296,541 @@ async def export_saved_messages(client, db_path, from_date=None, force_reexport=
         if await reconnect_client(client):
             # Retry fetching from where we left off
             print("Continuing message fetch...")
-            async for message in client.iter_messages(saved_messages):
-                if isinstance(message, Message):
-                    if from_date and message.date.date() < from_date:
-                        continue
-                    if not force_reexport and is_message_exported(db_path, message.id):
-                        skipped_count += 1
-                        continue
-                    messages.append(message)
+            await scan()
+            scan_complete = True
     
     print(f"Found {len(messages)} new messages to export")
     if skipped_count > 0:
         print(f"Skipped {skipped_count} already exported messages")
     
-    # Export each message
-    exported_count = 0
+    stats = await export_message_queue(client, entity, messages, db_path, output_path, cancel_event,
+                                       history_total=history_total, controller=controller,
+                                       chat_title=chat_title, budget=budget, on_exported=on_exported,
+                                       run_budget=run_budget)
+    
+    if cancel_event and cancel_event.is_set():
+        print(f"\n⚠️ Export cancelled. {stats['exported']} messages exported (partial).")
+    elif stats.get('stopped'):
+        next_index = stats.pop('next_index')
+        stats['remaining'] = len(messages) - next_index
+        if use_watermark and scan_complete:
+            # Everything queued before next_index is done (or in the retry queue)
+            if message_ranges[next_index] == 0:
+                high_water = checkpoint['high_water'] if checkpoint else range_tops[0]
+            else:
+                # The resumed range is finished, new messages start above its high water
+                set_export_watermark(db_path, checkpoint['high_water'])
+                high_water = range_tops[1]
+            offset_id = messages[next_index].id + 1
+            set_export_checkpoint(db_path, offset_id, high_water, stats['stopped'])
+            print(f"\n⏸️ Run budget reached ({stats['stopped']}). {stats['exported']} messages exported, "
+                  f"{stats['remaining']} left. Checkpoint saved at message ID {offset_id} - run again to continue.")
+        else:
+            print(f"\n⏸️ Run budget reached ({stats['stopped']}). {stats['exported']} messages exported, "
+                  f"{stats['remaining']} left for the next run.")
+    else:
+        # Failed messages sit in the retry queue, so the scan itself is done
+        high_water = max(range_tops)
+        if use_watermark and scan_complete:
+            if high_water > watermark:
+                set_export_watermark(db_path, high_water)
+            if checkpoint:
+                clear_export_checkpoint(db_path)
+        print(f"\n✓ Successfully exported {stats['exported']} messages to '{output_dir}' directory")
+    if stats['failed'] > 0:
+        print(f"⚠️ {stats['failed']} message(s) failed and were queued for retry (python main.py --retry-failed)")
+    return stats
+
+
+def chat_output_dir(output_dir, entity):
+    """Output subtree of a chat: <output_dir>/chats/<id>_<title>."""
+    title = sanitize_filename(get_display_name(entity) or 'chat')
+    return Path(output_dir) / CHATS_SUBDIR / f"{entity.id}_{title}"
+
+
+def chat_dir_id(chat_dir):
+    """ID of the chat a subtree was created for (see chat_output_dir)."""
+    return int(Path(chat_dir).name.split('_', 1)[0])
+
+
+async def export_chats(client, chats, output_dir=None, from_date=None, force_reexport=False, cancel_event=None,
+                       run_budget=None):
+    """Export several chats concurrently over one client.
+    
+    Saved Messages ('me') keeps using the output directory and its database.
+    Every other chat gets its own subtree with its own database, watermark
+    and failure queue. Up to EXPORT_CHAT_CONCURRENCY chats are scanned at
+    the same time; their media downloads share one adaptive concurrency
+    controller, whose slots are handed out in arrival order, and all
+    requests pause together on a flood wait.
+    
+    Args:
+        client: Connected TelegramClient
+        chats: Chat references accepted by get_entity ('me', usernames, IDs)
+        run_budget: Optional RunBudget shared by all chats
+    
+    Returns:
+        Dictionary mapping chat title to its export statistics
+    """
+    if output_dir is None:
+        output_dir = OUTPUT_DIR
+    
+    targets = []
+    me = await safe_operation(client, client.get_me)
+    for chat in chats:
+        try:
+            entity = await safe_operation(client, client.get_entity, chat)
+        except Exception as e:
+            print(f"❌ Could not resolve chat {chat}: {e}")
+            continue
+        if entity.id == me.id:
+            chat_dir, title = Path(output_dir), SAVED_MESSAGES_TITLE
+        else:
+            chat_dir, title = chat_output_dir(output_dir, entity), get_display_name(entity) or str(entity.id)
+        targets.append((entity, title, chat_dir))
+    
+    print(f"Exporting {len(targets)} chat(s), up to {EXPORT_CHAT_CONCURRENCY} at a time")
+    controller = AdaptiveConcurrencyController()
+    print(f"⚙️ Download concurrency: starting at {controller.limit} (range {controller.minimum}-{controller.maximum})")
+    get_aggregator().reset()
+    chat_slots = asyncio.Semaphore(EXPORT_CHAT_CONCURRENCY)
+    results = {}
+    
+    async def run(entity, title, chat_dir):
+        async with chat_slots:
+            if cancel_event and cancel_event.is_set():
+                return
+            chat_dir.mkdir(parents=True, exist_ok=True)
+            db_path = init_database(chat_dir)
+            if run_budget is not None and run_budget.should_stop():
+                results[title] = {'exported': 0, 'failed': 0, 'stalls': 0, 'stopped': run_budget.reason,
+                                  'output_dir': str(chat_dir), 'db_path': str(db_path)}
+                return
+            print(f"\n💬 Exporting {title} → {chat_dir}")
+            try:
+                stats = await export_chat(client, entity, db_path, from_date, force_reexport, chat_dir,
+                                          cancel_event, controller=controller, chat_title=title,
+                                          run_budget=run_budget)
+            except Exception as e:
+                print(f"❌ Export of {title} failed: {e}")
+                stats = {'exported': 0, 'failed': 0, 'stalls': 0, 'error': str(e)}
+            stats['output_dir'] = str(chat_dir)
+            stats['db_path'] = str(db_path)
+            results[title] = stats
+    
+    await asyncio.gather(*(run(*target) for target in targets))
+    
+    print("\n" + "="*60)
+    print("CHAT EXPORT SUMMARY")
+    print("="*60)
+    for title, stats in results.items():
+        status = f"❌ {stats['error']}" if stats.get('error') else f"{stats['exported']} exported, {stats['failed']} failed"
+        if stats.get('stopped'):
+            status += f" (stopped: {stats['stopped']})"
+        print(f"  {title}: {status}")
+    return results
+
+
+async def export_messages_by_id(client, db_path, message_ids, output_dir=None, cancel_event=None,
+                                entity=None, chat_title=SAVED_MESSAGES_TITLE):
+    """Re-export an explicit set of messages fetched by ID.
+    
+    Messages go through the normal download, render and database path and are
+    always re-exported, whether or not they were exported before. They are
+    fetched from ``entity`` (default Saved Messages).
+    
+    Returns:
+        Dictionary of export_message_queue with 'exported' and 'failed'
+        counts, plus 'missing': the list of requested IDs that were not found
+    """
+    if output_dir is None:
+        output_dir = OUTPUT_DIR
+    
+    message_ids = list(dict.fromkeys(message_ids))
+    print(f"Fetching {len(message_ids)} message(s) by ID...")
+    if entity is None:
+        entity = await safe_operation(client, client.get_entity, 'me')
+    output_path = Path(output_dir)
+    output_path.mkdir(exist_ok=True)
+    
+    fetched = await fetch_messages_by_ids(client, entity, message_ids)
+    missing = [message_id for message_id in message_ids if message_id not in fetched]
+    if missing:
+        preview = ', '.join(str(message_id) for message_id in missing[:10])
+        more = f" (+{len(missing) - 10} more)" if len(missing) > 10 else ""
+        print(f"⚠️ {len(missing)} message(s) not found: {preview}{more}")
+    
+    messages = [fetched[message_id] for message_id in message_ids if message_id in fetched]
+    print(f"Found {len(messages)} message(s) to export")
+    stats = await export_message_queue(client, entity, messages, db_path, output_path, cancel_event,
+                                       chat_title=chat_title)
+    stats['missing'] = missing
+    return stats
+
+
+async def retry_failed_exports(client, db_path, output_dir=None, cancel_event=None, include_not_due=False,
+                               entity=None, chat_title=SAVED_MESSAGES_TITLE):
+    """Re-export only the messages recorded in the failed_exports table.
+    
+    Messages are fetched directly by ID in batches instead of walking the whole
+    history, so recovering from a bad run costs a handful of API calls.
+    
+    Returns:
+        Dictionary with 'exported' and 'failed' counts and 'missing', the
+        list of IDs dropped from the queue because the messages no longer exist
+    """
+    failed_ids = get_failed_exports(db_path, eligible_only=not include_not_due)
+    if not failed_ids:
+        print("✓ No failed messages are due for retry")
+        return {'exported': 0, 'failed': 0, 'stalls': 0, 'missing': []}
+    
+    stats = await export_messages_by_id(client, db_path, failed_ids, output_dir, cancel_event, entity, chat_title)
+    
+    # Messages deleted since the failure can never succeed - drop them from the queue
+    for message_id in stats['missing']:
+        clear_export_failure(db_path, message_id)
+    if stats['missing']:
+        print(f"Removed {len(stats['missing'])} message(s) that no longer exist from the retry queue")
+    
+    print(f"\n✓ Retried {len(failed_ids)} message(s): {stats['exported']} exported, {stats['failed']} still failing")
+    return stats
+
+
+async def retry_failed_in_tree(client, output_dir=None, cancel_event=None, include_not_due=False):
+    """Retry the failed messages of the export and of every chat subtree below it.
+
+    Chats are looked up by the ID in their folder name, and only when they
+    have messages due for retry.
+
+    Returns:
+        Dictionary mapping export directory to the statistics of
+        retry_failed_exports
+    """
+    if output_dir is None:
+        output_dir = OUTPUT_DIR
+    results = {}
+    for export_dir in export_directories(output_dir):
+        db_path = init_database(export_dir)
+        if export_dir == Path(output_dir):
+            results[str(export_dir)] = await retry_failed_exports(client, db_path, export_dir, cancel_event,
+                                                                  include_not_due)
+            continue
+        if not get_failed_exports(db_path, eligible_only=not include_not_due):
+            continue
+        try:
+            entity = await safe_operation(client, client.get_entity, chat_dir_id(export_dir))
+        except Exception as e:
+            print(f"❌ Could not resolve the chat of {export_dir}: {e}")
+            continue
+        title = get_display_name(entity) or str(entity.id)
+        print(f"\n💬 Retrying {title} → {export_dir}")
+        results[str(export_dir)] = await retry_failed_exports(client, db_path, export_dir, cancel_event,
+                                                              include_not_due, entity, title)
+    return results
+
+
+def message_filename_base(message):
+    """Build the folder name of a message from its date, ID and text preview."""
+    date_str = message.date.strftime('%Y%m%d_%H%M%S')
+    preview = sanitize_filename(message.text[:30]) if message.text else "message"
+    return f"{date_str}_msg{message.id}_{preview}"
+
+
+async def download_message_media(client, message, message_folder, cancel_event=None, watchdog=None, controller=None):
+    """Download the media of a message.
+    
+    With a watchdog the transfer is restarted if it stalls. With an adaptive
+    concurrency controller the download waits for a free slot and reports
+    its throughput, flood waits, timeouts and stalls to the controller.
+    """
+    if watchdog is None:
+        return await safe_operation(
+            client,
+            download_media,
+            client, message, message_folder, "media", cancel_event
+        )
+    
+    def start_download(transfer):
+        return download_media(client, message, message_folder, "media", cancel_event, transfer)
+    
+    if controller is None:
+        return await safe_operation(client, watchdog.run, f"message {message.id}", start_download)
+    
+    async with controller.slot():
+        return await safe_operation(
+            client, watchdog.run, f"message {message.id}", start_download,
+            on_congestion=controller.record_congestion,
+            on_bytes=controller.add_bytes,
+            on_stall=lambda transfer: controller.record_congestion("stall")
+        )
+
+
+async def export_message(client, entity, messages, index, db_path, output_path, cancel_event=None,
+                         watchdog=None, controller=None, chat_title=SAVED_MESSAGES_TITLE, budget=None):
+    """Export a single queued message through every stage.
+    
+    Stage completion is journaled (folder, media) so a run that dies
+    halfway resumes the message where it stopped and never downloads
+    finished media again; the pages are simply written again. The journal entry is dropped once the
+    message is committed to exported_messages.
+    
+    Returns:
+        Tuple (message_folder, media_error, download_seconds), or None if cancelled
+    """
+    message = messages[index]
+    journal = get_journal_entry(db_path, message.id)
+    
+    # Create filename based on date and message preview
+    filename_base = message_filename_base(message)
+    print(f"  - Final filename base: {filename_base}")
+    
+    # Create individual message folder (reuse the journaled one if the text preview changed)
+    message_folder = new_message_folder(output_path, filename_base)
+    if journal and journal['folder_path'] and Path(journal['folder_path']).is_dir():
+        message_folder = Path(journal['folder_path'])
+        filename_base = message_folder.name
+        print(f"  - Resuming partially exported message in: {message_folder}")
+    # In the 'sqlite' storage mode the pages go into export_pages.db; only downloads need a folder.
+    # Without the html and markdown sinks (only ndjson/csv) neither do text-only messages.
+    store_pages = uses_page_store()
+    writes_pages = store_pages or sink_enabled('html') or sink_enabled('markdown')
+    has_folder = bool(message.media) or (writes_pages and not store_pages)
+    if has_folder:
+        message_folder.mkdir(parents=True, exist_ok=True)
+        journal_stage(db_path, message.id, folder_path=str(message_folder), folder_created=True)
+        print(f"  - Created folder: {message_folder}")
+    
+    # Download media if present with retry logic
+    media_filename = None
+    media_error = None
+    download_seconds = 0.0
+    if message.media:
+        # Hashing a large file would block the other workers
+        media_filename = await asyncio.to_thread(find_completed_media, message_folder, journal)
+        if media_filename:
+            print(f"  - Reusing media downloaded in a previous run: {media_filename}")
+        else:
+            if budget is not None:
+                # Pause while the local working set is at the disk budget
+                await budget.reserve(message.id, message_media_size(message))
+            print(f"  - Downloading media...")
+            download_start = time.time()
+            try:
+                try:
+                    media_filename = await download_message_media(
+                        client, message, message_folder, cancel_event, watchdog, controller
+                    )
+                except FileReferenceExpiredError:
+                    # Renew references for this and upcoming messages, then retry once
+                    message = await refresh_file_references(client, entity, messages, index)
+                    media_filename = await download_message_media(
+                        client, message, message_folder, cancel_event, watchdog, controller
+                    )
+                print(f"  - Media downloaded: {media_filename}")
+            except Exception as e:
+                if cancel_event and cancel_event.is_set():
+                    print(f"  ⚠️ Media download cancelled")
+                    return None
+                media_error = e
+                print(f"  ⚠️ Failed to download media: {e}")
+                print(f"  - Continuing without media...")
+            
+            download_seconds = time.time() - download_start
+            
+            if cancel_event and cancel_event.is_set() and media_filename is None:
+                print(f"  ⚠️ Media download cancelled")
+                return None
+            # Only downloadable media (photos/documents) count as a failure when nothing was saved
+            if media_filename is None and media_error is None and message.file is not None:
+                media_error = RuntimeError("Media download returned no file")
+            
+            if media_filename:
+                media_path = message_folder / media_filename
+                journal_stage(
+                    db_path, message.id,
+                    media_done=True,
+                    media_filename=media_filename,
+                    media_size=media_path.stat().st_size,
+                    media_sha256=await asyncio.to_thread(file_checksum, media_path)
+                )
+    else:
+        print(f"  - No media to download")
+    
+    # Generate HTML with media support, and the Markdown from the same pass over the text
+    print(f"  - Generating HTML content...")
+    text = message_text(message)
+    # Stored pages are served from /messages/<id>/, one level below the stylesheet whatever the layout
+    page_folder = output_path / filename_base if store_pages else message_folder
+    html_content, md_content = render_message_pages(message, media_filename, chat_title,
+                                                    stylesheet_href(output_path, page_folder), text=text)
+    html_path = message_folder / "message.html"
+    # Recorded as the message's file_path: where its folder is, or NULL when nothing was written for it
+    file_path = html_path if has_folder or store_pages else None
+    folder_name = relative_folder(file_path) if file_path else None
+    media_inlined = False
+    if store_pages:
+        pages = [(name, content) for name, content, sink in (("message.html", html_content, 'html'),
+                                                             ("message.md", md_content, 'markdown'))
+                 if sink_enabled(sink)]
+        media_inlined = store_exported_message(output_path, message.id, pages,
+                                               message_folder / media_filename if media_filename else None)
+        print(f"  - Pages stored in the page store{' with the media' if media_inlined else ''}")
+    else:
+        if sink_enabled('html'):
+            with open(html_path, 'w', encoding='utf-8') as f:
+                f.write(html_content)
+            print(f"  - HTML file saved")
+        
+        # Generate Markdown
+        if sink_enabled('markdown'):
+            print(f"  - Generating Markdown content...")
+            md_path = message_folder / "message.md"
+            with open(md_path, 'w', encoding='utf-8') as f:
+                f.write(md_content)
+            print(f"  - Markdown file saved")
+    
+    # One line per message in messages.ndjson / messages.csv, if enabled
+    append_message(output_path, message, folder_name, media_filename)
+    
+    if ARCHIVE_PAGES:
+        # The page itself is rewritten once the queue is done
+        store_archive_message(db_path, message, folder_name, media_filename, text)
+    
+    if MESSAGE_CACHE:
+        # Lets --rerender rebuild the pages without fetching the message again
+        store_cached_message(db_path, message.id, chat_title, serialize_message(message))
+    
+    # Mark message as exported in database
+    print(f"  - Updating database...")
+    mark_message_exported(db_path, message, media_filename, str(file_path) if file_path else None,
+                          render_version(), output_digest(html_content, md_content),
+                          message_media_id(message) if media_filename else None)
+    clear_journal_entry(db_path, message.id)
+    if media_inlined:
+        # Only now, so a run that dies before this point still finds the download
+        remove_inlined_media(message_folder / media_filename)
+    
+    # Keep messages with missing media in the retry queue
+    if media_error is not None:
+        record_export_failure(db_path, message.id, media_error)
+    else:
+        clear_export_failure(db_path, message.id)
+    
+    return message_folder, media_error, download_seconds
+
+
+async def export_message_queue(client, entity, messages, db_path, output_path, cancel_event=None,
+                               history_total=None, controller=None, chat_title=SAVED_MESSAGES_TITLE,
+                               budget=None, on_exported=None, run_budget=None):
+    """Download, render and record a list of messages.
+    
+    Messages are processed by a pool of workers while an adaptive controller
+    decides how many media downloads may run at the same time. Failures are
+    written to the failed_exports table so they can be retried later without
+    rescanning the history.
+    
+    A ``controller`` passed in is shared with queues of other chats running
+    at the same time; the run-level progress fields are then left to the
+    caller.
+    
+    With a disk ``budget`` media downloads wait for free space and every
+    written folder is charged to it. ``on_exported`` is called with the path
+    of each finished message folder, e.g. to back it up right away.
+    
+    Once ``run_budget`` is used up no further message is started; messages
+    already running finish normally. The stats then contain 'stopped' (the
+    reason) and 'next_index', the first message of the queue not processed.
+    
+    Returns:
+        Dictionary with 'exported', 'failed' and 'stalls' counts and the
+        'concurrency' report of the download controller
+    """
+    check_storage_mode()
+    stats = {'exported': 0, 'failed': 0, 'stalls': 0}
+    watchdog = TransferWatchdog()
+    shared_controller = controller is not None
+    if not shared_controller:
+        controller = AdaptiveConcurrencyController()
+    total = len(messages)
+    aggregator = get_aggregator()
+    worker_count = min(controller.maximum, total)
+    estimator = ExportEtaEstimator(messages, workers=worker_count, history_total=history_total)
+    if not shared_controller:
+        aggregator.reset()
+        aggregator.set_fields(messages_total=total, messages_exported=0, messages_failed=0,
+                              concurrency_limit=controller.limit, **estimator.snapshot())
+    
     print(f"\nStarting export process...")
+    stylesheet = write_shared_stylesheet(output_path)
+    if stylesheet is not None:
+        print(f"🎨 Message pages link the shared stylesheet {stylesheet.name}")
+    if not shared_controller:
+        print(f"⚙️ Download concurrency: starting at {controller.limit} (range {controller.minimum}-{controller.maximum})")
     start_time = time.time()
+    pending = iter(range(total))
+    cancel_reported = False
+    next_index = None
     
-    for idx, message in enumerate(messages, 1):
-        # Cooperative cancellation check
-        if cancel_event and cancel_event.is_set():
-            print("\n⚠️ Cancellation requested. Stopping export after current message.")
-            break
+    async def export_with_retries(index):
+        """Export one message, retrying on connection errors."""
         retry_count = 0
         max_message_retries = 3
         
         while retry_count < max_message_retries:
+            message = messages[index]
             if cancel_event and cancel_event.is_set():
                 print(f"⚠️ Cancelled before processing message {message.id}")
-                break
+                return
             try:
                 msg_start_time = time.time()
-                print(f"\n[{idx}/{len(messages)}] Processing message {message.id}... (Started at {time.strftime('%H:%M:%S')})")
-                
-                # Create filename based on date and message preview
-                date_str = message.date.strftime('%Y%m%d_%H%M%S')
-                print(f"  - Creating filename from date: {date_str}")
-                
-                # Get a preview of the message for filename
-                if message.text:
-                    preview = sanitize_filename(message.text[:30])
-                    print(f"  - Using text preview: {preview}")
-                else:
-                    preview = "message"
-                    print(f"  - No text, using default name: {preview}")
-                
-                filename_base = f"{date_str}_msg{message.id}_{preview}"
-                print(f"  - Final filename base: {filename_base}")
-                
-                # Create individual message folder
-                message_folder = output_path / filename_base
-                message_folder.mkdir(exist_ok=True)
-                print(f"  - Created folder: {message_folder}")
-                
-                # Download media if present with retry logic
-                media_filename = None
-                if message.media:
-                    print(f"  - Downloading media...")
-                    try:
-                        media_filename = await safe_operation(
-                            client,
-                            download_media,
-                            client, message, message_folder, "media", cancel_event
-                        )
-                        print(f"  - Media downloaded: {media_filename}")
-                    except Exception as e:
-                        if cancel_event and cancel_event.is_set():
-                            print(f"  ⚠️ Media download cancelled")
-                            break
-                        print(f"  ⚠️ Failed to download media: {e}")
-                        print(f"  - Continuing without media...")
-                else:
-                    print(f"  - No media to download")
-                
-                # Generate HTML with media support
-                print(f"  - Generating HTML content...")
-                html_content = await message_to_html_with_media(message, media_filename)
-                html_path = message_folder / "message.html"
-                with open(html_path, 'w', encoding='utf-8') as f:
-                    f.write(html_content)
-                print(f"  - HTML file saved")
+                print(f"\n[{index + 1}/{total}] Processing message {message.id}... (Started at {time.strftime('%H:%M:%S')})")
                 
-                # Generate Markdown
-                print(f"  - Generating Markdown content...")
-                md_content = message_to_markdown(message)
-                md_path = message_folder / "message.md"
-                with open(md_path, 'w', encoding='utf-8') as f:
-                    f.write(md_content)
-                print(f"  - Markdown file saved")
+                result = await export_message(client, entity, messages, index, db_path, output_path,
+                                              cancel_event, watchdog, controller, chat_title, budget)
+                if result is None:
+                    return
+                message_folder, media_error, download_seconds = result
+                if media_error is not None:
+                    stats['failed'] += 1
                 
-                # Mark message as exported in database
-                print(f"  - Updating database...")
-                mark_message_exported(db_path, message, media_filename, str(html_path))
+                if budget is not None or run_budget is not None:
+                    written = folder_size(message_folder)
+                    if budget is not None:
+                        await budget.commit(message.id, written)
+                    if run_budget is not None:
+                        # The expected size was charged when the message was started
+                        run_budget.add_bytes(written - message_media_size(message))
+                if on_exported is not None:
+                    on_exported(message_folder)
                 
-                exported_count += 1
+                stats['exported'] += 1
+                exported_count = stats['exported']
                 msg_end_time = time.time()
                 msg_duration = msg_end_time - msg_start_time
                 elapsed_total = msg_end_time - start_time
                 avg_time_per_message = elapsed_total / exported_count
-                estimated_remaining = (len(messages) - exported_count) * avg_time_per_message
                 
-                print(f"✓ Exported {exported_count}/{len(messages)}: {filename_base}")
+                # Remaining time from the bytes left in the queue, not the message count
+                estimator.message_done(message.id, download_seconds, total_seconds=msg_duration)
+                estimated_remaining = estimator.estimate(aggregator.speed)
+                if not shared_controller:
+                    aggregator.set_fields(messages_exported=exported_count, messages_failed=stats['failed'],
+                                          concurrency_limit=controller.limit, concurrency_active=controller.active,
+                                          **estimator.snapshot(aggregator.speed))
+                print(f"✓ Exported {exported_count}/{total}: {message_folder.name}")
                 print(f"  - Message took: {msg_duration:.2f}s | Avg: {avg_time_per_message:.2f}s | Est. remaining: {estimated_remaining/60:.1f}min")
                 
                 # Show progress every 10 messages
                 if exported_count % 10 == 0:
-                    if cancel_event and cancel_event.is_set():
-                        print("⚠️ Cancellation detected during progress update.")
-                        break
-                    print(f"\n*** PROGRESS UPDATE: {exported_count}/{len(messages)} messages exported ({exported_count/len(messages)*100:.1f}%) ***")
-                    print(f"*** Time elapsed: {elapsed_total/60:.1f}min | Estimated remaining: {estimated_remaining/60:.1f}min ***\n")
-                
-                # Success - break retry loop
-                break
+                    print(f"\n*** PROGRESS UPDATE: {exported_count}/{total} messages exported ({exported_count/total*100:.1f}%) ***")
+                    print(f"*** Time elapsed: {elapsed_total/60:.1f}min | Estimated remaining: {estimated_remaining/60:.1f}min ***")
+                    print(f"*** Download concurrency: {controller.limit} ({controller.active} active) ***\n")
+                return
                 
             except (ConnectionError, OSError, TimedOutError) as e:
                 retry_count += 1
                 print(f"⚠️ Connection error while processing message {message.id}: {e}")
+                controller.record_congestion(type(e).__name__)
                 
                 if retry_count < max_message_retries:
                     print(f"🔄 Retrying message (attempt {retry_count + 1}/{max_message_retries})...")
@@ -256,25 +840,76 @@ async def export_saved_messages(client, db_path, from_date=None, force_reexport=
                         reconnected = await reconnect_client(client)
                         if not reconnected:
                             print(f"❌ Failed to reconnect, skipping message {message.id}")
-                            break
+                            record_export_failure(db_path, message.id, e)
+                            stats['failed'] += 1
+                            return
                     
                     # Check cancellation before retry wait
                     if cancel_event and cancel_event.is_set():
                         print("⚠️ Cancelled during retry.")
-                        break
+                        return
                     
                     await asyncio.sleep(3)
                 else:
                     print(f"❌ Failed to export message {message.id} after {max_message_retries} attempts, skipping...")
+                    record_export_failure(db_path, message.id, e)
+                    stats['failed'] += 1
                     
             except Exception as e:
                 print(f"❌ Error exporting message {message.id}: {e}")
                 print(f"  - Skipping this message and continuing...")
-                break
-            print(f"Error exporting message {message.id}: {e}")
-            continue
+                record_export_failure(db_path, message.id, e)
+                stats['failed'] += 1
+                return
     
-    if cancel_event and cancel_event.is_set():
-        print(f"\n⚠️ Export cancelled. {exported_count} messages exported (partial).")
-    else:
-        print(f"\n✓ Successfully exported {exported_count} messages to '{OUTPUT_DIR}' directory")
\ No newline at end of file
+    async def worker():
+        nonlocal cancel_reported, next_index
+        # All workers pull from the same iterator, so messages start in queue order
+        for index in pending:
+            # Cooperative cancellation check
+            if cancel_event and cancel_event.is_set():
+                if not cancel_reported:
+                    cancel_reported = True
+                    print("\n⚠️ Cancellation requested. Stopping export after current messages.")
+                return
+            if run_budget is not None:
+                expected_bytes = message_media_size(messages[index])
+                if run_budget.should_stop(expected_bytes):
+                    if next_index is None:
+                        print(f"\n⏸️ Run budget reached ({run_budget.reason}). Finishing messages in progress...")
+                    next_index = index if next_index is None else min(next_index, index)
+                    return
+                # Charge downloads in flight so parallel workers cannot all start past the limit
+                run_budget.add_bytes(expected_bytes)
+            await export_with_retries(index)
+            if budget is not None:
+                # Release what a failed or cancelled download still holds
+                await budget.cancel(messages[index].id)
+            # Failed or cancelled messages leave the ETA queue as well, without counting as measured
+            estimator.message_dropped(messages[index].id)
+    
+    if estimator.total_bytes:
+        print(f"📦 Media to download: {format_file_size(estimator.total_bytes)} in {total} message(s)")
+    await asyncio.gather(*(worker() for _ in range(worker_count)))
+    
+    if next_index is not None:
+        stats['stopped'] = run_budget.reason
+        stats['next_index'] = next_index
+    stats['stalls'] = watchdog.stats['stalls']
+    stats['concurrency'] = controller.snapshot()
+    if ARCHIVE_PAGES:
+        archive = update_archive_pages(output_path, db_path, chat_title)
+        if archive['pages_written']:
+            print(f"📚 Archive pages: {archive['pages_written']} of {archive['pages_total']} updated")
+    if SEARCH_INDEX:
+        search = update_search_index(output_path, db_path, chat_title)
+        if search['indexed'] or search['shards_written'] or search['docs_written']:
+            print(f"🔍 Search index: {search['indexed']} message(s) indexed, "
+                  f"{search['shards_written']} shard(s) and {search['docs_written']} result file(s) written")
+    if stats['stalls']:
+        print(f"\n⚠️ Restarted {stats['stalls']} stalled download(s)")
+    report = stats['concurrency']
+    if report['decisions']:
+        print(f"⚙️ Download concurrency: final {report['limit']} (peak {report['peak_limit']}), "
+              f"{report['increases']} increase(s), {report['decreases']} decrease(s)")
+    return stats
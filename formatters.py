@@ -2,424 +2,362 @@
 HTML and Markdown formatters for Telegram messages
 """
 
+import hashlib
 import html
+import os
 import re
+from functools import lru_cache
+from pathlib import Path
 
+from templates import get_template, template_path
+from text_render import process_telegram_formatting, render_text
 
-def process_telegram_formatting(text):
-    """Process Telegram formatting like **bold**, `code`, etc."""
-    if not text:
-        return ""
-    
-    # Escape HTML first
-    text = html.escape(text)
-    
-    # Process bold text **text**
-    text = re.sub(r'\*\*(.*?)\*\*', r'<span class="bold">\1</span>', text)
-    
-    # Process code `text`
-    text = re.sub(r'`([^`]+)`', r'<span class="code">\1</span>', text)
-    
-    # Process code blocks ```text```
-    text = re.sub(r'```(.*?)```', r'<div class="code-block">\1</div>', text, flags=re.DOTALL)
-    
-    # Process links (simple http/https detection)
-    text = re.sub(r'(https?://[^\s]+)', r'<a href="\1" class="message-link" target="_blank">\1</a>', text)
+
+# Import configuration
+try:
+    from config import HTML_STYLE_MODE
+except ImportError:
+    HTML_STYLE_MODE = 'inline'
+
+try:
+    from config import HTML_MINIFY
+except ImportError:
+    HTML_MINIFY = False
+
+# Styles of the message pages, embedded in each page or written once as a shared stylesheet
+MESSAGE_CSS = """body {
+    font-family: 'Segoe UI', Roboto, -apple-system, BlinkMacSystemFont, sans-serif;
+    margin: 0;
+    padding: 20px;
+    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+    min-height: 100vh;
+}
+.chat-container {
+    max-width: 600px;
+    margin: 0 auto;
+    background: #1e2832;
+    border-radius: 12px;
+    overflow: hidden;
+    box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
+}
+.chat-header {
+    background: #2b5278;
+    padding: 15px 20px;
+    color: #ffffff;
+    font-weight: 500;
+    font-size: 16px;
+    border-bottom: 1px solid #3d5980;
+}
+.message-bubble {
+    background: #2f3c4c;
+    margin: 12px 20px;
+    padding: 12px 16px;
+    border-radius: 12px;
+    border-top-left-radius: 4px;
+    position: relative;
+    max-width: 85%;
+}
+.message-content {
+    color: #ffffff;
+    font-size: 14px;
+    line-height: 1.4;
+    white-space: pre-wrap;
+    word-wrap: break-word;
+}
+.message-time {
+    color: #8596a8;
+    font-size: 12px;
+    margin-top: 8px;
+    text-align: right;
+    display: flex;
+    justify-content: space-between;
+    align-items: center;
+}
+.message-forward {
+    color: #64b5ef;
+    font-size: 13px;
+    margin-bottom: 8px;
+    padding-left: 12px;
+    border-left: 3px solid #64b5ef;
+}
+.message-media {
+    margin-top: 8px;
+    padding: 8px;
+    background: rgba(255, 255, 255, 0.05);
+    border-radius: 8px;
+    font-size: 12px;
+    color: #8596a8;
+}
+.message-image {
+    margin-top: 8px;
+    border-radius: 8px;
+    overflow: hidden;
+}
+.message-image img {
+    width: 100%;
+    height: auto;
+    display: block;
+}
+.message-link {
+    color: #64b5ef;
+    text-decoration: none;
+    border-bottom: 1px solid rgba(100, 181, 239, 0.3);
+}
+.message-link:hover {
+    border-bottom-color: #64b5ef;
+}
+.bold {
+    font-weight: 600;
+}
+.code {
+    background: rgba(255, 255, 255, 0.1);
+    border-radius: 4px;
+    padding: 2px 4px;
+    font-family: 'Courier New', monospace;
+    font-size: 13px;
+}
+.code-block {
+    background: rgba(255, 255, 255, 0.1);
+    border-radius: 8px;
+    padding: 12px;
+    font-family: 'Courier New', monospace;
+    font-size: 13px;
+    margin: 8px 0;
+    overflow-x: auto;
+}
+.spoiler {
+    background: rgba(255, 255, 255, 0.2);
+    border-radius: 4px;
+    color: transparent;
+}
+.spoiler:hover {
+    color: inherit;
+}
+.message-quote {
+    margin: 4px 0;
+    padding-left: 10px;
+    border-left: 3px solid #64b5ef;
+}
+.post-link {
+    background: rgba(100, 181, 239, 0.1);
+    border: 1px solid rgba(100, 181, 239, 0.3);
+    border-radius: 8px;
+    padding: 8px;
+    margin-top: 8px;
+    font-size: 12px;
+}"""
+
+# The name changes with the CSS, so pages written by older versions keep their stylesheet
+STYLESHEET_VERSION = hashlib.sha1(MESSAGE_CSS.encode('utf-8')).hexdigest()[:8]
+STYLESHEET_NAME = f"telegram-export.{STYLESHEET_VERSION}.css"
+# Link of a page to a shared stylesheet (any version), from any folder depth
+STYLESHEET_LINK_RE = re.compile(r'href="(?:\.\./)+(telegram-export\.[0-9a-f]+\.css)"')
+
+
+def minify_css(css):
+    """Remove line breaks, indentation and spaces around CSS punctuation."""
+    css = re.sub(r'\s+', ' ', css)
+    return re.sub(r'\s*([{}:;,])\s*', r'\1', css).replace(';}', '}').strip()
+
+
+MESSAGE_CSS_MINIFIED = minify_css(MESSAGE_CSS)
+
+# Bump when a change to this module or text_render changes the pages they produce
+RENDERER_REVISION = 3
+
+# Templates whose output is tracked per exported message
+PAGE_TEMPLATES = ('message.html', 'message.md')
+
+
+def write_shared_stylesheet(output_dir, minify=None):
+    """Write the shared stylesheet to the export root unless it exists.
     
-    return text
+    Returns:
+        Path of the stylesheet, or None when HTML_STYLE_MODE is 'inline'
+    """
+    if HTML_STYLE_MODE != 'shared':
+        return None
+    if minify is None:
+        minify = HTML_MINIFY
+    path = Path(output_dir) / STYLESHEET_NAME
+    if not path.exists():
+        path.write_text(MESSAGE_CSS_MINIFIED if minify else MESSAGE_CSS + "\n", encoding='utf-8')
+    return path
+
+
+def stylesheet_href(output_dir, message_folder):
+    """Relative link from a message folder to the shared stylesheet (None in 'inline' mode)."""
+    if HTML_STYLE_MODE != 'shared':
+        return None
+    return Path(os.path.relpath(Path(output_dir) / STYLESHEET_NAME, message_folder)).as_posix()
+
+
+def relink_stylesheet(html_page, root_href):
+    """Point the shared stylesheet link of a page to the export root at ``root_href`` ('..', '../../..').
+
+    For a page that is moved (--migrate-layout) or served from another
+    path than its folder (web server).
+    """
+    return STYLESHEET_LINK_RE.sub(lambda match: f'href="{root_href}/{match.group(1)}"', html_page, count=1)
+
+
+def _inline_style(minify):
+    """The <style> element of a self-contained page."""
+    if minify:
+        return f'<style>{MESSAGE_CSS_MINIFIED}</style>'
+    return '<style>\n' + '\n'.join('        ' + line for line in MESSAGE_CSS.splitlines()) + '\n    </style>'
+
+
+INLINE_STYLES = {minify: _inline_style(minify) for minify in (False, True)}
+
+
+def _media_caption(message):
+    media = message.media
+    return media.caption if media is not None and getattr(media, 'caption', None) else None
+
+
+def _web_preview(message):
+    preview = message.web_preview
+    if not preview:
+        return None
+    return {'url': preview.url, 'title': preview.title or preview.url}
+
+
+def _post_link(message):
+    """Link to the original post of a message forwarded from a channel."""
+    forward = message.forward
+    from_id = getattr(forward, 'from_id', None) if forward else None
+    channel_id = getattr(from_id, 'channel_id', None) if from_id else None
+    if not channel_id:
+        return None
+    # This is a simplified approach - in reality you'd need to know the channel username
+    post_id = getattr(forward, 'channel_post', None) or message.id
+    return f"https://t.me/c/{channel_id}/{post_id}"
+
+
+def message_text(message):
+    """Message text and its entities rendered in one pass.
+
+    Returns:
+        Tuple (html, markdown)
+    """
+    return render_text(getattr(message, 'message', None), getattr(message, 'entities', None))
+
+
+def html_context(message, media_filename=None, chat_title="Saved Messages", stylesheet_href=None, minify=False,
+                 text=None):
+    """Values available to the message.html template (text: result of message_text, if already rendered)."""
+    if text is None:
+        text = message_text(message)
+    caption = _media_caption(message)
+    style = (f'<link rel="stylesheet" href="{html.escape(stylesheet_href)}">' if stylesheet_href
+             else INLINE_STYLES[minify])
+    return {
+        'message_id': message.id,
+        'chat_title': chat_title,
+        'style': style,
+        'forward': {'from_name': message.forward.from_name} if message.forward else None,
+        'text_html': text[0] or None,
+        'media_filename': media_filename,
+        'media_type': type(message.media).__name__ if message.media else None,
+        'caption_html': process_telegram_formatting(caption) if caption else None,
+        'web_preview': _web_preview(message),
+        'post_link': _post_link(message),
+        'telegram_link': f'tg://openmessage?user_id=me&message_id={message.id}',
+        'time': message.date.strftime("%H:%M"),
+    }
+
+
+def markdown_context(message, text=None):
+    """Values available to the message.md template (text: result of message_text, if already rendered)."""
+    if text is None:
+        text = message_text(message)
+    caption = _media_caption(message)
+    forward = None
+    if message.forward:
+        forward = {
+            'from_name': message.forward.from_name,
+            'date': message.forward.date.strftime('%Y-%m-%d %H:%M:%S') if message.forward.date else None
+        }
+    return {
+        'message_id': message.id,
+        'date': message.date.strftime('%Y-%m-%d %H:%M:%S'),
+        'forward': forward,
+        'text': text[1] or None,
+        'media_type': type(message.media).__name__ if message.media else None,
+        'caption': render_text(caption)[1] if caption else None,
+        'web_preview': _web_preview(message),
+    }
 
 
 def message_to_markdown(message):
     """Convert a Telegram message to Markdown format."""
-    md_content = []
-    
-    # Header with metadata
-    md_content.append(f"# Message {message.id}\n")
-    md_content.append(f"**Date:** {message.date.strftime('%Y-%m-%d %H:%M:%S')}\n")
-    
-    if message.forward:
-        if message.forward.from_name:
-            md_content.append(f"**Forwarded from:** {message.forward.from_name}\n")
-        md_content.append(f"**Originally sent:** {message.forward.date.strftime('%Y-%m-%d %H:%M:%S')}\n")
-    
-    md_content.append("\n---\n\n")
-    
-    # Message text
-    if message.text:
-        md_content.append(message.text)
-        md_content.append("\n")
-    
-    # Media information
-    if message.media:
-        md_content.append(f"\n**Media Type:** {type(message.media).__name__}\n")
-        
-        if hasattr(message.media, 'caption') and message.media.caption:
-            md_content.append(f"\n**Caption:** {message.media.caption}\n")
-    
-    # Web page preview
-    if message.web_preview:
-        md_content.append(f"\n**Link:** [{message.web_preview.title}]({message.web_preview.url})\n")
+    return get_template('message.md')(markdown_context(message))
+
+
+def render_message_html(message, media_filename=None, chat_title="Saved Messages", stylesheet_href=None, minify=None):
+    """Render the message.html page of a message.
     
-    return ''.join(md_content)
+    Args:
+        message: Telegram message
+        media_filename: Downloaded media file next to the page, or None
+        chat_title: Title shown in the header
+        stylesheet_href: Relative link to the shared stylesheet; the CSS is
+            embedded when None
+        minify: Drop indentation and line breaks of the markup (default
+            HTML_MINIFY); message text is never changed
+    """
+    if minify is None:
+        minify = HTML_MINIFY
+    context = html_context(message, media_filename, chat_title, stylesheet_href, minify)
+    return get_template('message.html', minify)(context)
+
+
+def render_message_pages(message, media_filename=None, chat_title="Saved Messages", stylesheet_href=None,
+                         minify=None, text=None):
+    """Render message.html and message.md with a single pass over the message text.
+
+    Arguments are those of render_message_html, plus ``text``, the result of
+    message_text if the caller already rendered it.
+
+    Returns:
+        Tuple (html page, markdown page)
+    """
+    if minify is None:
+        minify = HTML_MINIFY
+    if text is None:
+        text = message_text(message)
+    page = get_template('message.html', minify)(
+        html_context(message, media_filename, chat_title, stylesheet_href, minify, text))
+    return page, get_template('message.md')(markdown_context(message, text))
+
+
+@lru_cache(maxsize=None)
+def render_version(minify=None):
+    """Short digest of everything that shapes message.html and message.md.
+
+    Covers the renderer revision, the page templates (including those in
+    TEMPLATE_DIR), the styles and the style settings. Pages recorded with
+    another version were rendered by older templates or settings.
+    """
+    if minify is None:
+        minify = HTML_MINIFY
+    parts = [str(RENDERER_REVISION), HTML_STYLE_MODE, str(minify), MESSAGE_CSS]
+    parts += [template_path(name).read_text(encoding='utf-8') for name in PAGE_TEMPLATES]
+    return hashlib.sha1('\0'.join(parts).encode('utf-8')).hexdigest()[:12]
+
+
+def output_digest(html_page, md_page):
+    """Digest of the rendered pages of a message, to tell whether a new rendering differs."""
+    return hashlib.sha1(f"{html_page}\0{md_page}".encode('utf-8')).hexdigest()
 
 
 def message_to_html(message):
     """Convert a Telegram message to HTML format that matches Telegram's appearance."""
-    html_parts = []
-    
-    # Start HTML document
-    html_parts.append("""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Telegram Message {}</title>
-    <style>
-        body {{
-            font-family: 'Segoe UI', Roboto, -apple-system, BlinkMacSystemFont, sans-serif;
-            margin: 0;
-            padding: 20px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-        }}
-        .chat-container {{
-            max-width: 600px;
-            margin: 0 auto;
-            background: #1e2832;
-            border-radius: 12px;
-            overflow: hidden;
-            box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
-        }}
-        .chat-header {{
-            background: #2b5278;
-            padding: 15px 20px;
-            color: #ffffff;
-            font-weight: 500;
-            font-size: 16px;
-            border-bottom: 1px solid #3d5980;
-        }}
-        .message-bubble {{
-            background: #2f3c4c;
-            margin: 12px 20px;
-            padding: 12px 16px;
-            border-radius: 12px;
-            border-top-left-radius: 4px;
-            position: relative;
-            max-width: 85%;
-        }}
-        .message-content {{
-            color: #ffffff;
-            font-size: 14px;
-            line-height: 1.4;
-            white-space: pre-wrap;
-            word-wrap: break-word;
-        }}
-        .message-time {{
-            color: #8596a8;
-            font-size: 12px;
-            margin-top: 8px;
-            text-align: right;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .message-forward {{
-            color: #64b5ef;
-            font-size: 13px;
-            margin-bottom: 8px;
-            padding-left: 12px;
-            border-left: 3px solid #64b5ef;
-        }}
-        .message-media {{
-            margin-top: 8px;
-            padding: 8px;
-            background: rgba(255, 255, 255, 0.05);
-            border-radius: 8px;
-            font-size: 12px;
-            color: #8596a8;
-        }}
-        .message-link {{
-            color: #64b5ef;
-            text-decoration: none;
-            border-bottom: 1px solid rgba(100, 181, 239, 0.3);
-        }}
-        .message-link:hover {{
-            border-bottom-color: #64b5ef;
-        }}
-        .bold {{
-            font-weight: 600;
-        }}
-        .code {{
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 4px;
-            padding: 2px 4px;
-            font-family: 'Courier New', monospace;
-            font-size: 13px;
-        }}
-        .code-block {{
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 8px;
-            padding: 12px;
-            font-family: 'Courier New', monospace;
-            font-size: 13px;
-            margin: 8px 0;
-            overflow-x: auto;
-        }}
-    </style>
-</head>
-<body>
-    <div class="chat-container">
-        <div class="chat-header">
-            Saved Messages
-        </div>
-        <div class="message-bubble">
-""".format(message.id))
-    
-    # Forward information
-    if message.forward:
-        html_parts.append('            <div class="message-forward">\n')
-        if message.forward.from_name:
-            html_parts.append(f'                Forwarded from {html.escape(message.forward.from_name)}\n')
-        else:
-            html_parts.append('                Forwarded message\n')
-        html_parts.append('            </div>\n')
-    
-    # Message content with Telegram formatting
-    if message.text:
-        # Process Telegram formatting
-        formatted_text = process_telegram_formatting(message.text)
-        html_parts.append('            <div class="message-content">\n')
-        html_parts.append(f'                {formatted_text}\n')
-        html_parts.append('            </div>\n')
-    
-    # Media information
-    if message.media:
-        html_parts.append('            <div class="message-media">\n')
-        html_parts.append(f'                📎 {html.escape(type(message.media).__name__)}\n')
-        
-        if hasattr(message.media, 'caption') and message.media.caption:
-            caption_formatted = process_telegram_formatting(message.media.caption)
-            html_parts.append(f'<br>                {caption_formatted}\n')
-        
-        html_parts.append('            </div>\n')
-    
-    # Web page preview
-    if message.web_preview:
-        html_parts.append('            <div class="message-media">\n')
-        html_parts.append(f'                🔗 <a href="{html.escape(message.web_preview.url)}" class="message-link" target="_blank">{html.escape(message.web_preview.title or message.web_preview.url)}</a>\n')
-        html_parts.append('            </div>\n')
-    
-    # Message time and link
-    html_parts.append('            <div class="message-time">\n')
-    # Add link to original message in Telegram
-    telegram_link = f'tg://openmessage?user_id=me&message_id={message.id}'
-    html_parts.append(f'                <a href="{telegram_link}" class="message-link" style="font-size: 11px; opacity: 0.7;">🔗</a>\n')
-    html_parts.append(f'                <span>{html.escape(message.date.strftime("%H:%M"))}</span>\n')
-    html_parts.append('            </div>\n')
-    
-    # Close HTML
-    html_parts.append("""        </div>
-    </div>
-</body>
-</html>""")
-    
-    return ''.join(html_parts)
+    return render_message_html(message)
 
 
-async def message_to_html_with_media(message, media_filename):
-    """Convert a Telegram message to HTML format with media support."""
-    html_parts = []
-    
-    # Start HTML document (same as before)
-    html_parts.append("""<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Telegram Message {}</title>
-    <style>
-        body {{
-            font-family: 'Segoe UI', Roboto, -apple-system, BlinkMacSystemFont, sans-serif;
-            margin: 0;
-            padding: 20px;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-        }}
-        .chat-container {{
-            max-width: 600px;
-            margin: 0 auto;
-            background: #1e2832;
-            border-radius: 12px;
-            overflow: hidden;
-            box-shadow: 0 8px 32px rgba(0, 0, 0, 0.3);
-        }}
-        .chat-header {{
-            background: #2b5278;
-            padding: 15px 20px;
-            color: #ffffff;
-            font-weight: 500;
-            font-size: 16px;
-            border-bottom: 1px solid #3d5980;
-        }}
-        .message-bubble {{
-            background: #2f3c4c;
-            margin: 12px 20px;
-            padding: 12px 16px;
-            border-radius: 12px;
-            border-top-left-radius: 4px;
-            position: relative;
-            max-width: 85%;
-        }}
-        .message-content {{
-            color: #ffffff;
-            font-size: 14px;
-            line-height: 1.4;
-            white-space: pre-wrap;
-            word-wrap: break-word;
-        }}
-        .message-time {{
-            color: #8596a8;
-            font-size: 12px;
-            margin-top: 8px;
-            text-align: right;
-            display: flex;
-            justify-content: space-between;
-            align-items: center;
-        }}
-        .message-forward {{
-            color: #64b5ef;
-            font-size: 13px;
-            margin-bottom: 8px;
-            padding-left: 12px;
-            border-left: 3px solid #64b5ef;
-        }}
-        .message-media {{
-            margin-top: 8px;
-            padding: 8px;
-            background: rgba(255, 255, 255, 0.05);
-            border-radius: 8px;
-            font-size: 12px;
-            color: #8596a8;
-        }}
-        .message-image {{
-            margin-top: 8px;
-            border-radius: 8px;
-            overflow: hidden;
-        }}
-        .message-image img {{
-            width: 100%;
-            height: auto;
-            display: block;
-        }}
-        .message-link {{
-            color: #64b5ef;
-            text-decoration: none;
-            border-bottom: 1px solid rgba(100, 181, 239, 0.3);
-        }}
-        .message-link:hover {{
-            border-bottom-color: #64b5ef;
-        }}
-        .bold {{
-            font-weight: 600;
-        }}
-        .code {{
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 4px;
-            padding: 2px 4px;
-            font-family: 'Courier New', monospace;
-            font-size: 13px;
-        }}
-        .code-block {{
-            background: rgba(255, 255, 255, 0.1);
-            border-radius: 8px;
-            padding: 12px;
-            font-family: 'Courier New', monospace;
-            font-size: 13px;
-            margin: 8px 0;
-            overflow-x: auto;
-        }}
-        .post-link {{
-            background: rgba(100, 181, 239, 0.1);
-            border: 1px solid rgba(100, 181, 239, 0.3);
-            border-radius: 8px;
-            padding: 8px;
-            margin-top: 8px;
-            font-size: 12px;
-        }}
-    </style>
-</head>
-<body>
-    <div class="chat-container">
-        <div class="chat-header">
-            Saved Messages
-        </div>
-        <div class="message-bubble">
-""".format(message.id))
-    
-    # Forward information
-    if message.forward:
-        html_parts.append('            <div class="message-forward">\n')
-        if message.forward.from_name:
-            html_parts.append(f'                Forwarded from {html.escape(message.forward.from_name)}\n')
-        else:
-            html_parts.append('                Forwarded message\n')
-        html_parts.append('            </div>\n')
-    
-    # Message content with Telegram formatting
-    if message.text:
-        # Process Telegram formatting
-        formatted_text = process_telegram_formatting(message.text)
-        html_parts.append('            <div class="message-content">\n')
-        html_parts.append(f'                {formatted_text}\n')
-        html_parts.append('            </div>\n')
-    
-    # Media (images, videos, etc.)
-    if media_filename:
-        html_parts.append('            <div class="message-image">\n')
-        html_parts.append(f'                <img src="{media_filename}" alt="Message media" loading="lazy">\n')
-        html_parts.append('            </div>\n')
-    elif message.media:
-        html_parts.append('            <div class="message-media">\n')
-        html_parts.append(f'                📎 {html.escape(type(message.media).__name__)}\n')
-        
-        if hasattr(message.media, 'caption') and message.media.caption:
-            caption_formatted = process_telegram_formatting(message.media.caption)
-            html_parts.append(f'<br>                {caption_formatted}\n')
-        
-        html_parts.append('            </div>\n')
-    
-    # Web page preview
-    if message.web_preview:
-        html_parts.append('            <div class="message-media">\n')
-        html_parts.append(f'                🔗 <a href="{html.escape(message.web_preview.url)}" class="message-link" target="_blank">{html.escape(message.web_preview.title or message.web_preview.url)}</a>\n')
-        html_parts.append('            </div>\n')
-    
-    # Add original post link if it's forwarded from a public channel
-    if message.forward and hasattr(message.forward, 'from_id') and message.forward.from_id:
-        try:
-            # Try to create a public link for channels/groups
-            if hasattr(message.forward.from_id, 'channel_id'):
-                channel_id = message.forward.from_id.channel_id
-                post_id = getattr(message.forward, 'channel_post', message.id)
-                # This is a simplified approach - in reality you'd need to know the channel username
-                html_parts.append('            <div class="post-link">\n')
-                html_parts.append(f'                🔗 <a href="https://t.me/c/{channel_id}/{post_id}" class="message-link" target="_blank">View original post</a>\n')
-                html_parts.append('            </div>\n')
-        except:
-            pass
-    
-    # Message time and link
-    html_parts.append('            <div class="message-time">\n')
-    # Add link to original message in Telegram (works in Telegram apps)
-    telegram_link = f'tg://openmessage?user_id=me&message_id={message.id}'
-    html_parts.append(f'                <a href="{telegram_link}" class="message-link" style="font-size: 11px; opacity: 0.7;">📱</a>\n')
-    html_parts.append(f'                <span>{html.escape(message.date.strftime("%H:%M"))}</span>\n')
-    html_parts.append('            </div>\n')
-    
-    # Close HTML
-    html_parts.append("""        </div>
-    </div>
-</body>
-</html>""")
-    
-    return ''.join(html_parts)
\ No newline at end of file
+async def message_to_html_with_media(message, media_filename, chat_title="Saved Messages",
+                                     stylesheet_href=None, minify=None):
+    """Convert a Telegram message to HTML format with media support (see render_message_html)."""
+    return render_message_html(message, media_filename, chat_title, stylesheet_href, minify)
@@ -13,10 +13,18 @@ from google.auth.transport.requests import Request
 from google_auth_oauthlib.flow import InstalledAppFlow
 import zipfile
 from datetime import datetime
+from transfer_watchdog import TransferWatchdog, STALL_TIMEOUT_SECONDS
+from progress import get_aggregator
+from database import CHATS_SUBDIR
+from page_store import page_store_path, changed_since_backup, snapshot, mark_backed_up
+from utils import folder_size
 
 # If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/drive.file']
 
+# Resumable upload chunk size (must be a multiple of 256 KB)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
 
 class GoogleDriveBackup:
     """Handle Google Drive backup operations."""
@@ -32,6 +40,7 @@ class GoogleDriveBackup:
         self.token_file = token_file
         self.service = None
         self.backup_folder_id = None
+        self.watchdog = TransferWatchdog()
         
     def authenticate(self):
         """Authenticate with Google Drive API."""
@@ -85,7 +94,12 @@ class GoogleDriveBackup:
                 print(f"⚠️  Warning: Could not save token: {e}")
         
         try:
-            self.service = build('drive', 'v3', credentials=creds)
+            # A socket timeout turns a hung upload chunk into an error the
+            # stall watchdog can act on instead of blocking forever
+            import httplib2
+            from google_auth_httplib2 import AuthorizedHttp
+            http = AuthorizedHttp(creds, http=httplib2.Http(timeout=STALL_TIMEOUT_SECONDS))
+            self.service = build('drive', 'v3', http=http)
             print("✓ Connected to Google Drive")
             return True
         except Exception as e:
@@ -235,23 +249,25 @@ class GoogleDriveBackup:
                 print(f"   Updating existing file...")
                 
                 # Update existing file
-                media = MediaFileUpload(str(file_path), resumable=True)
-                file = self.service.files().update(
+                media = MediaFileUpload(str(file_path), chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
+                request = self.service.files().update(
                     fileId=existing_files[0]['id'],
                     media_body=media
-                ).execute()
+                )
+                file = self._execute_resumable(request, file_path.name)
                 
                 print(f"✓ Updated file in Google Drive: {file_path.name} ({file_size_mb:.2f} MB)")
             else:
                 # Upload new file
                 print(f"Uploading to Google Drive: {file_path.name} ({file_size_mb:.2f} MB)")
-                media = MediaFileUpload(str(file_path), resumable=True)
+                media = MediaFileUpload(str(file_path), chunksize=UPLOAD_CHUNK_SIZE, resumable=True)
                 
-                file = self.service.files().create(
+                request = self.service.files().create(
                     body=file_metadata,
                     media_body=media,
                     fields='id'
-                ).execute()
+                )
+                file = self._execute_resumable(request, file_path.name)
                 
                 print(f"✓ Uploaded to Google Drive: {file_path.name}")
             
@@ -269,6 +285,46 @@ class GoogleDriveBackup:
             print(f"❌ Error uploading file: {e}")
             return None
     
+    def _execute_resumable(self, request, name):
+        """Run a resumable upload chunk by chunk under the stall watchdog.
+        
+        Every finished chunk counts as progress. A chunk that times out after
+        the stall timeout is counted as a stall and the upload resumes from
+        the last byte Google Drive confirmed, up to the watchdog's restart
+        limit.
+        
+        Returns:
+            The API response of the finished upload
+        """
+        import socket
+        from transfer_watchdog import TransferStalledError
+        
+        transfer = self.watchdog.track(name, kind='upload')
+        aggregator = get_aggregator()
+        progress_key = aggregator.start(name, total=request.resumable.size(), kind='upload')
+        restarts = 0
+        response = None
+        try:
+            while response is None:
+                try:
+                    status, response = request.next_chunk()
+                except (socket.timeout, TimeoutError) as e:
+                    self.watchdog.record_stall(transfer)
+                    restarts += 1
+                    if restarts > self.watchdog.max_restarts:
+                        self.watchdog.record_gave_up()
+                        raise TransferStalledError(f"Upload of {name} stalled {restarts} times") from e
+                    print(f"   🔄 Resuming upload (attempt {restarts + 1}/{self.watchdog.max_restarts + 1})...")
+                    transfer.touch()
+                    continue
+                transfer.touch(status.resumable_progress if status else None)
+                if status:
+                    aggregator.update(progress_key, status.resumable_progress)
+            return response
+        finally:
+            aggregator.finish(progress_key, completed=response is not None)
+            self.watchdog.untrack(transfer)
+    
     def _delete_folder_windows(self, folder_path, folder_name):
         """Delete a folder with Windows-specific error handling.
         
@@ -382,20 +438,115 @@ class GoogleDriveBackup:
             print(f"❌ Error creating folder archive: {e}")
             return None
     
-    def backup_individual_folders(self, export_dir, db_path, cleanup_after_upload=True, cancel_event=None):
+    def backup_folder(self, folder, db_path, cleanup_after_upload=True, cancel_event=None):
+        """Archive, upload and (optionally) delete a single message folder.
+        
+        Args:
+            folder: Path to the message folder
+            db_path: Path to the database file
+            cleanup_after_upload: Whether to delete folder and archive after upload
+            
+        Returns:
+            'success', 'failed' or 'cancelled'
+        """
+        from database import mark_backup_started, mark_backup_completed, mark_backup_failed
+        
+        folder = Path(folder)
+        folder_name = folder.name
+        aggregator = get_aggregator()
+        
+        try:
+            # Create archive with progress tracking
+            print(f"  - Creating archive...")
+            zip_path = None
+            
+            # Early cancel before heavy archiving
+            if cancel_event and cancel_event.is_set():
+                print("  ⚠️ Cancelled before archiving.")
+                return 'cancelled'
+            
+            # Callbacks only feed counters; the aggregator throttles rendering
+            archive_key = aggregator.start(folder_name, kind='archive')
+            
+            def archive_progress(current, total, filename, processed_bytes=None, total_bytes=None, speed=None, eta_seconds=None):
+                aggregator.update(archive_key, processed_bytes or 0, total_bytes,
+                                  files_done=current, files_total=total)
+            
+            try:
+                zip_path = self.create_folder_archive(folder, progress_callback=archive_progress)
+                aggregator.render(force=True)
+            finally:
+                aggregator.finish(archive_key, completed=zip_path is not None)
+            
+            # Clear progress line
+            if zip_path:
+                print()  # New line after progress
+            
+            if not zip_path:
+                mark_backup_failed(db_path, folder_name, "Failed to create archive")
+                return 'failed'
+            
+            archive_size = zip_path.stat().st_size
+            size_mb = archive_size / (1024 * 1024)
+            print(f"  - Archive created: {zip_path.name} ({size_mb:.2f} MB)")
+            
+            # Mark as started in DB
+            mark_backup_started(db_path, folder_name, str(folder), zip_path.name, archive_size)
+            
+            # Upload to Google Drive
+            print(f"  - Uploading to Google Drive...")
+            if cancel_event and cancel_event.is_set():
+                print("  ⚠️ Cancelled before upload.")
+                return 'cancelled'
+            file_id = self.upload_file(zip_path, delete_after_upload=False)
+            
+            if file_id:
+                # Mark as completed in DB
+                mark_backup_completed(db_path, folder_name, file_id)
+                print(f"  ✓ Uploaded successfully")
+                
+                # Cleanup if requested
+                if cleanup_after_upload:
+                    # Delete the archive first (easier to delete)
+                    try:
+                        zip_path.unlink()
+                        print(f"  ✓ Deleted archive: {zip_path.name}")
+                    except Exception as e:
+                        print(f"  ⚠️  Archive cleanup warning: {e}")
+                    
+                    # Delete the source folder with Windows-specific handling
+                    try:
+                        self._delete_folder_windows(folder, folder_name)
+                    except Exception as e:
+                        print(f"  ⚠️  Folder cleanup warning: {e}")
+                        print(f"     You may need to manually delete: {folder_name}")
+                return 'success'
+            else:
+                mark_backup_failed(db_path, folder_name, "Upload failed")
+                print(f"  ❌ Upload failed")
+                return 'failed'
+                
+        except Exception as e:
+            error_msg = str(e)
+            print(f"  ❌ Error: {error_msg}")
+            mark_backup_failed(db_path, folder_name, error_msg)
+            return 'failed'
+    
+    def backup_individual_folders(self, export_dir, db_path, cleanup_after_upload=True, cancel_event=None,
+                                  run_budget=None):
         """Backup each message folder individually with database tracking.
         
         Args:
             export_dir: Path to the export directory
             db_path: Path to the database file
             cleanup_after_upload: Whether to delete folder and archive after upload
+            run_budget: Optional RunBudget; no new folder is started once it is used
+                up and the remaining folders are picked up by the next run
             
         Returns:
             Dictionary with statistics
         """
-        from database import (get_folders_to_backup, mark_backup_started, 
-                             mark_backup_completed, mark_backup_failed)
-        import shutil
+        from database import get_folders_to_backup
         
         export_path = Path(export_dir)
         if not export_path.exists():
@@ -404,120 +555,44 @@ class GoogleDriveBackup:
         
         # Get folders that need backup
         folders_to_backup = get_folders_to_backup(db_path, export_dir)
+        # Pages kept in export_pages.db (STORAGE_MODE = 'sqlite') have no folder of their own
+        pages_changed = changed_since_backup(page_store_path(export_dir))
         
-        if not folders_to_backup:
+        if not folders_to_backup and not pages_changed:
             print("✓ All folders already backed up")
             return {'success': 0, 'failed': 0, 'skipped': len(list(export_path.iterdir()))}
         
         print(f"\n📦 Found {len(folders_to_backup)} folders to backup")
         
         stats = {'success': 0, 'failed': 0, 'skipped': 0}
+        get_aggregator().reset()
         
         for idx, folder in enumerate(folders_to_backup, 1):
             if cancel_event and cancel_event.is_set():
                 print("\n⚠️ Cancellation requested. Stopping folder backups.")
                 break
-            folder_name = folder.name
-            print(f"\n[{idx}/{len(folders_to_backup)}] Processing: {folder_name}")
+            size = folder_size(folder) if run_budget is not None else 0
+            if run_budget is not None and run_budget.should_stop(size):
+                stats['stopped'] = run_budget.reason
+                print(f"\n⏸️ Run budget reached ({run_budget.reason}). "
+                      f"{len(folders_to_backup) - idx + 1} folder(s) left for the next run.")
+                break
+            print(f"\n[{idx}/{len(folders_to_backup)}] Processing: {folder.name}")
             
-            try:
-                # Create archive with progress tracking
-                print(f"  - Creating archive...")
-                
-                def archive_progress(current, total, filename, processed_bytes=None, total_bytes=None, speed=None, eta_seconds=None):
-                    percent = (current / total * 100) if total > 0 else 0
-                    # Format speed & ETA if available
-                    speed_str = "";
-                    eta_str = ""
-                    if speed is not None and total_bytes:
-                        # Human readable speed
-                        def _fmt_bytes(b):
-                            units = ["B","KB","MB","GB","TB"]
-                            import math
-                            if b <= 0:
-                                return "0 B"
-                            i = int(math.floor(math.log(b,1024)))
-                            p = math.pow(1024,i)
-                            s = b/p
-                            return f"{s:.1f} {units[i]}"
-                        speed_str = f" at {_fmt_bytes(speed)}/s" if speed > 0 else ""
-                        if eta_seconds is not None:
-                            # Format ETA as H:MM:SS if large
-                            if eta_seconds > 3600:
-                                import datetime as _dt
-                                eta_str = str(_dt.timedelta(seconds=eta_seconds))
-                            elif eta_seconds >= 60:
-                                m = eta_seconds // 60
-                                s = eta_seconds % 60
-                                eta_str = f"{m}m{s}s"
-                            else:
-                                eta_str = f"{eta_seconds}s"
-                    eta_part = f" - ETA: {eta_str}" if eta_str else ""
-                    print(f"\r  📦 Archiving: {percent:.1f}% ({current}/{total}) - {filename[:40]}{speed_str}{eta_part}", end="", flush=True)
-                
-                # Early cancel before heavy archiving
-                if cancel_event and cancel_event.is_set():
-                    print("  ⚠️ Cancelled before archiving.")
-                    break
-                zip_path = self.create_folder_archive(folder, progress_callback=archive_progress)
-                
-                # Clear progress line
-                if zip_path:
-                    print()  # New line after progress
-                
-                if not zip_path:
-                    mark_backup_failed(db_path, folder_name, "Failed to create archive")
-                    stats['failed'] += 1
-                    continue
-                
-                archive_size = zip_path.stat().st_size
-                size_mb = archive_size / (1024 * 1024)
-                print(f"  - Archive created: {zip_path.name} ({size_mb:.2f} MB)")
-                
-                # Mark as started in DB
-                mark_backup_started(db_path, folder_name, str(folder), zip_path.name, archive_size)
-                
-                # Upload to Google Drive
-                print(f"  - Uploading to Google Drive...")
-                if cancel_event and cancel_event.is_set():
-                    print("  ⚠️ Cancelled before upload.")
-                    break
-                file_id = self.upload_file(zip_path, delete_after_upload=False)
-                
-                if file_id:
-                    # Mark as completed in DB
-                    mark_backup_completed(db_path, folder_name, file_id)
-                    print(f"  ✓ Uploaded successfully")
-                    stats['success'] += 1
-                    
-                    # Cleanup if requested
-                    if cleanup_after_upload:
-                        # Delete the archive first (easier to delete)
-                        try:
-                            zip_path.unlink()
-                            print(f"  ✓ Deleted archive: {zip_path.name}")
-                        except Exception as e:
-                            print(f"  ⚠️  Archive cleanup warning: {e}")
-                        
-                        # Delete the source folder with Windows-specific handling
-                        try:
-                            self._delete_folder_windows(folder, folder_name)
-                        except Exception as e:
-                            print(f"  ⚠️  Folder cleanup warning: {e}")
-                            print(f"     You may need to manually delete: {folder_name}")
-                else:
-                    mark_backup_failed(db_path, folder_name, "Upload failed")
-                    stats['failed'] += 1
-                    print(f"  ❌ Upload failed")
-                    
-            except Exception as e:
-                error_msg = str(e)
-                print(f"  ❌ Error: {error_msg}")
-                mark_backup_failed(db_path, folder_name, error_msg)
-                stats['failed'] += 1
+            result = self.backup_folder(folder, db_path, cleanup_after_upload, cancel_event)
+            if result == 'cancelled':
+                break
+            stats[result] += 1
+            if run_budget is not None and result == 'success':
+                run_budget.add_bytes(size)
+        
+        stats['stalls'] = self.watchdog.stats['stalls']
         
         # Upload the database file after all folders are processed
-        if stats['success'] > 0 and not (cancel_event and cancel_event.is_set()):
+        if (stats['success'] > 0 or pages_changed) and not (cancel_event and cancel_event.is_set()):
+            self.upload_stylesheets(export_dir, db_path)
+            if pages_changed:
+                stats['page_store_backed_up'] = bool(self.upload_page_store(export_dir))
             print(f"\n" + "="*50)
             print("📊 Backing up database file...")
             db_file_id = self.upload_database_file(db_path)
@@ -531,6 +606,64 @@ class GoogleDriveBackup:
         
         return stats
     
+    def upload_stylesheets(self, export_dir, db_path):
+        """Upload shared stylesheets of the export root that are not in Drive yet.
+        
+        Message pages written with HTML_STYLE_MODE = 'shared' link a versioned
+        stylesheet next to their folders; extracting the folder archives
+        next to it restores the styling.
+        
+        Returns:
+            Number of stylesheets uploaded
+        """
+        from database import is_folder_backed_up, mark_backup_started, mark_backup_completed
+        
+        uploaded = 0
+        for stylesheet in sorted(Path(export_dir).glob('telegram-export.*.css')):
+            if is_folder_backed_up(db_path, stylesheet.name):
+                continue
+            mark_backup_started(db_path, stylesheet.name, str(stylesheet), stylesheet.name, stylesheet.stat().st_size)
+            file_id = self.upload_file(stylesheet, delete_after_upload=False)
+            if file_id:
+                mark_backup_completed(db_path, stylesheet.name, file_id)
+                print(f"  ✓ Shared stylesheet {stylesheet.name} uploaded")
+                uploaded += 1
+        return uploaded
+    
+    def upload_page_store(self, export_dir):
+        """Upload a snapshot of the page store (export_pages.db) if pages were stored since the last one.
+        
+        The snapshot is taken with SQLite's backup API, so it is consistent
+        even while an export is still writing pages.
+        
+        Returns:
+            File ID on success, None if nothing changed or on error
+        """
+        store_path = page_store_path(export_dir)
+        if not changed_since_backup(store_path):
+            return None
+        try:
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            snapshot_name = f"export_pages_{timestamp}.db"
+            if store_path.parent.parent.name == CHATS_SUBDIR:
+                snapshot_name = f"{store_path.parent.name}_{snapshot_name}"
+            snapshot_path = store_path.parent / snapshot_name
+            latest = snapshot(store_path, snapshot_path)
+            
+            print(f"\n🗄️ Uploading page store backup: {snapshot_name}")
+            file_id = self.upload_file(snapshot_path, delete_after_upload=True)
+            if snapshot_path.exists():
+                snapshot_path.unlink()
+            if not file_id:
+                print(f"  ❌ Page store upload failed")
+                return None
+            mark_backed_up(store_path, latest)
+            print(f"  ✓ Page store backed up to Google Drive")
+            return file_id
+        except Exception as e:
+            print(f"❌ Error uploading page store: {e}")
+            return None
+    
     def upload_database_file(self, db_path):
         """Upload the SQLite database file to Google Drive.
         
@@ -550,6 +683,9 @@ class GoogleDriveBackup:
             from datetime import datetime
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             db_backup_name = f"export_history_{timestamp}.db"
+            # Databases of other chats are told apart by their chat folder
+            if db_path.parent.parent.name == CHATS_SUBDIR:
+                db_backup_name = f"{db_path.parent.name}_{db_backup_name}"
             
             # Create a temporary copy with timestamp
             temp_db_path = db_path.parent / db_backup_name
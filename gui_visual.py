@@ -38,7 +38,7 @@ import queue
 # Import existing modules
 from config import *
 from database import init_database, get_export_stats, get_backup_stats
-from exporter import export_saved_messages
+from progress import progress_snapshot, format_size, format_eta
 
 # Write debug info to file for startup diagnostics (after all imports, safe)
 try:
@@ -52,8 +52,8 @@ try:
 except Exception as e:
     with open("debug_startup.txt", "w", encoding="utf-8") as f:
         f.write(f"ERROR: {e}\n")
-from google_drive_backup import GoogleDriveBackup
-from telethon import TelegramClient
+# Telethon, the exporter and the Google API client are imported when an
+# export or backup starts, so the window opens without loading them
 
 
 class VisualExporterGUI:
@@ -948,8 +948,35 @@ class VisualExporterGUI:
         except queue.Empty:
             pass
         
+        # Poll the shared progress aggregator for the combined transfer view
+        if self.is_running:
+            self.update_transfer_snapshot()
+        
         self.root.after(100, self.process_messages)
     
+    def update_transfer_snapshot(self):
+        """Show the aggregated progress of all in-flight transfers"""
+        snapshot = progress_snapshot()
+        if snapshot.get('eta_seconds') is not None:
+            self.metrics['eta_minutes'] = snapshot['eta_seconds'] / 60.0
+            self._update_metrics_labels()
+        transfers = snapshot['transfers']
+        if not transfers:
+            return
+        done = sum(t['current'] for t in transfers)
+        total = sum(t['total'] for t in transfers)
+        percent = (done / total * 100) if total else 0
+        if len(transfers) == 1:
+            text = f"📥 {transfers[0]['name'] or 'media'} | {percent:.1f}% | {format_size(done)}/{format_size(total)}"
+        else:
+            text = f"📥 {len(transfers)} transfers | {percent:.1f}% | {format_size(done)}/{format_size(total)}"
+        self.update_media_progress({
+            'percent': percent,
+            'text': text,
+            'speed': f"{format_size(snapshot['speed'])}/s",
+            'eta': format_eta(snapshot['transfer_eta_seconds'])
+        })
+    
     def start_export(self):
         """Start export"""
         self.backup_var.set(False)
@@ -1025,6 +1052,7 @@ class VisualExporterGUI:
                 }))
                 
                 try:
+                    from google_drive_backup import GoogleDriveBackup
                     backup_handler = GoogleDriveBackup(
                         credentials_file=GOOGLE_DRIVE_CREDENTIALS_FILE,
                         token_file=GOOGLE_DRIVE_TOKEN_FILE
@@ -1055,6 +1083,8 @@ class VisualExporterGUI:
             asyncio.set_event_loop(loop)
             
             async def do_export():
+                from telethon import TelegramClient
+                from exporter import export_saved_messages
                 client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
                 try:
                     await client.start(phone=PHONE)
@@ -1320,10 +1350,13 @@ class VisualExporterGUI:
                     elapsed = now_ts - getattr(self, '_export_start_time', now_ts)
                     if current > 1:
                         avg = elapsed / (current - 1)
-                        remaining = (total - (current - 1)) * avg
                         self.metrics['avg_time_per_msg'] = avg
                         self.metrics['elapsed_time'] = elapsed
-                        self.metrics['eta_minutes'] = remaining / 60.0
+                        # Byte-based estimate from the exporter, message count as fallback
+                        eta_seconds = progress_snapshot().get('eta_seconds')
+                        if eta_seconds is None:
+                            eta_seconds = (total - (current - 1)) * avg
+                        self.metrics['eta_minutes'] = eta_seconds / 60.0
                     self._update_metrics_labels()
                     self.message_queue.put(("progress", {
                         'current': current,
@@ -1720,6 +1753,7 @@ class VisualExporterGUI:
             builtins.print = custom_print
             
             try:
+                from google_drive_backup import GoogleDriveBackup
                 backup_handler = GoogleDriveBackup(
                     credentials_file=GOOGLE_DRIVE_CREDENTIALS_FILE,
                     token_file=GOOGLE_DRIVE_TOKEN_FILE
@@ -2088,11 +2122,13 @@ class VisualExporterGUI:
                         if file_path:
                             results_text.insert(tk.END, f"📁 Folder: ", "label")
                             results_text.insert(tk.END, f"{file_path}\n", "path")
-                            # Add button to open folder
+                            # Add button to open folder (found through the recorded path, whatever the layout)
                             def open_folder(path=file_path):
                                 import subprocess
-                                if Path(path).exists():
-                                    subprocess.Popen(f'explorer "{path}"')
+                                from layout import message_folder_path
+                                folder = message_folder_path(OUTPUT_DIR, path)
+                                if folder is not None:
+                                    subprocess.Popen(f'explorer "{folder}"')
                             
                             open_btn = ttk.Button(
                                 results_text,
@@ -0,0 +1,84 @@
+"""
+Where message folders go below an export directory
+
+LAYOUT (config.py):
+
+- ``flat``: ``<output>/<date>_msg<id>_<preview>/``, every folder side by side
+- ``year_month``: ``<output>/YYYY/MM/<date>_msg<id>_<preview>/``
+
+The file_path recorded in export_history.db is the source of truth for the
+folder of a message. Backups, the web server, rerendering and the archive
+and search pages find folders through it (message_folder_path) instead of
+listing the export directory, so they work with either layout and with
+exports that were moved. ``main.py --migrate-layout`` moves existing
+folders to the configured layout.
+"""
+
+import re
+from pathlib import Path, PurePath
+
+LAYOUTS = ('flat', 'year_month')
+
+# Import configuration
+try:
+    from config import LAYOUT
+except ImportError:
+    LAYOUT = 'flat'
+
+YEAR_RE = re.compile(r'\d{4}')
+MONTH_RE = re.compile(r'\d{2}')
+
+
+def layout_folder(folder_name, layout=None):
+    """Path of a message folder relative to the export directory.
+
+    Folder names start with the message date (YYYYMMDD_HHMMSS), which
+    gives the year and month.
+
+    Raises:
+        ValueError: For an unknown layout
+    """
+    layout = layout or LAYOUT
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown LAYOUT {layout!r} (choose from {', '.join(LAYOUTS)})")
+    if layout == 'year_month':
+        return f"{folder_name[:4]}/{folder_name[4:6]}/{folder_name}"
+    return folder_name
+
+
+def new_message_folder(output_dir, folder_name):
+    """Where a newly exported message folder goes under the configured layout."""
+    return Path(output_dir) / layout_folder(folder_name)
+
+
+def relative_folder(file_path):
+    """Folder of an exported message relative to its export directory, from its recorded file_path.
+
+    Returns:
+        'YYYY/MM/<folder>' for a year/month folder, otherwise the folder name
+    """
+    folder = PurePath(file_path).parent
+    month, year = folder.parent, folder.parent.parent
+    # The year and month directories are only taken when they match the date in the folder name
+    if (YEAR_RE.fullmatch(year.name) and MONTH_RE.fullmatch(month.name)
+            and folder.name.startswith(year.name + month.name)):
+        return f"{year.name}/{month.name}/{folder.name}"
+    return folder.name
+
+
+def message_folder_path(output_dir, file_path):
+    """Folder of an exported message on disk, or None if it does not exist (any more).
+
+    Tries the recorded path first, then the same folder below ``output_dir``
+    (the export was moved), then its place in each layout (a migration was
+    interrupted before the database was updated).
+    """
+    folder = Path(file_path).parent
+    if folder.is_dir():
+        return folder
+    candidates = [relative_folder(file_path)] + [layout_folder(folder.name, layout) for layout in LAYOUTS]
+    for candidate in dict.fromkeys(candidates):
+        path = Path(output_dir) / candidate
+        if path.is_dir():
+            return path
+    return None
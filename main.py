@@ -6,11 +6,26 @@ Exports saved messages from Telegram to separate HTML and Markdown files.
 
 import asyncio
 import argparse
+import sys
 from datetime import datetime
 from pathlib import Path
-from telethon import TelegramClient
 
 # Import configuration
+try:
+    from config import DISK_BUDGET
+except ImportError:
+    DISK_BUDGET = None
+
+try:
+    from config import MAX_DURATION
+except ImportError:
+    MAX_DURATION = None
+
+try:
+    from config import MAX_BYTES
+except ImportError:
+    MAX_BYTES = None
+
 try:
     from config import (API_ID, API_HASH, PHONE, OUTPUT_DIR, SESSION_NAME,
                        GOOGLE_DRIVE_BACKUP_ENABLED, GOOGLE_DRIVE_CREDENTIALS_FILE,
@@ -31,9 +46,117 @@ except ImportError as e:
         print("You can copy config.py.example and fill in your values.")
         exit(1)
 
-from database import init_database, get_export_stats
-from exporter import export_saved_messages
-from google_drive_backup import GoogleDriveBackup
+# Telethon (exporter, watch, backfill) and the Google API client (google_drive_backup)
+# are imported on the code paths that use them, so --stats and --help start fast
+from database import (export_directories, init_database, get_export_stats, get_failed_export_stats,
+                      get_render_version_stats)
+from accounts import load_accounts, get_account, export_accounts
+from page_store import check_storage_mode
+from backfill import BACKFILL_WORKERS
+from run_budget import RunBudget
+from utils import parse_size, parse_duration
+
+
+def parse_chat_list(chats_arg):
+    """Parse --chats "me,@channel,-100123" into get_entity references."""
+    chats = []
+    for part in chats_arg.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        # Numeric IDs must be passed as int, anything else is a username or 'me'
+        chats.append(int(part) if part.lstrip('-').isdigit() else part)
+    return chats
+
+
+def parse_message_ids(ids_arg=None, range_arg=None):
+    """Parse --ids "123,456" and --id-range "A-B" into a list of message IDs.
+    
+    Raises:
+        ValueError: If an ID or range is malformed
+    """
+    message_ids = []
+    if ids_arg:
+        for part in ids_arg.split(','):
+            part = part.strip()
+            if part:
+                message_ids.append(int(part))
+    if range_arg:
+        start, sep, end = range_arg.partition('-')
+        if not sep:
+            raise ValueError(f"Invalid range '{range_arg}', expected A-B")
+        start, end = int(start), int(end)
+        if start > end:
+            start, end = end, start
+        message_ids.extend(range(start, end + 1))
+    return message_ids
+
+
+def print_backup_summary(stats, cleanup, label=None):
+    """Print the result of backup_individual_folders."""
+    print("\n" + "="*60)
+    print(f"BACKUP SUMMARY" + (f" ({label})" if label else ""))
+    print("="*60)
+    print(f"✓ Successfully uploaded: {stats['success']}")
+    print(f"❌ Failed: {stats['failed']}")
+    print(f"⏭️  Skipped (already backed up): {stats['skipped']}")
+    if stats.get('stalls'):
+        print(f"⏸️  Stalled uploads restarted: {stats['stalls']}")
+    if stats.get('stopped'):
+        print(f"⏸️  Stopped early: {stats['stopped']} (remaining folders are uploaded by the next run)")
+    if stats.get('disk_budget'):
+        budget = stats['disk_budget']
+        print(f"💾 Disk budget: peak {budget['peak'] / (1024 ** 3):.2f} of {budget['limit'] / (1024 ** 3):.2f} GB, "
+              f"downloads paused {budget['waits']} time(s)")
+    
+    # Show database backup status
+    if 'database_backed_up' in stats:
+        if stats['database_backed_up']:
+            print(f"📊 Database backup: ✓ Success")
+        else:
+            print(f"📊 Database backup: ❌ Failed")
+    if 'page_store_backed_up' in stats:
+        print(f"🗄️ Page store backup: {'✓ Success' if stats['page_store_backed_up'] else '❌ Failed'}")
+    
+    if stats['success'] > 0:
+        if cleanup:
+            print(f"\n✓ Cleaned up {stats['success']} folders and archives")
+        else:
+            print(f"\n⚠️  Local folders and archives kept (--keep-archive)")
+        print("\n✅ Backup completed successfully!")
+    elif stats['failed'] > 0:
+        print("\n⚠️  Some backups failed, check messages above")
+    else:
+        print("\n✓ Nothing to backup (all up to date)")
+
+
+def print_run_budget_summary(run_budget):
+    """Print how much of the --max-duration/--max-bytes budget the run used."""
+    if run_budget is None:
+        return
+    report = run_budget.snapshot()
+    print(f"\n⏱️ Run budget: {report['elapsed'] / 60:.1f}min elapsed, "
+          f"{report['bytes_done'] / (1024 ** 3):.2f} GB transferred")
+    if report['stopped']:
+        print(f"⏸️ Stopped early: {report['stopped']}. Progress is saved - the next run continues from here.")
+
+
+def backup_export_targets(backup_handler, backup_targets, cleanup, run_budget=None):
+    """Back up every (output_dir, db_path) export tree folder by folder."""
+    print("\n" + "="*60)
+    print("BACKING UP TO GOOGLE DRIVE (PER-FOLDER)")
+    print("="*60)
+    print("Note: Each message folder will be archived and uploaded separately.")
+    print("Source folders and archives will be deleted after successful upload.\n")
+    
+    for backup_dir, backup_db_path in backup_targets:
+        stats = backup_handler.backup_individual_folders(
+            backup_dir,
+            backup_db_path,
+            cleanup_after_upload=cleanup,
+            run_budget=run_budget
+        )
+        print_backup_summary(stats, cleanup, backup_dir if len(backup_targets) > 1 else None)
 
 
 async def main():
@@ -57,6 +180,13 @@ Examples:
   # Show export statistics
   python main.py --stats
   
+  # Retry only messages that failed in previous runs
+  python main.py --retry-failed
+  
+  # Re-export specific messages by ID or ID range
+  python main.py --ids 123,456
+  python main.py --id-range 1000-1200
+  
   # Export with custom output directory
   python main.py --output my_exports
   
@@ -68,6 +198,39 @@ Examples:
   
   # Export, backup, and keep local archive
   python main.py --backup --keep-archive
+  
+  # Keep running and export new/edited messages as they arrive
+  python main.py --watch
+  
+  # Archive a large account on a small disk: upload and delete folders while exporting
+  python main.py --backup --disk-budget 50G
+  
+  # Fit a nightly maintenance window; the next run continues where this one stopped
+  python main.py --backup --max-duration 2h --max-bytes 50G
+  
+  # First full export of a large history with 6 processes
+  python main.py --backfill --workers 6
+  
+  # Export every account profile from ACCOUNTS at once
+  python main.py --all-accounts
+  
+  # Browse the export as monthly chat pages (set ARCHIVE_PAGES = True first)
+  python main.py --build-pages
+  
+  # Apply template changes to exported pages without fetching messages again
+  python main.py --rerender
+  
+  # Roll a template upgrade through a large archive, an hour at a time
+  python main.py --rerender-stale --max-duration 1h
+  
+  # Also append every message to messages.ndjson for analytics jobs
+  python main.py --sinks html,markdown,ndjson
+  
+  # Move existing message folders to YYYY/MM/ (set LAYOUT = 'year_month' first)
+  python main.py --migrate-layout
+  
+  # Export Saved Messages and two channels in parallel
+  python main.py --chats me,@somechannel,-1001234567890
 ```
         """
     )
@@ -78,9 +241,45 @@ Examples:
                       help='Force re-export of already exported messages')
     parser.add_argument('--stats', action='store_true',
                       help='Show export statistics and exit')
+    parser.add_argument('--retry-failed', action='store_true',
+                      help='Only re-export messages that failed in previous runs (fetched by ID)')
+    parser.add_argument('--retry-all', action='store_true',
+                      help='With --retry-failed, also retry failures whose backoff delay has not passed yet')
+    parser.add_argument('--ids', type=str,
+                      help='Re-export only these message IDs (comma-separated, e.g. 123,456)')
+    parser.add_argument('--id-range', type=str,
+                      help='Re-export only messages in this inclusive ID range (e.g. 1000-1200)')
+    parser.add_argument('--chats', type=str,
+                      help='Export these chats concurrently (comma-separated: me, @username or chat ID)')
+    parser.add_argument('--backfill', action='store_true',
+                      help='Export the whole history with several worker processes (initial backfill)')
+    parser.add_argument('--workers', type=int,
+                      help=f'Worker processes for --backfill (default: {BACKFILL_WORKERS}) '
+                           f'and --rerender (default: one per CPU core), threads for --migrate-layout')
+    parser.add_argument('--build-pages', action='store_true',
+                      help='Add messages exported before ARCHIVE_PAGES was enabled to the archive pages')
+    parser.add_argument('--rerender', action='store_true',
+                      help='Render message.html/message.md again from the message cache, without Telegram')
+    parser.add_argument('--sinks', type=str,
+                      help='Outputs to write per message, comma-separated: html, markdown, ndjson, csv '
+                           '(default: OUTPUT_SINKS in config.py, html,markdown)')
+    parser.add_argument('--rebuild-sinks', action='store_true',
+                      help='Write messages.ndjson/messages.csv again from the message cache, without Telegram')
+    parser.add_argument('--migrate-layout', action='store_true',
+                      help='Move exported message folders to the LAYOUT set in config.py, without Telegram')
+    parser.add_argument('--rerender-stale', action='store_true',
+                      help='Like --rerender, but only pages written with older templates or settings '
+                           '(resumable, honours --max-duration)')
+    parser.add_argument('--watch', action='store_true',
+                      help='Keep running and export new, edited and deleted messages as they happen')
+    
+    parser.add_argument('--account', type=str,
+                      help='Use this account profile from ACCOUNTS in config.py')
+    parser.add_argument('--all-accounts', action='store_true',
+                      help='Export every account profile from ACCOUNTS concurrently')
     
-    parser.add_argument('--output', type=str, default=OUTPUT_DIR,
-                       help=f'Output directory (default: {OUTPUT_DIR})')
+    parser.add_argument('--output', type=str,
+                       help=f'Output directory (default: {OUTPUT_DIR}, or the account\'s output_dir)')
     
     parser.add_argument('--backup', action='store_true',
                        help='Backup exports to Google Drive after exporting')
@@ -88,11 +287,46 @@ Examples:
                        help='Only backup existing exports to Google Drive (skip export)')
     parser.add_argument('--keep-archive', action='store_true',
                        help='Keep local zip archive after uploading to Google Drive')
+    parser.add_argument('--disk-budget', type=str, default=DISK_BUDGET,
+                       help='With --backup, upload and delete folders during the export so local '
+                            'exports never exceed this size (e.g. 50G)')
+    parser.add_argument('--max-duration', type=str, default=MAX_DURATION,
+                       help='Stop taking new work before this much time has passed and save a '
+                            'checkpoint (e.g. 2h, 90m, 1h30m)')
+    parser.add_argument('--max-bytes', type=str, default=MAX_BYTES,
+                       help='Stop taking new work before this many bytes were downloaded and '
+                            'uploaded (e.g. 50G)')
     
     args = parser.parse_args()
     
+    # Each of these picks what the run does; combined, all but one would be silently ignored
+    modes = [flags for flags, selected in (
+        ('--ids/--id-range', args.ids or args.id_range),
+        ('--retry-failed', args.retry_failed),
+        ('--watch', args.watch),
+        ('--backfill', args.backfill),
+        ('--chats', args.chats),
+        ('--all-accounts', args.all_accounts),
+        ('--build-pages', args.build_pages),
+        ('--rerender/--rerender-stale', args.rerender or args.rerender_stale),
+        ('--rebuild-sinks', args.rebuild_sinks),
+        ('--migrate-layout', args.migrate_layout),
+        ('--backup-only', args.backup_only),
+    ) if selected]
+    if len(modes) > 1:
+        parser.error(f"{' and '.join(modes)} cannot be used together")
+    
+    # Select the account profile (the single config.py account unless ACCOUNTS is set)
+    try:
+        profiles = load_accounts()
+        account = get_account(args.account, profiles) if args.account else profiles[0]
+        check_storage_mode()
+    except (KeyError, ValueError) as e:
+        print(f"Error: {e}")
+        return
+    
     # Update output directory if specified
-    current_output_dir = OUTPUT_DIR
+    current_output_dir = account.output_dir
     if args.output:
         current_output_dir = args.output
         # We need to update the config module's OUTPUT_DIR
@@ -102,16 +336,83 @@ Examples:
     # Initialize database with the correct output directory
     db_path = init_database(current_output_dir)
     
+    # Parse the duration and transfer limits of this run
+    run_budget = None
+    if args.max_duration or args.max_bytes:
+        try:
+            run_budget = RunBudget(
+                max_seconds=parse_duration(args.max_duration) if args.max_duration else None,
+                max_bytes=parse_size(args.max_bytes) if args.max_bytes else None
+            )
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+    
     # Show stats if requested
     if args.stats:
         stats = get_export_stats(db_path)
-        if stats[0] > 0:
+        if stats['total_messages'] > 0:
             print(f"\n📊 Export Statistics:")
-            print(f"Total messages exported: {stats[0]}")
-            print(f"Messages with media: {stats[1]}")
-            print(f"Date range: {stats[2]} to {stats[3]}")
+            print(f"Total messages exported: {stats['total_messages']}")
+            print(f"Messages with media: {stats['with_media']}")
+            print(f"Date range: {stats['oldest']} to {stats['newest']}")
+            from formatters import render_version
+            versions = get_render_version_stats(db_path, render_version())
+            if versions['stale']:
+                print(f"Pages rendered with older templates: {versions['stale']} "
+                      f"(update with --rerender-stale)")
+            from page_store import page_store_path, get_page_store_stats
+            from progress import format_size
+            store = get_page_store_stats(page_store_path(Path(db_path).parent))
+            if store:
+                print(f"Page store: {store['files']} file(s) of {store['messages']} message(s), "
+                      f"{format_size(store['stored_bytes'])} ({format_size(store['bytes'])} uncompressed)")
         else:
             print("No messages have been exported yet.")
+        
+        failed = get_failed_export_stats(db_path)
+        if failed:
+            print(f"\n❌ Failed messages waiting for retry:")
+            for entry in failed:
+                print(f"  {entry['error_class']}: {entry['total']} ({entry['due']} due now)")
+        return
+    
+    # Select the outputs written per message
+    if args.sinks:
+        import bulk_export
+        try:
+            bulk_export.OUTPUT_SINKS = bulk_export.parse_sinks(args.sinks)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+    
+    if args.rebuild_sinks:
+        from bulk_export import rebuild_bulk_files
+        for export_dir in export_directories(current_output_dir):
+            result = rebuild_bulk_files(export_dir, init_database(export_dir))
+            if not result['files']:
+                print("Enable the ndjson or csv sink (OUTPUT_SINKS or --sinks) to write bulk files")
+                break
+            print(f"✓ Wrote {result['written']} message(s) to {', '.join(result['files'])}")
+            if result['uncached']:
+                print(f"  ⚠️ {result['uncached']} message(s) exported before the message cache existed are "
+                      f"missing; re-export them once with --force")
+        return
+    
+    # Move message folders to the configured layout (no Telegram connection needed)
+    if args.migrate_layout:
+        from migrate_layout import migrate_layout
+        try:
+            migrate_layout(current_output_dir, workers=args.workers)
+        except ValueError as e:
+            print(f"Error: {e}")
+        return
+    
+    # Render the pages again from the message cache (no Telegram connection needed)
+    if args.rerender or args.rerender_stale:
+        from rerender import rerender_all
+        rerender_all(current_output_dir, workers=args.workers, stale_only=args.rerender_stale,
+                     run_budget=run_budget)
         return
     
     # Handle backup-only mode
@@ -120,6 +421,7 @@ Examples:
         print("GOOGLE DRIVE BACKUP MODE (PER-FOLDER)")
         print("="*60)
         
+        from google_drive_backup import GoogleDriveBackup
         backup_handler = GoogleDriveBackup(
             credentials_file=GOOGLE_DRIVE_CREDENTIALS_FILE,
             token_file=GOOGLE_DRIVE_TOKEN_FILE
@@ -134,38 +436,44 @@ Examples:
             print("\n❌ Could not access Google Drive backup folder!")
             return
         
-        # Use per-folder backup
+        # Per-folder backup of the export and of every chat subtree
         cleanup = not (args.keep_archive or GOOGLE_DRIVE_KEEP_LOCAL_ARCHIVE)
-        stats = backup_handler.backup_individual_folders(
-            current_output_dir,
-            db_path,
-            cleanup_after_upload=cleanup
-        )
-        
-        print("\n" + "="*60)
-        print(f"BACKUP SUMMARY")
-        print("="*60)
-        print(f"✓ Successfully uploaded: {stats['success']}")
-        print(f"❌ Failed: {stats['failed']}")
-        print(f"⏭️  Skipped (already backed up): {stats['skipped']}")
-        
-        # Show database backup status
-        if 'database_backed_up' in stats:
-            if stats['database_backed_up']:
-                print(f"📊 Database backup: ✓ Success")
-            else:
-                print(f"📊 Database backup: ❌ Failed")
-        
-        if stats['success'] > 0:
-            if cleanup:
-                print(f"\n✓ Cleaned up {stats['success']} folders and archives")
-            print("\n✅ Backup completed successfully!")
-        elif stats['failed'] > 0:
-            print("\n⚠️  Some backups failed!")
-        else:
-            print("\n✓ Nothing to backup (all up to date)")
+        export_dirs = export_directories(current_output_dir)
+        for export_dir in export_dirs:
+            stats = backup_handler.backup_individual_folders(
+                export_dir,
+                init_database(export_dir),
+                cleanup_after_upload=cleanup,
+                run_budget=run_budget
+            )
+            print_backup_summary(stats, cleanup, export_dir if len(export_dirs) > 1 else None)
+        print_run_budget_summary(run_budget)
         return
     
+    # Parse targeted message IDs if provided
+    message_ids = None
+    if args.ids or args.id_range:
+        try:
+            message_ids = parse_message_ids(args.ids, args.id_range)
+        except ValueError as e:
+            print(f"Error: Invalid message IDs: {e}")
+            return
+        if not message_ids:
+            print("Error: No message IDs given")
+            return
+    
+    # Chats to export concurrently (Saved Messages only when none are configured)
+    chats = parse_chat_list(args.chats) if args.chats else list(account.chats)
+    
+    # Parse the local disk budget of the pipelined backup
+    disk_budget = None
+    if args.disk_budget:
+        try:
+            disk_budget = parse_size(args.disk_budget)
+        except ValueError as e:
+            print(f"Error: {e}")
+            return
+    
     # Parse date if provided
     from_date = None
     if args.from_date:
@@ -175,11 +483,25 @@ Examples:
         except ValueError:
             print("Error: Invalid date format. Use YYYY-MM-DD")
             return
+    elif args.all_accounts:
+        print(f"Exporting {len(profiles)} account(s) concurrently")
+    elif message_ids:
+        print(f"Re-exporting {len(message_ids)} selected message(s)")
+    elif args.watch:
+        print("Watching Saved Messages for changes")
+    elif args.backfill:
+        print(f"Backfilling the whole history with {args.workers or BACKFILL_WORKERS} worker process(es)")
+    elif args.retry_failed:
+        print("Retrying messages that failed in previous runs")
+    elif args.build_pages:
+        print("Building the archive pages of messages exported earlier")
+    elif chats:
+        print(f"Exporting {len(chats)} chat(s) concurrently")
     else:
         print("Exporting all saved messages (incremental - skipping already exported)")
     
-    # Check if credentials are set
-    if not API_ID or not API_HASH or API_ID == 'YOUR_API_ID' or API_HASH == 'YOUR_API_HASH':
+    # Check if credentials are set (each profile is checked on its own with --all-accounts)
+    if not args.all_accounts and not account.is_configured():
         print("\n⚠️  ERROR: Please configure your API credentials first!")
         print("\n1. Go to https://my.telegram.org/auth")
         print("2. Log in with your phone number")
@@ -192,9 +514,19 @@ Examples:
     
     # Pre-authenticate with Google Drive if backup is requested
     # This ensures authentication happens before the export starts
-    should_backup = args.backup or (GOOGLE_DRIVE_BACKUP_ENABLED and not args.backup_only)
+    # Watch mode never finishes, so there is no point after which to back up
+    should_backup = not args.watch and (args.backup or (GOOGLE_DRIVE_BACKUP_ENABLED and not args.backup_only))
     backup_handler = None
     
+    if disk_budget and not should_backup:
+        print("Error: --disk-budget evicts folders after upload and needs Google Drive backup (--backup)")
+        return
+    if run_budget is not None and (args.watch or args.backfill):
+        print("⚠️  --max-duration/--max-bytes are ignored with --watch and --backfill")
+        run_budget = None
+    if disk_budget and args.keep_archive:
+        print("⚠️  --keep-archive is ignored with --disk-budget (folders are deleted after upload)")
+    
     if should_backup:
         print("\n" + "="*60)
         print("GOOGLE DRIVE PRE-AUTHENTICATION")
@@ -202,6 +534,7 @@ Examples:
         print("Authenticating with Google Drive before starting export...")
         print("(This ensures backup will work after export completes)\n")
         
+        from google_drive_backup import GoogleDriveBackup
         backup_handler = GoogleDriveBackup(
             credentials_file=GOOGLE_DRIVE_CREDENTIALS_FILE,
             token_file=GOOGLE_DRIVE_TOKEN_FILE
@@ -230,56 +563,79 @@ Examples:
                 print("\n✓ Google Drive authentication successful!")
                 print("="*60 + "\n")
     
+    cleanup = not (args.keep_archive or GOOGLE_DRIVE_KEEP_LOCAL_ARCHIVE)
+    
+    if args.all_accounts:
+        results = await export_accounts(profiles, from_date=from_date, force_reexport=args.force,
+                                        run_budget=run_budget)
+        backup_targets = []
+        for result in results.values():
+            if result.get('error'):
+                continue
+            if 'chats' in result:
+                backup_targets.extend((stats['output_dir'], stats['db_path']) for stats in result['chats'].values())
+            else:
+                backup_targets.append((result['output_dir'], result['db_path']))
+        if backup_handler is not None:
+            backup_export_targets(backup_handler, backup_targets, cleanup, run_budget)
+        print_run_budget_summary(run_budget)
+        return
+    
     # Create Telegram client
-    client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+    client = account.create_client()
     
     try:
-        await client.start(phone=PHONE)
+        await client.start(phone=account.phone)
         print("✓ Connected to Telegram")
         
         # Export messages
-        await export_saved_messages(client, db_path, from_date=from_date, force_reexport=args.force, output_dir=current_output_dir)
+        from exporter import export_saved_messages, retry_failed_in_tree, export_messages_by_id, export_chats
+        backup_targets = [(current_output_dir, db_path)]
+        if message_ids:
+            await export_messages_by_id(client, db_path, message_ids, output_dir=current_output_dir)
+        elif args.watch:
+            from watch import watch_saved_messages
+            await watch_saved_messages(client, db_path, output_dir=current_output_dir)
+        elif args.backfill:
+            from backfill import backfill_saved_messages
+            await backfill_saved_messages(client, db_path, output_dir=current_output_dir,
+                                          workers=args.workers or BACKFILL_WORKERS,
+                                          session_name=account.session_name,
+                                          api_id=account.api_id, api_hash=account.api_hash)
+        elif args.retry_failed:
+            # Saved Messages and every chat subtree keep their own retry queue
+            await retry_failed_in_tree(client, current_output_dir, include_not_due=args.retry_all)
+            backup_targets = [(export_dir, init_database(export_dir))
+                              for export_dir in export_directories(current_output_dir)]
+        elif args.build_pages:
+            from archive_pages import build_archive_pages
+            pages = await build_archive_pages(client, db_path, current_output_dir)
+            print(f"\n✓ Archive pages: {pages['added']} message(s) added, {pages['pages_written']} of "
+                  f"{pages['pages_total']} page(s) written ({pages['missing']} deleted in Telegram)")
+            backup_targets = []
+        elif chats:
+            chat_results = await export_chats(client, chats, output_dir=current_output_dir,
+                                              from_date=from_date, force_reexport=args.force,
+                                              run_budget=run_budget)
+            # Every chat has its own folder tree and database to back up
+            backup_targets = [(result['output_dir'], result['db_path']) for result in chat_results.values()]
+        elif disk_budget and backup_handler is not None:
+            # Folders are uploaded and evicted while the export runs
+            from backup_pipeline import export_with_pipelined_backup
+            _, pipeline_stats = await export_with_pipelined_backup(
+                client, db_path, current_output_dir, backup_handler, disk_budget,
+                from_date=from_date, force_reexport=args.force, run_budget=run_budget
+            )
+            print_backup_summary(pipeline_stats, cleanup=True)
+            backup_targets = []
+        else:
+            await export_saved_messages(client, db_path, from_date=from_date, force_reexport=args.force,
+                                        output_dir=current_output_dir, run_budget=run_budget)
         
         # Backup to Google Drive if pre-authenticated handler exists
-        if backup_handler is not None:
-            print("\n" + "="*60)
-            print("BACKING UP TO GOOGLE DRIVE (PER-FOLDER)")
-            print("="*60)
-            print("Note: Each message folder will be archived and uploaded separately.")
-            print("Source folders and archives will be deleted after successful upload.\n")
-            
-            # Use per-folder backup with cleanup
-            cleanup = not (args.keep_archive or GOOGLE_DRIVE_KEEP_LOCAL_ARCHIVE)
-            stats = backup_handler.backup_individual_folders(
-                current_output_dir,
-                db_path,
-                cleanup_after_upload=cleanup
-            )
-            
-            print("\n" + "="*60)
-            print(f"BACKUP SUMMARY")
-            print("="*60)
-            print(f"✓ Successfully uploaded: {stats['success']}")
-            print(f"❌ Failed: {stats['failed']}")
-            print(f"⏭️  Skipped (already backed up): {stats['skipped']}")
-            
-            # Show database backup status
-            if 'database_backed_up' in stats:
-                if stats['database_backed_up']:
-                    print(f"📊 Database backup: ✓ Success")
-                else:
-                    print(f"📊 Database backup: ❌ Failed")
-            
-            if stats['success'] > 0:
-                if cleanup:
-                    print(f"\n✓ Cleaned up {stats['success']} folders and archives")
-                else:
-                    print(f"\n⚠️  Local folders and archives kept (--keep-archive)")
-                print("\n✅ Backup completed successfully!")
-            elif stats['failed'] > 0:
-                print("\n⚠️  Some backups failed, check messages above")
-            else:
-                print("\n✓ Nothing to backup (all up to date)")
+        if backup_handler is not None and backup_targets:
+            backup_export_targets(backup_handler, backup_targets, cleanup, run_budget)
+        print_run_budget_summary(run_budget)
         
     except Exception as e:
         print(f"Error: {e}")
@@ -296,4 +652,6 @@ if __name__ == '__main__':
         print(f"\n\n❌ Unexpected error: {e}")
     finally:
         print("\n" + "="*60)
-        input("Press Enter to exit...")
\ No newline at end of file
+        # Scheduled runs (cron, Task Scheduler) have no console to wait for
+        if sys.stdin.isatty():
+            input("Press Enter to exit...")
\ No newline at end of file
@@ -2,103 +2,110 @@
 Media download functionality for Telegram messages
 """
 
+import asyncio
 import os
 import time
 from pathlib import Path
+from telethon.errors import FileReferenceExpiredError, RPCError
+from progress import format_size, get_aggregator
 
 
 def format_file_size(size_bytes):
     """Convert bytes to human readable format."""
     if size_bytes == 0:
         return "0 B"
+    return format_size(size_bytes)
+
+
+def file_checksum(file_path, chunk_size=1024 * 1024):
+    """Calculate the SHA-256 checksum of a file."""
+    import hashlib
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def message_media_id(message):
+    """ID of the photo or document of a message, or None (no media, web preview, poll...)."""
+    media = getattr(message, 'media', None)
+    item = getattr(media, 'photo', None) or getattr(media, 'document', None)
+    return getattr(item, 'id', None)
+
+
+def find_completed_media(message_folder, journal_entry):
+    """Return the journaled media filename if the file on disk is still intact.
     
-    size_names = ["B", "KB", "MB", "GB", "TB"]
-    import math
-    i = int(math.floor(math.log(size_bytes, 1024)))
-    p = math.pow(1024, i)
-    s = round(size_bytes / p, 2)
-    return f"{s} {size_names[i]}"
+    The file must exist with the recorded size and checksum, otherwise it is
+    treated as incomplete and downloaded again.
+    """
+    if not journal_entry or not journal_entry.get('media_done') or not journal_entry.get('media_filename'):
+        return None
+    
+    media_path = Path(message_folder) / journal_entry['media_filename']
+    try:
+        if media_path.stat().st_size != journal_entry['media_size']:
+            return None
+        if journal_entry['media_sha256'] and file_checksum(media_path) != journal_entry['media_sha256']:
+            return None
+    except OSError:
+        return None
+    return journal_entry['media_filename']
 
 
 class DownloadProgress:
-    """Progress tracker for media downloads with filename awareness."""
+    """Progress callback for a single media download.
     
-    def __init__(self, total_size, file_name=None, cancel_event=None):
+    The callback only records counters in the shared progress aggregator,
+    which renders one combined line for all concurrent downloads.
+    """
+    
+    def __init__(self, total_size, file_name=None, cancel_event=None, transfer=None, aggregator=None):
         self.total_size = total_size
         self.downloaded = 0
         self.start_time = time.time()
-        self.last_update = 0
         self.completed = False
         self.cancel_event = cancel_event
+        # Watchdog handle notified on every chunk
+        self.transfer = transfer
         # Store a short display name for progress output
         self.file_name = (file_name[:40] + '…') if file_name and len(file_name) > 40 else file_name
+        self.aggregator = aggregator or get_aggregator()
+        self.key = self.aggregator.start(self.file_name, total_size, kind='download')
         
     def __call__(self, current, total):
         """Progress callback function."""
         # Check for cancellation immediately
         if self.cancel_event and self.cancel_event.is_set():
+            self.aggregator.finish(self.key)
             raise Exception("Download cancelled by user")
         
+        if self.transfer is not None:
+            self.transfer.touch(current)
+        
         self.downloaded = current
         self.total_size = total
-        
-        # Update progress every 256KB or every 0.75 second for more responsive UI
-        now = time.time()
-        if (current - self.last_update > 256 * 1024) or (now - self.start_time > 0.75 and now - self.last_update > 0.75):
-            self.last_update = current
-            
-            # Check cancellation again during update
-            if self.cancel_event and self.cancel_event.is_set():
-                raise Exception("Download cancelled by user")
-            
-            if total > 0:
-                percentage = (current / total) * 100
-                downloaded_str = format_file_size(current)
-                total_str = format_file_size(total)
-                
-                # Calculate speed & ETA
-                elapsed = now - self.start_time
-                if elapsed > 0:
-                    speed = current / elapsed
-                    speed_str = format_file_size(speed) + "/s"
-                    remaining_bytes = max(total - current, 0)
-                    eta_seconds = int(remaining_bytes / speed) if speed > 0 else 0
-                    eta_str = f"{eta_seconds}s" if speed > 0 else "∞"
-                else:
-                    speed_str = "0 B/s"
-                    eta_str = "∞"
-                
-                # Create progress bar
-                progress_width = 20
-                filled_width = int(progress_width * percentage / 100)
-                bar = "█" * filled_width + "░" * (progress_width - filled_width)
-                
-                # Include filename if available
-                name_part = f"{self.file_name} " if self.file_name else ""
-                
-                # Use carriage return to overwrite the same line
-                progress_line = (
-                    f"\r      📥 {name_part}{percentage:5.1f}% [{bar}] "
-                    f"{downloaded_str}/{total_str} at {speed_str} - ETA: {eta_str}"
-                )
-                print(progress_line, end="", flush=True)
-                
-                # Mark as completed if we've reached 100%
-                if percentage >= 100 and not self.completed:
-                    self.completed = True
+        self.aggregator.update(self.key, current, total)
+        if total > 0 and current >= total:
+            self.completed = True
     
     def finish(self):
         """Show final completion status."""
-        if not self.completed and self.total_size > 0:
+        self.aggregator.finish(self.key)
+        if self.total_size > 0:
             downloaded_str = format_file_size(self.total_size)
-            total_str = downloaded_str
             elapsed = time.time() - self.start_time
             speed_str = format_file_size(self.total_size / elapsed) + "/s" if elapsed > 0 else "∞ B/s"
             bar = "█" * 20
             name_part = f"{self.file_name} " if self.file_name else ""
-            progress_line = f"\r      📥 {name_part}100.0% [{bar}] {downloaded_str}/{total_str} at {speed_str} - DONE!"
+            progress_line = f"\r      📥 {name_part}100.0% [{bar}] {downloaded_str}/{downloaded_str} at {speed_str} - DONE!"
             print(progress_line, flush=True)
             self.completed = True
+    
+    def abandon(self):
+        """Drop an unfinished download from the live view."""
+        self.aggregator.finish(self.key, completed=False)
 
 
 def cleanup_existing_media(message_folder, filename_base):
@@ -125,8 +132,12 @@ def cleanup_existing_media(message_folder, filename_base):
         print(f"    - Warning: Could not clean up existing media files: {e}")
 
 
-async def download_media(client, message, message_folder, filename_base, cancel_event=None):
-    """Download media from a message and save it in the message folder."""
+async def download_media(client, message, message_folder, filename_base, cancel_event=None, transfer=None):
+    """Download media from a message and save it in the message folder.
+    
+    If a watchdog ``transfer`` handle is given it is touched on every
+    progress callback so stalled downloads can be detected.
+    """
     if not message.media:
         return None
     
@@ -169,25 +180,35 @@ async def download_media(client, message, message_folder, filename_base, cancel_
                             file_display_name = attr.file_name
                             break
                 if doc.size:
-                    progress_callback = DownloadProgress(doc.size, file_name=file_display_name, cancel_event=cancel_event)
+                    progress_callback = DownloadProgress(doc.size, file_name=file_display_name,
+                                                         cancel_event=cancel_event, transfer=transfer)
         except Exception as e:
             print(f"    - Note: Couldn't extract original filename: {e}")
         
+        # Photos and unsized documents still report progress to the watchdog
+        if progress_callback is None and transfer is not None:
+            progress_callback = lambda current, total: transfer.touch(current)
+        
         # Download the media to the message folder with progress tracking
-        if progress_callback:
-            file_path = await client.download_media(
-                message.media, 
-                file=message_folder, 
-                progress_callback=progress_callback
-            )
-        else:
-            file_path = await client.download_media(message.media, file=message_folder)
+        file_path = None
+        try:
+            if progress_callback:
+                file_path = await client.download_media(
+                    message.media, 
+                    file=message_folder, 
+                    progress_callback=progress_callback
+                )
+            else:
+                file_path = await client.download_media(message.media, file=message_folder)
+        finally:
+            # Failed, cancelled or stalled downloads leave the live progress view
+            if isinstance(progress_callback, DownloadProgress) and not file_path:
+                progress_callback.abandon()
         
         if file_path:
             # Show final completion status
-            if progress_callback:
+            if isinstance(progress_callback, DownloadProgress):
                 progress_callback.finish()
-                print()  # New line after progress bar
             
             # Get final file size
             final_size = os.path.getsize(file_path)
@@ -208,7 +229,17 @@ async def download_media(client, message, message_folder, filename_base, cancel_
             return new_name
         else:
             print(f"    - Media download returned None")
+    except FileReferenceExpiredError:
+        # Let the exporter refresh the message and retry with a fresh reference
+        print(f"\n    - File reference expired for message {message.id}")
+        raise
+    except (RPCError, ConnectionError, asyncio.TimeoutError) as e:
+        # Flood waits, timeouts and other Telegram/network errors go to safe_operation,
+        # which retries them and reports congestion to the concurrency controller
+        print(f"    - Media download interrupted: {type(e).__name__}: {e}")
+        raise
     except Exception as e:
+        # Local problems (file system, unexpected media) only fail this file
         print(f"    - Failed to download media: {e}")
     
     return None
\ No newline at end of file
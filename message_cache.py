@@ -0,0 +1,156 @@
+"""
+Raw message cache for rendering pages again without Telegram
+
+Every exported message is also stored in the database in a compact form:
+the text, its entities, forward info, media descriptor and web preview as
+zlib-compressed JSON. ``main.py --rerender`` rebuilds message.html and
+message.md from this cache after a template or formatter change, instead
+of fetching the whole history again with ``--force``.
+
+load_message turns a cached entry back into a CachedMessage, which has the
+attributes the formatters read from a Telethon message. Entities and media
+get stand-in classes with the Telethon class names, because text_render and
+the templates tell them apart by name.
+"""
+
+import json
+import zlib
+from datetime import datetime
+from functools import lru_cache
+
+# Import configuration
+try:
+    from config import MESSAGE_CACHE
+except ImportError:
+    MESSAGE_CACHE = True
+
+# Bumped when the serialized layout changes; older entries are still read
+CACHE_FORMAT = 1
+
+# Entity attributes besides offset and length worth keeping
+ENTITY_FIELDS = ('url', 'user_id', 'language')
+
+
+class CachedObject:
+    """Attribute bag standing in for a Telethon object."""
+
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+@lru_cache(maxsize=None)
+def _stand_in(type_name):
+    """CachedObject subclass named like the Telethon class it replaces."""
+    return type(type_name, (CachedObject,), {})
+
+
+class CachedMessage:
+    """A message rebuilt from the cache, with the fields the formatters use."""
+
+    def __init__(self, data):
+        self.id = data['id']
+        self.date = datetime.fromisoformat(data['date'])
+        self.message = data.get('message') or ''
+        self.text = self.message
+        self.raw_text = self.message
+        self.entities = [_stand_in(name)(offset=offset, length=length, **extra)
+                         for name, offset, length, extra in data.get('entities', ())]
+
+        media = data.get('media')
+        self.media = _stand_in(media['type'])(caption=media.get('caption')) if media else None
+        self.file = CachedObject(name=media.get('name'), mime_type=media.get('mime_type'),
+                                 size=media.get('size')) if media and media.get('size') is not None else None
+
+        forward = data.get('forward')
+        self.forward = None
+        if forward:
+            channel_id = forward.get('channel_id')
+            self.forward = CachedObject(
+                from_name=forward.get('from_name'),
+                date=datetime.fromisoformat(forward['date']) if forward.get('date') else None,
+                from_id=_stand_in('PeerChannel')(channel_id=channel_id) if channel_id else None,
+                channel_post=forward.get('channel_post'),
+            )
+
+        preview = data.get('web_preview')
+        self.web_preview = CachedObject(**preview) if preview else None
+
+    def __repr__(self):
+        return f"CachedMessage(id={self.id}, date={self.date.isoformat()})"
+
+
+def _serialize_entity(entity):
+    extra = {field: getattr(entity, field) for field in ENTITY_FIELDS if getattr(entity, field, None) is not None}
+    return [type(entity).__name__, entity.offset, entity.length, extra]
+
+
+def _serialize_media(message):
+    media = message.media
+    if media is None:
+        return None
+    descriptor = {'type': type(media).__name__}
+    caption = getattr(media, 'caption', None)
+    if caption:
+        descriptor['caption'] = caption
+    # message.file describes photos and documents; other media (polls, venues...) have none
+    file = getattr(message, 'file', None)
+    for field in ('name', 'mime_type', 'size'):
+        value = getattr(file, field, None) if file is not None else None
+        if isinstance(value, (str, int)):
+            descriptor[field] = value
+    return descriptor
+
+
+def _serialize_forward(message):
+    forward = message.forward
+    if not forward:
+        return None
+    from_id = getattr(forward, 'from_id', None)
+    return {
+        'from_name': getattr(forward, 'from_name', None),
+        'date': forward.date.isoformat() if getattr(forward, 'date', None) else None,
+        'channel_id': getattr(from_id, 'channel_id', None) if from_id else None,
+        'channel_post': getattr(forward, 'channel_post', None),
+    }
+
+
+def _serialize_web_preview(message):
+    preview = getattr(message, 'web_preview', None)
+    if not preview:
+        return None
+    return {'url': preview.url, 'title': getattr(preview, 'title', None),
+            'description': getattr(preview, 'description', None)}
+
+
+def message_data(message):
+    """The cached fields of a message as a JSON-serializable dictionary."""
+    data = {
+        'format': CACHE_FORMAT,
+        'id': message.id,
+        'date': message.date.isoformat(),
+        'message': getattr(message, 'message', None) or '',
+    }
+    entities = getattr(message, 'entities', None)
+    if entities:
+        data['entities'] = [_serialize_entity(entity) for entity in entities]
+    for key, value in (('media', _serialize_media(message)), ('forward', _serialize_forward(message)),
+                       ('web_preview', _serialize_web_preview(message))):
+        if value:
+            data[key] = value
+    return data
+
+
+def serialize_message(message):
+    """Compact serialized form of a message (zlib-compressed JSON bytes)."""
+    data = json.dumps(message_data(message), ensure_ascii=False, separators=(',', ':'))
+    return zlib.compress(data.encode('utf-8'), 6)
+
+
+def load_data(blob):
+    """The dictionary of message_data back from serialize_message output."""
+    return json.loads(zlib.decompress(blob))
+
+
+def load_message(blob):
+    """Rebuild a message from serialize_message output."""
+    return CachedMessage(load_data(blob))
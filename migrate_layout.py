@@ -0,0 +1,181 @@
+"""
+Move exported message folders to the configured LAYOUT
+
+``main.py --migrate-layout`` moves every message folder of the export (and
+of each chat subtree) to its place in LAYOUT, e.g. from the flat layout to
+``YYYY/MM/<folder>``. Folders are renamed by a pool of threads, a batch at
+a time; the new paths of a batch are recorded in the database in one
+transaction once its folders are moved. A migration that is interrupted
+can simply be run again: folders already in place are skipped, and a
+folder moved before its batch was recorded is still found by
+layout.message_folder_path.
+
+Pages that link the shared stylesheet get its new relative path. Archive
+bubbles and search index files that link the moved folders are updated as
+well, and messages.ndjson / messages.csv are rebuilt with the new media
+paths. Messages whose folder no longer exists locally (uploaded and deleted)
+only get their recorded path updated.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import quote
+
+from database import (export_directories, init_database, get_exported_file_paths, record_moved_folders,
+                      get_cached_messages, get_message_cache_stats)
+from layout import LAYOUT, layout_folder, message_folder_path, relative_folder
+from archive_pages import ARCHIVE_PAGES, update_archive_pages
+from search_index import SEARCH_INDEX, DOC_BUCKET_SIZE, update_search_index
+from bulk_export import sink_enabled, rebuild_bulk_files
+from formatters import relink_stylesheet
+
+# Folders renamed per database transaction
+MIGRATE_BATCH_SIZE = 1000
+# Renames running at once; mostly waiting on the file system (network drives, antivirus)
+MIGRATE_WORKERS = 8
+
+SAVED_MESSAGES_TITLE = "Saved Messages"
+
+
+def _fix_stylesheet_link(output_dir, folder):
+    """Point the page of a message folder to the shared stylesheet from where the folder is now.
+
+    Whatever depth the link was written for, so a folder moved by a run that
+    stopped before rewriting its page is repaired too.
+    """
+    page = folder / "message.html"
+    if not page.is_file():
+        return
+    html = page.read_text(encoding='utf-8')
+    fixed = relink_stylesheet(html, Path(os.path.relpath(output_dir, folder)).as_posix())
+    if fixed != html:
+        page.write_text(fixed, encoding='utf-8')
+
+
+def _move_folder(output_dir, source, target):
+    """Move one message folder and fix the relative link of its page to the shared stylesheet.
+
+    Returns:
+        None on success, otherwise the reason the folder was left in place
+    """
+    if target.exists():
+        return f"{target} already exists"
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        source.rename(target)
+    except OSError as e:
+        return str(e)
+    _fix_stylesheet_link(output_dir, target)
+    return None
+
+
+def _remove_empty_parents(output_dir, folders):
+    """Drop year/month directories left empty below the export directory."""
+    output_dir = Path(output_dir).resolve()
+    for folder in sorted(folders, key=lambda path: len(path.parts), reverse=True):
+        while folder.resolve() != output_dir and output_dir in folder.resolve().parents:
+            try:
+                folder.rmdir()
+            except OSError:
+                break
+            folder = folder.parent
+
+
+def migrate_export(output_dir, db_path, executor, layout=None):
+    """Move the message folders of one export directory to ``layout``.
+
+    Returns:
+        Dictionary with 'moved', 'recorded' (path updated without a local
+        folder), 'unchanged' and 'failed' counts
+    """
+    layout = layout or LAYOUT
+    output_dir = Path(output_dir)
+    stats = {'moved': 0, 'recorded': 0, 'unchanged': 0, 'failed': 0}
+    rows = get_exported_file_paths(db_path)
+    vacated = set()
+    for start in range(0, len(rows), MIGRATE_BATCH_SIZE):
+        moves, jobs = [], []
+        for message_id, file_path in rows[start:start + MIGRATE_BATCH_SIZE]:
+            old_folder = relative_folder(file_path)
+            new_folder = layout_folder(Path(file_path).parent.name, layout)
+            target = output_dir / new_folder
+            source = message_folder_path(output_dir, file_path)
+            new_path = str(target / Path(file_path).name)
+            if source is not None and source.resolve() == target.resolve():
+                # Already in place (an earlier, interrupted run); only the record may be behind
+                if file_path != new_path:
+                    # That run may also have stopped between the move and the stylesheet link
+                    _fix_stylesheet_link(output_dir, target)
+                    moves.append((message_id, new_path, old_folder, new_folder))
+                stats['unchanged'] += 1
+                continue
+            if source is None:
+                if file_path != new_path:
+                    moves.append((message_id, new_path, old_folder, new_folder))
+                    stats['recorded'] += 1
+                else:
+                    stats['unchanged'] += 1
+                continue
+            jobs.append((message_id, new_path, old_folder, new_folder, source,
+                         executor.submit(_move_folder, output_dir, source, target)))
+        for message_id, new_path, old_folder, new_folder, source, future in jobs:
+            error = future.result()
+            if error:
+                stats['failed'] += 1
+                print(f"  ⚠️ Could not move {source.name}: {error}")
+                continue
+            moves.append((message_id, new_path, old_folder, new_folder))
+            vacated.add(source.parent)
+            stats['moved'] += 1
+        record_moved_folders(db_path, [(message_id, new_path, f'"../{quote(old)}/', f'"../{quote(new)}/')
+                                       for message_id, new_path, old, new in moves], DOC_BUCKET_SIZE)
+        print(f"  Migrated {min(start + MIGRATE_BATCH_SIZE, len(rows))}/{len(rows)} message(s)...")
+    _remove_empty_parents(output_dir, vacated)
+
+    if (stats['moved'] or stats['recorded']) and (sink_enabled('ndjson') or sink_enabled('csv')):
+        # The media paths in the bulk files are relative to the export directory
+        uncached = get_message_cache_stats(db_path)['uncached']
+        if uncached:
+            # A rebuild from the cache would drop their lines
+            print(f"  ⚠️ Bulk files keep the old media paths: {uncached} message(s) are not in the message "
+                  f"cache; re-export them with --force, then run --rebuild-sinks")
+        else:
+            rebuilt = rebuild_bulk_files(output_dir, db_path)
+            print(f"  Rebuilt {', '.join(Path(path).name for path in rebuilt['files'])} "
+                  f"with {rebuilt['written']} message(s)")
+
+    if ARCHIVE_PAGES or SEARCH_INDEX:
+        # Chat exports keep their title on the pages
+        newest = get_cached_messages(db_path, limit=1)
+        chat_title = newest[0][1] if newest and newest[0][1] else SAVED_MESSAGES_TITLE
+        if ARCHIVE_PAGES:
+            update_archive_pages(output_dir, db_path, chat_title)
+        if SEARCH_INDEX:
+            update_search_index(output_dir, db_path, chat_title)
+    return stats
+
+
+def migrate_layout(output_dir, layout=None, workers=None):
+    """Move the message folders of the export and of every chat subtree to ``layout`` (default LAYOUT).
+
+    Returns:
+        Dictionary mapping export directory to its statistics
+    """
+    layout = layout or LAYOUT
+    # Fails early on an unknown layout
+    layout_folder('', layout)
+    results = {}
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=workers or MIGRATE_WORKERS) as executor:
+        for target in export_directories(output_dir):
+            print(f"🗂️ Moving message folders of {target} to the '{layout}' layout")
+            results[str(target)] = migrate_export(target, init_database(target), executor, layout)
+
+    moved = sum(stats['moved'] for stats in results.values())
+    failed = sum(stats['failed'] for stats in results.values())
+    print(f"\n✓ Moved {moved} folder(s) in {time.time() - started:.1f}s")
+    if failed:
+        print(f"  ⚠️ {failed} folder(s) could not be moved; run --migrate-layout again after fixing the cause")
+    return results
@@ -0,0 +1,260 @@
+"""
+Database-backed storage of rendered pages and small media
+
+With STORAGE_MODE = 'sqlite' the exporter does not create a folder with
+message.html and message.md for every message. The pages, and media files up
+to INLINE_MEDIA_MAX_BYTES, are stored as blobs in ``export_pages.db`` next to
+export_history.db instead; only messages with larger media still get a
+folder on disk for that file. Pages are zlib-compressed unless
+PAGE_STORE_COMPRESS is False. Media is stored as is (photos and videos are
+compressed already).
+
+A big account then takes a handful of files instead of millions of inodes,
+which keeps directory listings, backups, antivirus scans and sync tools
+fast. The web server serves the pages and media straight from the container
+under /messages/<message_id>/<name>. Archive and search pages link message
+folders, so ARCHIVE_PAGES and SEARCH_INDEX cannot be combined with it.
+"""
+
+import mimetypes
+import sqlite3
+import zlib
+from pathlib import Path
+
+from database import DB_BUSY_TIMEOUT
+
+# Import configuration
+try:
+    from config import STORAGE_MODE
+except ImportError:
+    STORAGE_MODE = 'files'
+
+try:
+    from config import INLINE_MEDIA_MAX_BYTES
+except ImportError:
+    INLINE_MEDIA_MAX_BYTES = 512 * 1024
+
+try:
+    from config import PAGE_STORE_COMPRESS
+except ImportError:
+    PAGE_STORE_COMPRESS = True
+
+STORAGE_MODES = ('files', 'sqlite')
+
+PAGE_STORE_FILENAME = 'export_pages.db'
+
+# Page files are text and compress well; media is stored as is
+PAGE_NAMES = ('message.html', 'message.md')
+
+# Stores whose tables exist, checked once per process
+_initialized = set()
+
+
+def page_store_path(output_dir):
+    return Path(output_dir) / PAGE_STORE_FILENAME
+
+
+def uses_page_store():
+    if STORAGE_MODE not in STORAGE_MODES:
+        raise ValueError(f"Unknown STORAGE_MODE {STORAGE_MODE!r} (choose from {', '.join(STORAGE_MODES)})")
+    return STORAGE_MODE == 'sqlite'
+
+
+def check_storage_mode():
+    """Refuse settings whose output would link folders the storage mode does not write.
+
+    Raises:
+        ValueError: For an unknown STORAGE_MODE, or 'sqlite' together with
+            ARCHIVE_PAGES or SEARCH_INDEX
+    """
+    from archive_pages import ARCHIVE_PAGES
+    from search_index import SEARCH_INDEX
+
+    if uses_page_store() and (ARCHIVE_PAGES or SEARCH_INDEX):
+        raise ValueError("ARCHIVE_PAGES and SEARCH_INDEX need STORAGE_MODE = 'files': their pages link "
+                         "message folders, which 'sqlite' storage does not write")
+
+
+def _connect(store_path):
+    """Open the container, creating its tables on first use."""
+    conn = sqlite3.connect(store_path, timeout=DB_BUSY_TIMEOUT)
+    key = str(Path(store_path).resolve())
+    if key not in _initialized:
+        # Workers (backfill, --rerender) write concurrently
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                message_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                data BLOB NOT NULL,
+                compressed INTEGER NOT NULL DEFAULT 0,
+                size INTEGER NOT NULL,
+                updated TEXT DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (message_id, name)
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_files_updated ON files (updated)')
+        # Bookkeeping of the container itself (last backup)
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS store_info (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        conn.commit()
+        _initialized.add(key)
+    return conn
+
+
+def _encode(name, content):
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    if PAGE_STORE_COMPRESS and name in PAGE_NAMES:
+        return zlib.compress(data, 6), 1, len(data)
+    return data, 0, len(data)
+
+
+def store_message_files(store_path, message_id, files, replace=False):
+    """Store files of a message in one transaction.
+
+    Args:
+        store_path: Path of the container (page_store_path)
+        message_id: Message the files belong to
+        files: List of (name, content); content is str (pages) or bytes (media)
+        replace: Drop the other stored files of the message (a re-export)
+    """
+    conn = _connect(store_path)
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        if replace:
+            conn.execute('DELETE FROM files WHERE message_id = ?', (message_id,))
+        conn.executemany('''
+            INSERT OR REPLACE INTO files (message_id, name, data, compressed, size, updated)
+            VALUES (?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', [(message_id, name, *_encode(name, content)) for name, content in files])
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def inline_media(media_path):
+    """Content of a downloaded media file small enough for the container, or None."""
+    media_path = Path(media_path)
+    if media_path.stat().st_size > INLINE_MEDIA_MAX_BYTES:
+        return None
+    return media_path.read_bytes()
+
+
+def read_message_file(store_path, message_id, name):
+    """Content of a stored file (bytes), or None if the container does not have it."""
+    if not Path(store_path).exists():
+        return None
+    conn = _connect(store_path)
+    row = conn.execute('SELECT data, compressed FROM files WHERE message_id = ? AND name = ?',
+                       (message_id, name)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    return zlib.decompress(row[0]) if row[1] else row[0]
+
+
+def has_message_files(store_path, message_id, names):
+    """Whether the container has all of these files of a message."""
+    if not Path(store_path).exists():
+        return False
+    conn = _connect(store_path)
+    count = conn.execute(f'''
+        SELECT COUNT(*) FROM files WHERE message_id = ? AND name IN ({','.join('?' * len(names))})
+    ''', (message_id, *names)).fetchone()[0]
+    conn.close()
+    return count == len(names)
+
+
+def content_type(name):
+    """Content type of a stored file, for serving it over HTTP."""
+    if name.endswith('.md'):
+        return 'text/markdown; charset=utf-8'
+    guessed = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    return f"{guessed}; charset=utf-8" if guessed.startswith('text/') else guessed
+
+
+def get_page_store_stats(store_path):
+    """Size of the container.
+
+    Returns:
+        Dictionary with 'messages', 'files', 'bytes' (uncompressed) and
+        'stored_bytes', or None if there is no container
+    """
+    if not Path(store_path).exists():
+        return None
+    conn = _connect(store_path)
+    messages, files, size, stored = conn.execute('''
+        SELECT COUNT(DISTINCT message_id), COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0)
+        FROM files
+    ''').fetchone()
+    conn.close()
+    return {'messages': messages, 'files': files, 'bytes': size, 'stored_bytes': stored}
+
+
+def changed_since_backup(store_path):
+    """Whether files were stored after the last backup of the container."""
+    if not Path(store_path).exists():
+        return False
+    conn = _connect(store_path)
+    latest = conn.execute('SELECT MAX(updated) FROM files').fetchone()[0]
+    row = conn.execute("SELECT value FROM store_info WHERE key = 'backed_up'").fetchone()
+    conn.close()
+    return latest is not None and (row is None or latest > row[0])
+
+
+def snapshot(store_path, target_path):
+    """Consistent copy of the container while exports may be writing to it.
+
+    Returns:
+        Value to pass to mark_backed_up once the copy is uploaded
+    """
+    conn = _connect(store_path)
+    latest = conn.execute('SELECT MAX(updated) FROM files').fetchone()[0]
+    target = sqlite3.connect(target_path)
+    try:
+        conn.backup(target)
+    finally:
+        target.close()
+        conn.close()
+    return latest
+
+
+def mark_backed_up(store_path, latest):
+    conn = _connect(store_path)
+    conn.execute("INSERT OR REPLACE INTO store_info (key, value) VALUES ('backed_up', ?)", (latest,))
+    conn.commit()
+    conn.close()
+
+
+def store_exported_message(output_dir, message_id, pages, media_path=None):
+    """Store the pages of an exported message, and its media if it is small enough.
+
+    Args:
+        output_dir: Export directory (the container is at its root)
+        message_id: Exported message
+        pages: List of (name, content) of the enabled page sinks
+        media_path: Downloaded media file, or None
+
+    Returns:
+        True if the media was stored too; the file can then be deleted with
+        remove_inlined_media once the message is recorded as exported
+    """
+    media = inline_media(media_path) if media_path is not None else None
+    files = list(pages) + ([(Path(media_path).name, media)] if media is not None else [])
+    store_message_files(page_store_path(output_dir), message_id, files, replace=True)
+    return media is not None
+
+
+def remove_inlined_media(media_path):
+    """Delete a media file kept in the container, and its folder if nothing else is left."""
+    media_path = Path(media_path)
+    media_path.unlink(missing_ok=True)
+    try:
+        media_path.parent.rmdir()
+    except OSError:
+        # Other files (a failed page write from files mode, user notes) stay
+        pass
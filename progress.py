@@ -0,0 +1,242 @@
+"""
+Aggregated progress reporting for concurrent downloads, archives and uploads
+"""
+
+import contextvars
+import threading
+import time
+
+# Import configuration
+try:
+    from config import PROGRESS_FPS
+except ImportError:
+    PROGRESS_FPS = 4
+
+SIZE_UNITS = ("B", "KB", "MB", "GB", "TB")
+
+
+def format_size(size_bytes):
+    """Convert bytes to a human readable string without math.log/pow."""
+    size = float(size_bytes)
+    for unit in SIZE_UNITS[:-1]:
+        if size < 1024:
+            return f"{round(size, 2)} {unit}"
+        size /= 1024
+    return f"{round(size, 2)} {SIZE_UNITS[-1]}"
+
+
+def format_eta(seconds):
+    """Format an ETA in seconds as 42s, 3m5s or H:MM:SS."""
+    if seconds is None:
+        return "∞"
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    if seconds >= 60:
+        return f"{seconds // 60}m{seconds % 60}s"
+    return f"{seconds}s"
+
+
+class _TransferState:
+    __slots__ = ('name', 'kind', 'current', 'total', 'started', 'files_done', 'files_total')
+
+    def __init__(self, name, kind, total):
+        self.name = name
+        self.kind = kind
+        self.current = 0
+        self.total = total or 0
+        self.started = time.monotonic()
+        self.files_done = 0
+        self.files_total = 0
+
+
+class ProgressAggregator:
+    """Collect progress of all in-flight transfers and render one combined view.
+
+    Progress callbacks only store counters (cheap, thread-safe). Formatting
+    and printing happen at most ``fps`` times per second, producing a single
+    carriage-return line with the per-transfer percentages plus total
+    throughput and ETA. ``snapshot()`` exposes the same data to the GUI and
+    web server.
+    """
+
+    def __init__(self, fps=PROGRESS_FPS, output=print):
+        self.frame_interval = 1.0 / fps if fps > 0 else 0
+        self.output = output
+        self._lock = threading.Lock()
+        self._transfers = {}
+        self._next_key = 0
+        self._fields = {}
+        self.reset()
+
+    def reset(self):
+        """Forget all transfers and counters at the start of a run."""
+        with self._lock:
+            self._transfers.clear()
+            self._fields = {}
+            self.started = time.monotonic()
+            self.bytes_done = 0
+            self.completed = 0
+            self._last_render = 0.0
+            self._rate_bytes = 0
+            self._rate_time = self.started
+            self.speed = 0.0
+
+    def start(self, name, total=0, kind='download'):
+        """Register a transfer and return its key."""
+        with self._lock:
+            self._next_key += 1
+            key = self._next_key
+            self._transfers[key] = _TransferState(name, kind, total)
+        return key
+
+    def update(self, key, current, total=None, files_done=None, files_total=None):
+        """Record progress of a transfer (called from progress callbacks)."""
+        with self._lock:
+            state = self._transfers.get(key)
+            if state is None:
+                return
+            if current > state.current:
+                self.bytes_done += current - state.current
+            state.current = current
+            if total:
+                state.total = total
+            if files_done is not None:
+                state.files_done = files_done
+            if files_total is not None:
+                state.files_total = files_total
+            due = time.monotonic() - self._last_render >= self.frame_interval
+        if due:
+            self.render()
+
+    def finish(self, key, completed=True):
+        """Remove a finished (or abandoned) transfer from the live view."""
+        with self._lock:
+            if self._transfers.pop(key, None) is not None and completed:
+                self.completed += 1
+
+    def set_fields(self, **fields):
+        """Attach run-level values (ETA, concurrency, ...) to the snapshot."""
+        with self._lock:
+            self._fields.update(fields)
+
+    def _update_speed(self, now):
+        """Exponentially smoothed aggregate throughput (lock held)."""
+        elapsed = now - self._rate_time
+        if elapsed >= 0.25:
+            instant = (self.bytes_done - self._rate_bytes) / elapsed
+            self.speed = instant if self.speed == 0 else 0.7 * self.speed + 0.3 * instant
+            self._rate_bytes = self.bytes_done
+            self._rate_time = now
+
+    def snapshot(self):
+        """Current progress of all transfers as a plain dictionary."""
+        now = time.monotonic()
+        with self._lock:
+            self._update_speed(now)
+            transfers = []
+            remaining = 0
+            for state in self._transfers.values():
+                elapsed = now - state.started
+                transfers.append({
+                    'name': state.name,
+                    'kind': state.kind,
+                    'current': state.current,
+                    'total': state.total,
+                    'percent': (state.current / state.total * 100) if state.total else 0.0,
+                    'speed': state.current / elapsed if elapsed > 0 else 0.0,
+                    'files_done': state.files_done,
+                    'files_total': state.files_total
+                })
+                remaining += max(state.total - state.current, 0)
+            snapshot = {
+                'transfers': transfers,
+                'active': len(transfers),
+                'completed': self.completed,
+                'bytes_done': self.bytes_done,
+                'bytes_remaining': remaining,
+                'speed': self.speed,
+                'transfer_eta_seconds': (remaining / self.speed) if self.speed > 0 else None,
+                'elapsed': now - self.started
+            }
+            snapshot.update(self._fields)
+        return snapshot
+
+    def render(self, force=False):
+        """Print the combined progress line if a new frame is due."""
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_render < self.frame_interval:
+                return
+            self._last_render = now
+        snapshot = self.snapshot()
+        line = self.render_line(snapshot)
+        if line:
+            self.output(line, end="", flush=True)
+
+    @staticmethod
+    def render_line(snapshot):
+        """Build the single-line view for a snapshot.
+
+        Download lines keep the ``📥 name pct% [bar] done/total at speed -
+        ETA: x`` shape and archive lines the ``📦 Archiving: pct% (n/m) -
+        file`` shape that the GUI log parser understands.
+        """
+        transfers = snapshot['transfers']
+        if not transfers:
+            return ""
+
+        speed = snapshot['speed']
+        eta = format_eta(snapshot['transfer_eta_seconds'])
+
+        archives = [t for t in transfers if t['kind'] == 'archive']
+        if archives:
+            a = archives[-1]
+            speed_part = f" at {format_size(speed)}/s" if speed > 0 else ""
+            return (f"\r  📦 Archiving: {a['percent']:.1f}% ({a['files_done']}/{a['files_total']}) - "
+                    f"{a['name'][:40]}{speed_part} - ETA: {eta}")
+
+        icon = "📤" if all(t['kind'] == 'upload' for t in transfers) else "📥"
+        done = sum(t['current'] for t in transfers)
+        total = sum(t['total'] for t in transfers)
+        percentage = (done / total * 100) if total else 0.0
+        filled = int(20 * percentage / 100)
+        bar = "█" * filled + "░" * (20 - filled)
+
+        if len(transfers) == 1:
+            name_part = transfers[0]['name'] or ""
+        else:
+            parts = [f"{(t['name'] or '?')[:18]} {t['percent']:.0f}%" for t in transfers[:4]]
+            if len(transfers) > 4:
+                parts.append(f"+{len(transfers) - 4}")
+            name_part = f"[{len(transfers)}] " + " · ".join(parts) + " |"
+
+        name_part = f"{name_part} " if name_part else ""
+        return (f"\r      {icon} {name_part}{percentage:5.1f}% [{bar}] "
+                f"{format_size(done)}/{format_size(total)} at {format_size(speed)}/s - ETA: {eta}")
+
+
+# Shared aggregator for the running export/backup, read by the GUI and web server
+_aggregator = ProgressAggregator()
+
+# Aggregator of the account run the current task belongs to (see use_aggregator)
+_current_aggregator = contextvars.ContextVar('progress_aggregator', default=None)
+
+
+def get_aggregator():
+    """Return the aggregator of the current account run, or the process-wide one."""
+    return _current_aggregator.get() or _aggregator
+
+
+def use_aggregator(aggregator):
+    """Report the progress of the current task, and of tasks and threads it starts, to ``aggregator``.
+
+    Lets concurrent account exports in one process (web server) each keep
+    their own transfers, ETA and counters.
+    """
+    _current_aggregator.set(aggregator)
+
+
+def progress_snapshot():
+    """Snapshot of the process-wide progress aggregator."""
+    return _aggregator.snapshot()
@@ -0,0 +1,219 @@
+"""
+Render exported pages again from the message cache
+
+``main.py --rerender`` rewrites message.html and message.md of every cached
+message with the current templates and formatters, without connecting to
+Telegram. Batches of messages are rendered by a pool of worker processes;
+the main process only reads the cache and stores archive bubbles, so the
+work spreads over all cores. Files whose content did not change are not
+written, so their folders are not uploaded to Google Drive again.
+
+Every message records the render version its pages were written with (see
+formatters.render_version). ``main.py --rerender-stale`` only renders the
+messages whose version is behind, newest first. Progress is stored after
+every batch, so a run stopped by ``--max-duration`` or Ctrl+C continues
+where it left off, and a template upgrade can roll through a large archive
+over several maintenance windows.
+
+With STORAGE_MODE = 'sqlite' the pages are written to the page store
+(export_pages.db) instead of the message folders.
+"""
+
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from database import (export_directories, init_database, get_cached_messages, get_message_cache_stats,
+                      store_archive_fragment, set_render_versions, get_render_version_stats)
+from formatters import (message_text, render_message_pages, render_version, output_digest, stylesheet_href,
+                        write_shared_stylesheet)
+from archive_pages import ARCHIVE_PAGES, archive_entry, update_archive_pages
+import bulk_export
+from message_cache import load_message
+from page_store import uses_page_store, page_store_path, has_message_files, store_message_files
+from layout import message_folder_path, relative_folder
+
+# Cached messages rendered per worker task
+RERENDER_BATCH_SIZE = 200
+# Messages between progress lines
+PROGRESS_INTERVAL = 2000
+
+SAVED_MESSAGES_TITLE = "Saved Messages"
+
+
+def _write_if_changed(path, content):
+    """Write a file unless it already has this content.
+
+    Returns:
+        True if the file was written
+    """
+    try:
+        if path.read_text(encoding='utf-8') == content:
+            return False
+    except (FileNotFoundError, UnicodeDecodeError):
+        pass
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    return True
+
+
+def render_batch(output_dir, rows, archive=False, sinks=('html', 'markdown'), store_pages=False):
+    """Render the pages of a batch of cached messages (runs in a worker process).
+
+    Args:
+        output_dir: Export directory the messages belong to
+        rows: Rows of database.get_cached_messages
+        archive: Also return the archive bubbles of the messages
+        sinks: Output sinks to write ('html' and/or 'markdown'; others are ignored)
+        store_pages: Write the pages to the page store instead of the message folders
+
+    Returns:
+        Dictionary with 'rendered', 'changed' and 'missing' counts,
+        'digests' ((message_id, output digest) per rendered message, digest
+        None for a missing one) and 'fragments', the arguments of
+        store_archive_fragment per message
+    """
+    stats = {'rendered': 0, 'changed': 0, 'missing': 0, 'digests': [], 'fragments': []}
+    store_path = page_store_path(output_dir)
+    for message_id, chat_title, data, media_filename, file_path, previous_digest in rows:
+        if store_pages and file_path:
+            # Served from /messages/<id>/ whatever the layout; the folder only exists for large media
+            folder = Path(output_dir) / Path(file_path).parent.name
+        else:
+            folder = message_folder_path(output_dir, file_path) if file_path else None
+        if folder is None:
+            # Deleted after upload to Google Drive (or never written). Recorded as done with no
+            # digest, so --rerender-stale does not pick it up again and a full --rerender still
+            # rewrites the pages if the folder comes back.
+            stats['missing'] += 1
+            stats['digests'].append((message_id, None))
+            continue
+        message = load_message(data)
+        text = message_text(message)
+        html_page, md_page = render_message_pages(message, media_filename, chat_title or SAVED_MESSAGES_TITLE,
+                                                  stylesheet_href(output_dir, folder), text=text)
+        digest = output_digest(html_page, md_page)
+        pages = [(folder / "message.html", html_page, 'html'), (folder / "message.md", md_page, 'markdown')]
+        pages = [(path, page) for path, page, sink in pages if sink in sinks]
+        if store_pages:
+            changed = digest != previous_digest or not has_message_files(store_path, message_id,
+                                                                         [path.name for path, _ in pages])
+            if changed:
+                store_message_files(store_path, message_id, [(path.name, page) for path, page in pages])
+        elif digest == previous_digest and all(path.exists() for path, _ in pages):
+            # Same output as recorded: nothing to compare or write
+            changed = False
+        else:
+            changed = any([_write_if_changed(path, page) for path, page in pages])
+        stats['rendered'] += 1
+        stats['changed'] += changed
+        stats['digests'].append((message_id, digest))
+        if archive:
+            stats['fragments'].append(archive_entry(message, relative_folder(file_path), media_filename, text))
+    return stats
+
+
+def rerender_export(output_dir, db_path, executor, workers, stale_only=False, run_budget=None):
+    """Render the cached messages of one export directory again, newest first.
+
+    Args:
+        output_dir: Export directory
+        db_path: Its database
+        executor: Pool of worker processes
+        workers: Number of workers in the pool
+        stale_only: Only messages whose pages have an older render version
+        run_budget: Optional RunBudget; no new batch is started once it is used up
+
+    Returns:
+        Dictionary with 'rendered', 'changed', 'missing' and 'uncached' counts,
+        'chat_title' and 'stopped' (reason, if the budget ended the run)
+    """
+    version = render_version()
+    cache = get_message_cache_stats(db_path)
+    totals = {'rendered': 0, 'changed': 0, 'missing': 0, 'uncached': cache['uncached'],
+              'chat_title': SAVED_MESSAGES_TITLE, 'stopped': None}
+    total = cache['cached']
+    if stale_only:
+        versions = get_render_version_stats(db_path, version)
+        total = versions['stale_cached']
+        totals['uncached'] = versions['stale'] - versions['stale_cached']
+        print(f"  {versions['stale']} of {versions['current'] + versions['stale']} message(s) were rendered "
+              f"with older templates or settings")
+    if totals['uncached']:
+        print(f"  ⚠️ {totals['uncached']} exported message(s) are not in the message cache "
+              f"(exported before it existed); run with --force once to include them")
+    if not total:
+        return totals
+    write_shared_stylesheet(output_dir)
+
+    pending = set()
+    before_id = None
+    done = reported = 0
+    while True:
+        # Keep every worker busy without reading the whole cache into memory
+        while len(pending) < workers * 2:
+            if run_budget is not None and run_budget.should_stop():
+                totals['stopped'] = run_budget.reason
+                break
+            rows = get_cached_messages(db_path, before_id, RERENDER_BATCH_SIZE, version if stale_only else None)
+            if not rows:
+                break
+            before_id = rows[-1][0]
+            totals['chat_title'] = rows[0][1] or SAVED_MESSAGES_TITLE
+            pending.add(executor.submit(render_batch, str(output_dir), rows, ARCHIVE_PAGES,
+                                        bulk_export.OUTPUT_SINKS, uses_page_store()))
+        if not pending:
+            break
+        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in finished:
+            stats = future.result()
+            for key in ('rendered', 'changed', 'missing'):
+                totals[key] += stats[key]
+            for fragment in stats['fragments']:
+                store_archive_fragment(db_path, *fragment)
+            # Saved per batch, so an interrupted run resumes with the messages still behind
+            set_render_versions(db_path, version, stats['digests'])
+            done += stats['rendered'] + stats['missing']
+        if done - reported >= PROGRESS_INTERVAL or not pending:
+            print(f"  Rendered {done}/{total} message(s)...")
+            reported = done
+    if totals['stopped']:
+        print(f"  ⏸️ Stopped: {totals['stopped']}; run again to continue with the remaining messages")
+
+    if ARCHIVE_PAGES:
+        archive = update_archive_pages(output_dir, db_path, totals['chat_title'])
+        if archive['pages_written']:
+            print(f"📚 Archive pages: {archive['pages_written']} of {archive['pages_total']} updated")
+    return totals
+
+
+def rerender_all(output_dir, workers=None, stale_only=False, run_budget=None):
+    """Render the pages of the export and of every chat subtree again from the message cache.
+
+    Args:
+        output_dir: Export directory (Saved Messages, with chats/ below it)
+        workers: Worker processes (default: one per CPU core)
+        stale_only: Only render pages written with older templates or settings
+        run_budget: Optional RunBudget shared by all export directories
+
+    Returns:
+        Dictionary mapping export directory to its statistics
+    """
+    workers = workers or os.cpu_count() or 1
+    results = {}
+    started = time.time()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for target in export_directories(output_dir):
+            print(f"🎨 Re-rendering {'stale pages of ' if stale_only else ''}{target} "
+                  f"with {workers} worker process(es)")
+            results[str(target)] = rerender_export(target, init_database(target), executor, workers,
+                                                   stale_only, run_budget)
+
+    rendered = sum(stats['rendered'] for stats in results.values())
+    changed = sum(stats['changed'] for stats in results.values())
+    missing = sum(stats['missing'] for stats in results.values())
+    print(f"\n✓ Re-rendered {rendered} message(s) in {time.time() - started:.1f}s, {changed} changed")
+    if missing:
+        print(f"  {missing} message folder(s) no longer exist locally and were skipped")
+    return results
@@ -0,0 +1,68 @@
+"""
+Time and transfer limits for runs that must fit a maintenance window
+"""
+
+import threading
+import time
+
+from progress import format_size
+
+# Import configuration
+try:
+    from config import RUN_BUDGET_MARGIN_SECONDS
+except ImportError:
+    RUN_BUDGET_MARGIN_SECONDS = 600
+
+
+class RunBudget:
+    """Decide when a run has to stop taking new work.
+
+    The export and backup stages ask ``should_stop()`` before starting each
+    message or folder and let everything already running finish. The
+    duration limit keeps a safety margin (10% of the window, at most
+    RUN_BUDGET_MARGIN_SECONDS) for in-flight transfers and the final
+    database commit. The byte limit counts downloaded and uploaded bytes
+    and also stops before a single item would cross it.
+    """
+
+    def __init__(self, max_seconds=None, max_bytes=None, margin_seconds=RUN_BUDGET_MARGIN_SECONDS):
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.margin = min(margin_seconds, max_seconds * 0.1) if max_seconds else 0
+        self.started = time.monotonic()
+        self.bytes_done = 0
+        self.reason = None
+        self._lock = threading.Lock()
+
+    def add_bytes(self, size):
+        """Count transferred bytes (thread-safe, uploads run on worker threads)."""
+        with self._lock:
+            self.bytes_done += size
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def should_stop(self, next_bytes=0):
+        """Check whether new work of ``next_bytes`` may still be started.
+
+        Once it returns True it keeps returning True and ``reason`` explains why.
+        """
+        if self.reason is not None:
+            return True
+        if self.max_seconds and self.elapsed() >= self.max_seconds - self.margin:
+            self.reason = f"time limit of {self.max_seconds / 60:.0f} min reached"
+        elif self.max_bytes and (self.bytes_done >= self.max_bytes
+                                 # A single item larger than the whole limit still runs first
+                                 or (self.bytes_done and self.bytes_done + next_bytes > self.max_bytes)):
+            self.reason = f"transfer limit of {format_size(self.max_bytes)} reached"
+        return self.reason is not None
+
+    def snapshot(self):
+        """Current state for the run report."""
+        return {
+            'elapsed': self.elapsed(),
+            'bytes_done': self.bytes_done,
+            'max_seconds': self.max_seconds,
+            'max_bytes': self.max_bytes,
+            'stopped': self.reason
+        }
@@ -0,0 +1,160 @@
+"""
+Static search index for browsing an export without Python
+
+Writes a ``search`` folder next to the message folders: ``index.html``
+searches the export in the browser, from a USB drive or any static host. The
+inverted index is split into shards by the first two characters of each term,
+and the result details into buckets of message IDs, so a query only loads
+the few files it needs instead of the whole index.
+
+Index files are JavaScript (``searchShard(...)`` / ``searchDocs(...)`` calls)
+rather than JSON: browsers load them with <script> tags from file:// URLs,
+where fetching JSON is blocked. Posting lists are delta encoded.
+
+The terms are kept in the database, and after every run only the messages
+exported or changed since the last run are indexed and only the shards and
+buckets they touch are written again.
+"""
+
+import json
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+from urllib.parse import quote
+
+from database import (SEARCH_SUBDIR, get_unindexed_messages, store_search_terms, claim_stale_search_files,
+                      get_all_search_files, get_search_shard, get_search_documents, get_search_document_count)
+from templates import get_template
+from layout import relative_folder
+from utils import normalize_for_search, write_atomic
+
+# Import configuration
+try:
+    from config import SEARCH_INDEX
+except ImportError:
+    SEARCH_INDEX = False
+
+# Terms shorter or longer than this are not indexed (and not searched for)
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 40
+# Message IDs per file of result details
+DOC_BUCKET_SIZE = 1000
+# Characters of message text shown with each result
+SNIPPET_LENGTH = 200
+# Messages indexed per database transaction
+INDEX_BATCH_SIZE = 5000
+
+
+def fold_diacritics(text):
+    """Remove accents, so 'café' is found by 'cafe' (the search page does the same)."""
+    return ''.join(char for char in unicodedata.normalize('NFKD', text)
+                   if not unicodedata.category(char).startswith('M'))
+
+
+def search_terms(*texts):
+    """Distinct index terms of the given texts, normalized like database.search_messages."""
+    terms = set()
+    for text in texts:
+        if text:
+            terms.update(term for term in normalize_for_search(fold_diacritics(text)).split()
+                         if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH)
+    return terms
+
+
+def shard_filename(shard):
+    """File name of a term shard (hex of its UTF-8 bytes, so any script is a safe name)."""
+    return f"{shard.encode('utf-8').hex()}.js"
+
+
+def index_new_messages(db_path):
+    """Add exported messages that are new or changed since the last run to the index.
+
+    Returns:
+        Number of messages indexed
+    """
+    indexed = 0
+    while True:
+        rows = get_unindexed_messages(db_path, INDEX_BATCH_SIZE)
+        if not rows:
+            return indexed
+        entries = [(message_id, content_hash, search_terms(text, media_filename))
+                   for message_id, text, media_filename, content_hash in rows]
+        store_search_terms(db_path, entries, DOC_BUCKET_SIZE)
+        indexed += len(rows)
+        if indexed >= INDEX_BATCH_SIZE:
+            print(f"  Indexed {indexed} message(s) for search...")
+
+
+def _delta_encode(message_ids):
+    previous, deltas = 0, []
+    for message_id in message_ids:
+        deltas.append(message_id - previous)
+        previous = message_id
+    return deltas
+
+
+def _document(message_date, message_text, media_filename, file_path):
+    """[date, link to the message page, snippet] of a search result."""
+    try:
+        date = datetime.fromisoformat(message_date).strftime('%Y-%m-%d %H:%M')
+    except (TypeError, ValueError):
+        date = message_date or ''
+    link = f"../{quote(relative_folder(file_path))}/message.html" if file_path else ''
+    snippet = ' '.join((message_text or '').split())
+    if len(snippet) > SNIPPET_LENGTH:
+        snippet = snippet[:SNIPPET_LENGTH].rstrip() + '…'
+    return [date, link, snippet or (f"📎 {media_filename}" if media_filename else '')]
+
+
+def _write_script(path, call, key, data):
+    write_atomic(path, f"{call}({json.dumps(key)},{json.dumps(data, ensure_ascii=False, separators=(',', ':'))});\n")
+
+
+def update_search_index(output_dir, db_path, chat_title="Saved Messages"):
+    """Index new messages and write the index files they changed.
+
+    Everything is written when the search folder is missing its meta.js
+    (first run, or the folder was deleted).
+
+    Returns:
+        Dictionary with 'indexed', 'shards_written', 'docs_written' and 'documents'
+    """
+    search_dir = Path(output_dir) / SEARCH_SUBDIR
+    terms_dir, docs_dir = search_dir / 'terms', search_dir / 'docs'
+    terms_dir.mkdir(parents=True, exist_ok=True)
+    docs_dir.mkdir(exist_ok=True)
+    meta_path = search_dir / 'meta.js'
+
+    indexed = index_new_messages(db_path)
+    stale = claim_stale_search_files(db_path)
+    if not meta_path.exists():
+        stale = get_all_search_files(db_path, DOC_BUCKET_SIZE)
+
+    for shard in stale['shard']:
+        postings = {term: _delta_encode(ids) for term, ids in get_search_shard(db_path, shard).items()}
+        _write_script(terms_dir / shard_filename(shard), 'searchShard', shard, postings)
+    for bucket in stale['docs']:
+        first_id = bucket * DOC_BUCKET_SIZE
+        documents = {str(row[0]): _document(*row[1:])
+                     for row in get_search_documents(db_path, first_id, first_id + DOC_BUCKET_SIZE - 1)}
+        _write_script(docs_dir / f"{bucket}.js", 'searchDocs', bucket, documents)
+
+    page_path = search_dir / 'index.html'
+    page = get_template('search.html')({'chat_title': chat_title})
+    page_changed = not page_path.exists() or page_path.read_text(encoding='utf-8') != page
+    if page_changed:
+        write_atomic(page_path, page)
+
+    documents = get_search_document_count(db_path)
+    if stale['shard'] or stale['docs'] or page_changed or not meta_path.exists():
+        meta = {
+            'documents': documents,
+            # Appended to the file URLs, so browsers do not keep serving outdated shards
+            'version': datetime.now().strftime('%Y%m%d%H%M%S'),
+            'bucketSize': DOC_BUCKET_SIZE,
+            'minTerm': MIN_TERM_LENGTH,
+            'maxTerm': MAX_TERM_LENGTH,
+        }
+        write_atomic(meta_path, f"window.SEARCH_META = {json.dumps(meta)};\n")
+    return {'indexed': indexed, 'shards_written': len(stale['shard']), 'docs_written': len(stale['docs']),
+            'documents': documents}
@@ -0,0 +1,208 @@
+"""
+Precompiled templates for the message pages
+
+A template is plain text with value tags and block tags:
+
+    {{ name.attr }}                      value, HTML-escaped in .html templates
+    {{ name.attr|raw }}                  value inserted as is (already rendered markup)
+    {% if name %} {% elif not name %} {% else %} {% endif %}
+    {% for item in name %} ... {% endfor %}
+
+Names are looked up in the context dictionary (dictionary keys or object
+attributes after the first dot). A tag alone on its line removes the whole
+line, so block tags do not leave blank lines behind.
+
+Each template is compiled once into a Python function and cached; rendering
+is then a single call that appends literals and values to a list. Templates
+in TEMPLATE_DIR (config.py) replace the built-in ones of the same name.
+"""
+
+import html
+import re
+from pathlib import Path
+
+# Import configuration
+try:
+    from config import TEMPLATE_DIR
+except ImportError:
+    TEMPLATE_DIR = None
+
+BUILTIN_TEMPLATE_DIR = Path(__file__).resolve().parent / 'templates'
+
+TAG_RE = re.compile(r'{{\s*(.+?)\s*}}|{%\s*(.+?)\s*%}', re.DOTALL)
+# A block tag that is the only thing on its line takes the line with it
+BLOCK_LINE_RE = re.compile(r'^[ \t]*({%.*?%})[ \t]*\r?\n', re.MULTILINE)
+# Line breaks with the indentation that follows them, skipping over tags
+LAYOUT_RE = re.compile(r'({{.*?}}|{%.*?%})|\r?\n[ \t]*', re.DOTALL)
+NAME_RE = re.compile(r'[A-Za-z_][A-Za-z0-9_]*(?:\.[A-Za-z_][A-Za-z0-9_]*)*$')
+FILTERS = ('raw', 'escape')
+
+_compiled = {}
+
+
+class TemplateError(ValueError):
+    """Raised for a template that cannot be compiled."""
+
+
+def _get(obj, key):
+    if isinstance(obj, dict):
+        return obj.get(key)
+    return getattr(obj, key, None)
+
+
+def _escape(value):
+    return '' if value is None else html.escape(str(value))
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+class _Compiler:
+    """Translate template source into the source of a render function."""
+
+    def __init__(self, name, autoescape, minify):
+        self.name = name
+        self.autoescape = autoescape
+        self.minify = minify
+        self.lines = ['def render(context):', '    _out = []', '    _write = _out.append']
+        self.indent = 1
+        self.blocks = []
+        self.loop_vars = {}
+
+    def error(self, message):
+        return TemplateError(f"{self.name}: {message}")
+
+    def emit(self, code):
+        self.lines.append('    ' * self.indent + code)
+
+    def lookup(self, path):
+        """Python expression for a dotted name."""
+        if not NAME_RE.match(path):
+            raise self.error(f"invalid name '{path}'")
+        first, *rest = path.split('.')
+        code = self.loop_vars.get(first, f'context.get({first!r})')
+        for key in rest:
+            code = f'_get({code}, {key!r})'
+        return code
+
+    def condition(self, expression):
+        negate = expression.startswith('not ')
+        code = self.lookup(expression[4:].strip() if negate else expression)
+        return f'not {code}' if negate else code
+
+    def literal(self, text):
+        if text:
+            self.emit(f'_write({text!r})')
+
+    def value(self, expression):
+        path, *filters = [part.strip() for part in expression.split('|')]
+        for name in filters:
+            if name not in FILTERS:
+                raise self.error(f"unknown filter '{name}'")
+        escape = self.autoescape and 'raw' not in filters or 'escape' in filters
+        self.emit(f"_write({'_escape' if escape else '_text'}({self.lookup(path)}))")
+
+    def block(self, statement):
+        keyword, _, rest = statement.partition(' ')
+        rest = rest.strip()
+        if keyword == 'if':
+            self.emit(f'if {self.condition(rest)}:')
+            self.blocks.append('if')
+            self.indent += 1
+        elif keyword in ('elif', 'else'):
+            if not self.blocks or self.blocks[-1] != 'if':
+                raise self.error(f"'{keyword}' outside of 'if'")
+            self.emit('pass')
+            self.indent -= 1
+            self.emit(f'elif {self.condition(rest)}:' if keyword == 'elif' else 'else:')
+            self.indent += 1
+        elif keyword == 'for':
+            match = re.match(r'([A-Za-z_][A-Za-z0-9_]*)\s+in\s+(.+)$', rest)
+            if not match:
+                raise self.error(f"invalid loop '{statement}'")
+            variable = f'_loop{len(self.blocks)}_{match.group(1)}'
+            self.emit(f'for {variable} in {self.lookup(match.group(2))} or ():')
+            self.blocks.append(('for', match.group(1), self.loop_vars.get(match.group(1))))
+            self.loop_vars[match.group(1)] = variable
+            self.indent += 1
+        elif keyword in ('endif', 'endfor'):
+            if not self.blocks:
+                raise self.error(f"unexpected '{keyword}'")
+            block = self.blocks.pop()
+            if (block == 'if') != (keyword == 'endif'):
+                raise self.error(f"'{keyword}' does not close the open block")
+            if block != 'if':
+                _, name, previous = block
+                if previous is None:
+                    del self.loop_vars[name]
+                else:
+                    self.loop_vars[name] = previous
+            self.emit('pass')
+            self.indent -= 1
+        else:
+            raise self.error(f"unknown tag '{keyword}'")
+
+    def compile(self, source):
+        if self.minify:
+            # Only the template's own layout is removed, never rendered values
+            source = LAYOUT_RE.sub(lambda match: match.group(1) or '', source)
+        source = BLOCK_LINE_RE.sub(r'\1', source)
+        position = 0
+        for match in TAG_RE.finditer(source):
+            self.literal(source[position:match.start()])
+            position = match.end()
+            if match.group(1) is not None:
+                self.value(match.group(1))
+            else:
+                self.block(match.group(2))
+        self.literal(source[position:])
+        if self.blocks:
+            raise self.error("missing {% endif %} or {% endfor %}")
+        self.emit("return ''.join(_out)")
+        return '\n'.join(self.lines)
+
+
+def compile_template(source, name='<template>', autoescape=True, minify=False):
+    """Compile template source into a render function.
+
+    Args:
+        source: Template text
+        name: Name used in error messages
+        autoescape: HTML-escape values unless marked |raw
+        minify: Drop line breaks and indentation of the template's own text
+
+    Returns:
+        Function render(context) -> str
+    """
+    code = _Compiler(name, autoescape, minify).compile(source)
+    namespace = {'_get': _get, '_escape': _escape, '_text': _text}
+    exec(compile(code, name, 'exec'), namespace)
+    return namespace['render']
+
+
+def template_path(name):
+    """Path of a template, preferring TEMPLATE_DIR over the built-in one."""
+    if TEMPLATE_DIR:
+        custom = Path(TEMPLATE_DIR) / name
+        if custom.is_file():
+            return custom
+    return BUILTIN_TEMPLATE_DIR / name
+
+
+def get_template(name, minify=False):
+    """Load and compile a template once per process.
+
+    ``.html`` templates escape values by default; others (Markdown) do not.
+
+    Returns:
+        Function render(context) -> str
+    """
+    key = (name, minify)
+    render = _compiled.get(key)
+    if render is None:
+        path = template_path(name)
+        render = compile_template(path.read_text(encoding='utf-8'), str(path),
+                                  autoescape=name.endswith('.html'), minify=minify)
+        _compiled[key] = render
+    return render
@@ -0,0 +1,8 @@
+"""
+Test setup: the modules live flat in the repository root
+"""
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
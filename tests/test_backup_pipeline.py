@@ -0,0 +1,72 @@
+"""
+Disk budget of the pipelined backup
+"""
+
+import asyncio
+
+from backup_pipeline import DiskBudget
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_reservation_is_replaced_by_the_written_size():
+    async def scenario():
+        budget = DiskBudget(1000)
+        await budget.reserve(1, 400)
+        assert budget.used == 400
+        await budget.commit(1, 300)
+        assert budget.used == 300
+        await budget.free(300)
+        return budget.snapshot()
+
+    assert run(scenario()) == {'limit': 1000, 'used': 0, 'peak': 400, 'waits': 0}
+
+
+def test_cancel_releases_the_reservation():
+    async def scenario():
+        budget = DiskBudget(1000, used_bytes=100)
+        await budget.reserve(1, 500)
+        await budget.cancel(1)
+        return budget.used
+
+    assert run(scenario()) == 100
+
+
+def test_reserve_waits_until_space_is_freed():
+    async def scenario():
+        budget = DiskBudget(1000)
+        await budget.reserve(1, 800)
+        await budget.commit(1, 800)
+        waiting = asyncio.ensure_future(budget.reserve(2, 500))
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        await budget.free(800)
+        await asyncio.wait_for(waiting, 1)
+        return budget
+
+    budget = run(scenario())
+    assert budget.used == 500
+    assert budget.waits == 1
+
+
+def test_oversized_reservation_is_granted_when_nothing_is_held():
+    async def scenario():
+        budget = DiskBudget(100)
+        await asyncio.wait_for(budget.reserve(1, 5000), 1)
+        return budget.used
+
+    assert run(scenario()) == 5000
+
+
+def test_charge_does_not_wait():
+    async def scenario():
+        budget = DiskBudget(100, used_bytes=100)
+        await asyncio.wait_for(budget.charge(50), 1)
+        await budget.free(500)
+        return budget.snapshot()
+
+    snapshot = run(scenario())
+    assert snapshot['used'] == 0
+    assert snapshot['peak'] == 150
@@ -0,0 +1,105 @@
+"""
+Database helpers shared by concurrent workers
+"""
+
+import datetime
+import sqlite3
+from types import SimpleNamespace
+
+import pytest
+
+from database import (init_database, create_backfill_shards, claim_backfill_shard, begin_backfill_batch,
+                      update_backfill_cursor, finish_backfill_shard, release_backfill_shards,
+                      get_backfill_progress, mark_message_exported, get_exported_file_path,
+                      record_moved_folders)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return init_database(tmp_path)
+
+
+def test_pending_shards_are_claimed_newest_first(db_path):
+    create_backfill_shards(db_path, [(1, 100), (101, 200), (201, 300)])
+    claimed = [claim_backfill_shard(db_path, worker) for worker in range(3)]
+    assert [(shard['min_id'], shard['max_id'], shard['cursor']) for shard in claimed] == [
+        (201, 300, 301), (101, 200, 201), (1, 100, 101)]
+    assert get_backfill_progress(db_path)['running'] == 3
+
+
+def test_idle_worker_takes_the_older_half_of_the_busiest_shard(db_path):
+    create_backfill_shards(db_path, [(1, 1000), (1001, 1400)])
+    claim_backfill_shard(db_path, 0)
+    busy = claim_backfill_shard(db_path, 1)
+    update_backfill_cursor(db_path, busy['shard_id'], 901, 100)
+
+    split = claim_backfill_shard(db_path, 2, min_split=200)
+    # Worker 1 keeps [451, 901), worker 2 exports [1, 451)
+    assert (split['min_id'], split['max_id'], split['cursor']) == (1, 450, 451)
+    assert begin_backfill_batch(db_path, busy['shard_id'], 800) == 451
+
+
+def test_split_stays_below_the_batch_in_flight(db_path):
+    create_backfill_shards(db_path, [(1, 1000)])
+    busy = claim_backfill_shard(db_path, 0)
+    begin_backfill_batch(db_path, busy['shard_id'], 601)
+
+    split = claim_backfill_shard(db_path, 1, min_split=200)
+    assert split['max_id'] < 601
+    assert (split['min_id'], split['cursor']) == (1, 301)
+    # The running worker learns that the IDs below its new bound are taken
+    assert begin_backfill_batch(db_path, busy['shard_id'], 500) == 301
+
+
+def test_small_shards_are_not_split(db_path):
+    create_backfill_shards(db_path, [(1, 150)])
+    claim_backfill_shard(db_path, 0)
+    assert claim_backfill_shard(db_path, 1, min_split=200) is None
+
+
+def test_released_shards_keep_their_cursor(db_path):
+    create_backfill_shards(db_path, [(1, 100), (101, 200)])
+    done = claim_backfill_shard(db_path, 0)
+    stopped = claim_backfill_shard(db_path, 1)
+    finish_backfill_shard(db_path, done['shard_id'])
+    update_backfill_cursor(db_path, stopped['shard_id'], 60, 40)
+    release_backfill_shards(db_path, worker=1)
+
+    resumed = claim_backfill_shard(db_path, 2)
+    assert (resumed['shard_id'], resumed['cursor']) == (stopped['shard_id'], 60)
+    progress = get_backfill_progress(db_path)
+    assert (progress['done'], progress['exported'], progress['high_water']) == (1, 40, 200)
+
+
+def test_record_moved_folders(db_path):
+    date = datetime.datetime(2024, 3, 5, 12, tzinfo=datetime.timezone.utc)
+    for message_id in (7, 1500):
+        message = SimpleNamespace(id=message_id, date=date, text='hello', media=None)
+        mark_message_exported(db_path, message, None, f'/exports/20240305_120000_msg{message_id}_hello/message.html')
+    conn = sqlite3.connect(db_path)
+    conn.execute("INSERT INTO archive_pages (page_key, version, rendered_version) VALUES ('2024-03', 1, 1)")
+    conn.executemany("INSERT INTO archive_fragments (message_id, page_key, message_date, fragment) VALUES (?, ?, ?, ?)",
+                     [(7, '2024-03', date.isoformat(), '<a href="../20240305_120000_msg7_hello/">'),
+                      (1500, '2024-03', date.isoformat(), '<a href="../elsewhere/">')])
+    conn.execute("INSERT INTO search_documents (message_id, hash) VALUES (1500, 'x')")
+    conn.commit()
+    conn.close()
+
+    record_moved_folders(db_path, [
+        (7, '/exports/2024/03/20240305_120000_msg7_hello/message.html',
+         '"../20240305_120000_msg7_hello/', '"../2024/03/20240305_120000_msg7_hello/'),
+        (1500, '/exports/2024/03/20240305_120000_msg1500_hello/message.html',
+         '"../20240305_120000_msg1500_hello/', '"../2024/03/20240305_120000_msg1500_hello/'),
+    ], bucket_size=1000)
+
+    assert get_exported_file_path(db_path, 7) == '/exports/2024/03/20240305_120000_msg7_hello/message.html'
+    conn = sqlite3.connect(db_path)
+    fragments = dict(conn.execute('SELECT message_id, fragment FROM archive_fragments'))
+    version = conn.execute("SELECT version FROM archive_pages WHERE page_key = '2024-03'").fetchone()[0]
+    stale = conn.execute('SELECT kind, key FROM search_stale').fetchall()
+    conn.close()
+    assert fragments == {7: '<a href="../2024/03/20240305_120000_msg7_hello/">', 1500: '<a href="../elsewhere/">'}
+    # Only the rewritten bubble marks its page as changed
+    assert version == 2
+    # Only indexed messages mark their document bucket stale
+    assert stale == [('docs', '1')]
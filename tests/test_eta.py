@@ -0,0 +1,31 @@
+"""
+Remaining time of an export queue
+"""
+
+from types import SimpleNamespace
+
+from eta import ExportEtaEstimator
+
+
+def message(message_id, size=0):
+    document = SimpleNamespace(size=size) if size else None
+    return SimpleNamespace(id=message_id, media=SimpleNamespace(document=document) if size else None)
+
+
+def test_exported_messages_measure_the_overhead():
+    estimator = ExportEtaEstimator([message(1), message(2), message(3)])
+    estimator.message_done(1, total_seconds=2.0)
+    estimator.message_done(2, total_seconds=4.0)
+    assert estimator.overhead_per_message() == 3.0
+    assert estimator.remaining_messages == 1
+
+
+def test_failed_messages_leave_the_queue_without_being_measured():
+    estimator = ExportEtaEstimator([message(1), message(2, size=5000)])
+    estimator.message_done(1, total_seconds=2.0)
+    estimator.message_dropped(2)
+    # The worker drops every message once it is finished; exported ones are already gone
+    estimator.message_dropped(1)
+    assert estimator.overhead_per_message() == 2.0
+    assert (estimator.remaining_messages, estimator.remaining_bytes) == (0, 0)
+    assert estimator.estimate() == 0.0
@@ -0,0 +1,53 @@
+"""
+Placement of message folders below an export directory
+"""
+
+import pytest
+
+from layout import layout_folder, relative_folder, message_folder_path
+
+FOLDER = '20240305_120000_msg7_hello'
+
+
+def test_layout_folder():
+    assert layout_folder(FOLDER, 'flat') == FOLDER
+    assert layout_folder(FOLDER, 'year_month') == f'2024/03/{FOLDER}'
+
+
+def test_unknown_layout_is_rejected():
+    with pytest.raises(ValueError):
+        layout_folder(FOLDER, 'by_day')
+
+
+@pytest.mark.parametrize('file_path, expected', [
+    (f'/exports/{FOLDER}/message.html', FOLDER),
+    (f'/exports/2024/03/{FOLDER}/message.html', f'2024/03/{FOLDER}'),
+    # Directories that do not match the date of the folder are not a year/month layout
+    (f'/exports/2023/03/{FOLDER}/message.html', FOLDER),
+    (f'/data/1234/56/{FOLDER}/message.html', FOLDER),
+])
+def test_relative_folder(file_path, expected):
+    assert relative_folder(file_path) == expected
+
+
+def test_message_folder_path_uses_the_recorded_folder(tmp_path):
+    folder = tmp_path / FOLDER
+    folder.mkdir()
+    assert message_folder_path(tmp_path, str(folder / 'message.html')) == folder
+
+
+def test_message_folder_path_finds_a_moved_export(tmp_path):
+    folder = tmp_path / '2024' / '03' / FOLDER
+    folder.mkdir(parents=True)
+    recorded = f'/old/place/2024/03/{FOLDER}/message.html'
+    assert message_folder_path(tmp_path, recorded) == folder
+
+
+def test_message_folder_path_finds_a_folder_migrated_before_it_was_recorded(tmp_path):
+    folder = tmp_path / '2024' / '03' / FOLDER
+    folder.mkdir(parents=True)
+    assert message_folder_path(tmp_path, str(tmp_path / FOLDER / 'message.html')) == folder
+
+
+def test_message_folder_path_of_a_deleted_folder(tmp_path):
+    assert message_folder_path(tmp_path, str(tmp_path / FOLDER / 'message.html')) is None
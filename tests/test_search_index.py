@@ -0,0 +1,27 @@
+"""
+Terms of the static search index
+"""
+
+from search_index import MAX_TERM_LENGTH, search_terms
+
+
+def test_terms_are_normalized_like_database_search():
+    assert search_terms('Some-text with ha__cker, LAIT!') == {'some', 'text', 'with', 'hacker', 'lait'}
+
+
+def test_diacritics_are_folded():
+    assert search_terms('Café naïve') == {'cafe', 'naive'}
+
+
+def test_other_scripts_are_kept():
+    assert search_terms('Привет мир') == {'привет', 'мир'}
+
+
+def test_terms_outside_the_length_limits_are_dropped():
+    long_term = 'a' * (MAX_TERM_LENGTH + 1)
+    assert search_terms(f'x ok {long_term} {"b" * MAX_TERM_LENGTH}') == {'ok', 'b' * MAX_TERM_LENGTH}
+
+
+def test_terms_of_several_texts_are_merged():
+    assert search_terms('hello world', None, '', 'World caption') == {'hello', 'world', 'caption'}
+    assert search_terms() == set()
@@ -0,0 +1,70 @@
+"""
+Rendering message text from Telegram entities
+"""
+
+from text_render import render_text
+
+
+def entity(kind, offset, length, **fields):
+    """An entity like Telethon's; render_text only looks at the class name and the fields."""
+    cls = type(f'MessageEntity{kind}', (), {})
+    instance = cls()
+    instance.offset, instance.length = offset, length
+    instance.__dict__.update(fields)
+    return instance
+
+
+def test_plain_text_is_escaped():
+    assert render_text('a <b> & *c*') == ('a &lt;b&gt; &amp; *c*', 'a <b> & \\*c\\*')
+    assert render_text('') == ('', '')
+
+
+def test_offsets_count_utf16_code_units():
+    # The emoji takes two UTF-16 code units, so "bold" starts at offset 3, not 2
+    text = '😀 bold'
+    html, markdown = render_text(text, [entity('Bold', 3, 4)])
+    assert html == '😀 <span class="bold">bold</span>'
+    assert markdown == '😀 **bold**'
+
+
+def test_offsets_after_several_non_bmp_characters():
+    text = '👍🏽 ok 𝔘 link'
+    html, _ = render_text(text, [entity('Italic', 5, 2), entity('TextUrl', 11, 4, url='https://example.com')])
+    assert '<em>ok</em>' in html
+    assert '<a href="https://example.com" class="message-link" target="_blank">link</a>' in html
+
+
+def test_entities_past_the_end_are_clipped():
+    assert render_text('abc', [entity('Bold', 1, 10)])[1] == 'a**bc**'
+
+
+def test_emphasis_keeps_whitespace_outside_the_delimiters():
+    assert render_text('say hello now', [entity('Bold', 3, 7)])[1] == 'say **hello** now'
+
+
+def test_overlapping_entities_are_closed_and_reopened():
+    html, markdown = render_text('bold both italic', [entity('Bold', 0, 9), entity('Italic', 5, 11)])
+    assert html == '<span class="bold">bold <em>both</em></span> <em>italic</em>'
+    assert markdown == '**bold _both_** _italic_'
+
+
+def test_nothing_is_formatted_inside_code():
+    text = 'x = *y* http://a.b'
+    html, markdown = render_text(text, [entity('Pre', 0, len(text), language='py'), entity('Url', 8, 10)])
+    assert html == '<div class="code-block">x = *y* http://a.b</div>'
+    assert markdown == '```py\nx = *y* http://a.b\n```'
+
+
+def test_unsafe_link_targets_stay_text():
+    html, _ = render_text('click', [entity('TextUrl', 0, 5, url='javascript:alert(1)')])
+    assert html == 'click'
+
+
+def test_quote_followed_by_text_on_the_same_line():
+    html, markdown = render_text('Quote here and more', [entity('Blockquote', 0, 10)])
+    assert html == '<blockquote class="message-quote">Quote here</blockquote> and more'
+    assert markdown == '> Quote here\n\nand more'
+
+
+def test_multiline_quote():
+    assert render_text('one\ntwo\nafter', [entity('Blockquote', 0, 7)])[1] == '> one\n> two\n\nafter'
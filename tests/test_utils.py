@@ -0,0 +1,81 @@
+"""
+Size, duration and file helpers
+"""
+
+import threading
+
+import pytest
+
+from utils import parse_duration, parse_size, write_atomic
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('0', 0),
+    ('512', 512),
+    ('512B', 512),
+    ('1K', 1024),
+    ('500M', 500 * 1024 ** 2),
+    ('512MB', 512 * 1024 ** 2),
+    ('50g', 50 * 1024 ** 3),
+    ('5GiB', 5 * 1024 ** 3),
+    ('1.5T', int(1.5 * 1024 ** 4)),
+    (' 2 G ', 2 * 1024 ** 3),
+])
+def test_parse_size(text, expected):
+    assert parse_size(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', 'G', '5IB', '5iB', '5X', '5GG', '-1G', '1,5G', '5 GB extra'])
+def test_parse_size_rejects_malformed_sizes(text):
+    with pytest.raises(ValueError):
+        parse_size(text)
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('90', 90 * 60),
+    ('1.5', 90),
+    ('45s', 45),
+    ('90m', 90 * 60),
+    ('2h', 2 * 3600),
+    ('1h30m', 90 * 60),
+    ('1H 30M', 90 * 60),
+    ('1d', 86400),
+])
+def test_parse_duration(text, expected):
+    assert parse_duration(text) == expected
+
+
+@pytest.mark.parametrize('text', ['', 'h', '2x', '2h tomorrow', 'soon', '-5m'])
+def test_parse_duration_rejects_malformed_durations(text):
+    with pytest.raises(ValueError):
+        parse_duration(text)
+
+
+def test_write_atomic_replaces_the_file(tmp_path):
+    path = tmp_path / 'index.html'
+    path.write_text('old', encoding='utf-8')
+    write_atomic(path, 'new')
+    assert path.read_text(encoding='utf-8') == 'new'
+    assert [file.name for file in tmp_path.iterdir()] == ['index.html']
+
+
+def test_concurrent_writers_do_not_share_a_temporary_file(tmp_path):
+    path = tmp_path / 'meta.js'
+    contents = [f'writer {number} ' * 10000 for number in range(8)]
+    errors = []
+
+    def writer(content):
+        try:
+            for _ in range(20):
+                write_atomic(path, content)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(content,)) for content in contents]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert path.read_text(encoding='utf-8') in contents
+    assert [file.name for file in tmp_path.iterdir()] == ['meta.js']
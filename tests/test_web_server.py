@@ -0,0 +1,45 @@
+"""
+Serving exported pages over HTTP
+"""
+
+import datetime
+from types import SimpleNamespace
+from urllib.parse import urljoin
+
+import pytest
+
+pytest.importorskip('fastapi')
+pytest.importorskip('httpx')
+from fastapi.testclient import TestClient
+
+import formatters
+import web_server
+from database import init_database, mark_message_exported
+from layout import layout_folder
+
+
+def test_year_month_page_loads_its_stylesheet(tmp_path, monkeypatch):
+    monkeypatch.setattr(formatters, 'HTML_STYLE_MODE', 'shared')
+    profile = web_server.ACCOUNTS[web_server.DEFAULT_ACCOUNT]
+    monkeypatch.setattr(profile, 'output_dir', str(tmp_path))
+    db_path = init_database(tmp_path)
+    formatters.write_shared_stylesheet(tmp_path)
+
+    folder = tmp_path / layout_folder('20240305_120000_msg7_hello', 'year_month')
+    folder.mkdir(parents=True)
+    href = formatters.stylesheet_href(tmp_path, folder)
+    assert href.startswith('../../../')
+    (folder / 'message.html').write_text(f'<link rel="stylesheet" href="{href}"><p>hello</p>', encoding='utf-8')
+    message = SimpleNamespace(id=7, date=datetime.datetime(2024, 3, 5, 12, tzinfo=datetime.timezone.utc),
+                              text='hello', media=None)
+    mark_message_exported(db_path, message, None, str(folder / 'message.html'))
+
+    client = TestClient(web_server.app)
+    page_url = 'http://testserver/messages/7/message.html'
+    page = client.get(page_url)
+    assert page.status_code == 200
+    link = formatters.STYLESHEET_LINK_RE.search(page.text)
+    assert link is not None
+    css = client.get(urljoin(page_url, page.text[link.start() + len('href="'):link.end() - 1]))
+    assert css.status_code == 200
+    assert 'message' in css.text
@@ -0,0 +1,268 @@
+"""
+Single-pass rendering of message text with Telegram entities
+
+Telegram sends the plain text of a message together with a list of entities
+(bold, code, pre, links, mentions...) that point into it by UTF-16 offset and
+length. render_text walks the text and the entities once and produces the
+HTML and the Markdown version side by side, so nothing is guessed from
+``**`` or backticks in the text and nothing inside a code block is turned
+into a link.
+
+Entities are recognised by their Telethon class name, so this module does not
+import Telethon.
+"""
+
+import html
+import heapq
+import re
+
+# Entity types -> (HTML open, HTML close, Markdown open, Markdown close)
+STYLE_ENTITIES = {
+    'MessageEntityBold': ('<span class="bold">', '</span>', '**', '**'),
+    'MessageEntityItalic': ('<em>', '</em>', '_', '_'),
+    'MessageEntityUnderline': ('<u>', '</u>', '<u>', '</u>'),
+    'MessageEntityStrike': ('<s>', '</s>', '~~', '~~'),
+    'MessageEntitySpoiler': ('<span class="spoiler">', '</span>', '', ''),
+    'MessageEntityBlockquote': ('<blockquote class="message-quote">', '</blockquote>', '', '\n'),
+}
+
+# Markdown delimiters that only work right next to the text, so surrounding whitespace is moved outside
+EMPHASIS_ENTITIES = {'MessageEntityBold', 'MessageEntityItalic', 'MessageEntityStrike'}
+
+# Entity types that become links; the target is built in _link_target
+LINK_ENTITIES = {
+    'MessageEntityUrl', 'MessageEntityTextUrl', 'MessageEntityEmail', 'MessageEntityPhone',
+    'MessageEntityMention', 'MessageEntityMentionName', 'InputMessageEntityMentionName',
+}
+
+# Entity types whose content is shown verbatim; entities inside them are ignored
+CODE_ENTITIES = {'MessageEntityCode', 'MessageEntityPre'}
+
+# Link schemes written into href attributes; anything else is shown as text
+SAFE_SCHEMES = ('http://', 'https://', 'tg://', 'mailto:', 'tel:')
+
+NON_BMP_RE = re.compile('[\U00010000-\U0010FFFF]')
+BACKTICKS_RE = re.compile('`+')
+HTML_SPECIAL = '&<>'
+# Characters that would otherwise start Markdown formatting
+MARKDOWN_SPECIAL = '\\`*_[]'
+
+
+def _utf16_index(text):
+    """Python string index for every UTF-16 offset, or None when they are the same."""
+    if text.isascii() or not NON_BMP_RE.search(text):
+        return None
+    index = []
+    for position, char in enumerate(text):
+        index.append(position)
+        if ord(char) > 0xFFFF:
+            # Characters outside the BMP take two UTF-16 code units
+            index.append(position)
+    index.append(len(text))
+    return index
+
+
+def _spans(text, entities):
+    """Entities as (start, end, type name, entity) in Python string indices."""
+    index = _utf16_index(text)
+    spans = []
+    for entity in entities:
+        offset, length = getattr(entity, 'offset', None), getattr(entity, 'length', None)
+        if offset is None or not length or length < 0:
+            continue
+        start, end = offset, offset + length
+        if index is not None:
+            start, end = index[min(start, len(index) - 1)], index[min(end, len(index) - 1)]
+        end = min(end, len(text))
+        if start < end:
+            spans.append((start, end, type(entity).__name__, entity))
+    return spans
+
+
+def _link_target(kind, entity, content):
+    """href of a link entity, or None when it should stay plain text."""
+    if kind == 'MessageEntityTextUrl':
+        url = getattr(entity, 'url', '') or ''
+    elif kind == 'MessageEntityUrl':
+        url = content if '://' in content else 'http://' + content
+    elif kind == 'MessageEntityEmail':
+        url = 'mailto:' + content
+    elif kind == 'MessageEntityPhone':
+        url = 'tel:' + re.sub(r'[^\d+]', '', content)
+    elif kind == 'MessageEntityMention':
+        url = 'https://t.me/' + content.lstrip('@')
+    else:
+        user_id = getattr(entity, 'user_id', None)
+        url = f'tg://user?id={user_id}' if isinstance(user_id, int) else ''
+    return url if url.lower().startswith(SAFE_SCHEMES) else None
+
+
+def _code_fence(content, minimum):
+    """A backtick fence longer than any backtick run in the content."""
+    longest = max((len(run) for run in BACKTICKS_RE.findall(content)), default=0)
+    return '`' * max(minimum, longest + 1)
+
+
+def _escape_markdown(text):
+    # The backslash comes first so the added ones are not escaped again
+    for char in MARKDOWN_SPECIAL:
+        if char in text:
+            text = text.replace(char, '\\' + char)
+    return text
+
+
+def _at_line_start(parts):
+    """Whether Markdown written so far ends a line (fences and quotes need one)."""
+    for part in reversed(parts):
+        if part:
+            return part.endswith('\n')
+    return True
+
+
+def render_text(text, entities=None):
+    """Render message text to HTML and Markdown in one pass.
+
+    Args:
+        text: Plain message text (``message.message`` / ``message.raw_text``)
+        entities: Telegram entities pointing into the text, or None
+
+    Returns:
+        Tuple (html, markdown)
+    """
+    if not text:
+        return "", ""
+    spans = _spans(text, entities) if entities else None
+    if not spans:
+        return html.escape(text, quote=False), _escape_markdown(text)
+
+    # Most messages contain nothing to escape, which saves the work for every chunk
+    # (substring tests are much faster than a regex search on long texts)
+    escape_html = any(char in text for char in HTML_SPECIAL)
+    escape_markdown = any(char in text for char in MARKDOWN_SPECIAL)
+    html_parts, markdown_parts = [], []
+    # Open entities, innermost last: (end, HTML close, Markdown close, verbatim, quote, emphasis)
+    stack = []
+    pending = [(start, -end, order, kind, entity) for order, (start, end, kind, entity) in enumerate(spans)]
+    heapq.heapify(pending)
+    order = len(pending)
+    position = 0
+    verbatim = quoted = 0
+    # The spaces that followed a quote ending mid-line would indent the next Markdown paragraph
+    strip_lead = False
+
+    def write(until):
+        nonlocal strip_lead
+        chunk = text[position:until]
+        if not chunk:
+            return
+        html_parts.append(html.escape(chunk, quote=False) if escape_html else chunk)
+        if escape_markdown and not verbatim:
+            chunk = _escape_markdown(chunk)
+        if quoted:
+            chunk = chunk.replace('\n', '\n> ')
+        if strip_lead:
+            chunk = chunk.lstrip(' ')
+            strip_lead = not chunk
+        markdown_parts.append(chunk)
+
+    while pending or stack:
+        if stack and (not pending or stack[-1][0] <= pending[0][0]):
+            end, html_close, markdown_close, is_verbatim, is_quote, is_emphasis = stack.pop()
+            if is_emphasis:
+                # Trailing whitespace follows the closing delimiter ('**bold** ', not '**bold **')
+                stop = end
+                while stop > position and text[stop - 1].isspace():
+                    stop -= 1
+                end = stop
+            write(end)
+            position = end
+            html_parts.append(html_close)
+            markdown_parts.append(markdown_close)
+            verbatim -= is_verbatim
+            quoted -= is_quote
+            strip_lead = markdown_close == '\n\n'
+            continue
+
+        start, end, _, kind, entity = heapq.heappop(pending)
+        end = -end
+        # The whitespace an enclosing emphasis moved before its delimiter is already written
+        start = max(start, position)
+        if start >= end:
+            continue
+        write(start)
+        position = start
+        if stack and end > stack[-1][0]:
+            # Overlapping entities: close this one with its parent and reopen it after
+            heapq.heappush(pending, (stack[-1][0], -end, order, kind, entity))
+            order += 1
+            end = stack[-1][0]
+        if verbatim:
+            continue  # nothing is formatted inside code
+
+        content = text[start:end]
+        is_verbatim = is_quote = is_emphasis = 0
+        if kind in CODE_ENTITIES:
+            is_verbatim = 1
+            if kind == 'MessageEntityPre':
+                language = getattr(entity, 'language', '') or ''
+                fence = _code_fence(content, 3)
+                lead = '' if _at_line_start(markdown_parts) else '\n'
+                html_open, html_close = '<div class="code-block">', '</div>'
+                markdown_open, markdown_close = f'{lead}{fence}{language}\n', f'\n{fence}'
+            else:
+                fence = _code_fence(content, 1)
+                pad = ' ' if content.startswith('`') or content.endswith('`') else ''
+                html_open, html_close = '<span class="code">', '</span>'
+                markdown_open, markdown_close = fence + pad, pad + fence
+        elif kind in LINK_ENTITIES:
+            url = _link_target(kind, entity, content)
+            if url is None:
+                continue
+            html_open = f'<a href="{html.escape(url)}" class="message-link" target="_blank">'
+            html_close = '</a>'
+            if kind in ('MessageEntityUrl', 'MessageEntityEmail'):
+                # Bare addresses stay readable and are linked by Markdown viewers
+                is_verbatim = 1
+                markdown_open = markdown_close = ''
+            else:
+                markdown_open, markdown_close = '[', f']({url.replace(")", "%29")})'
+        elif kind in STYLE_ENTITIES:
+            html_open, html_close, markdown_open, markdown_close = STYLE_ENTITIES[kind]
+            if kind in EMPHASIS_ENTITIES:
+                if content.isspace():
+                    continue
+                is_emphasis = 1
+                # Leading whitespace, e.g. of a part reopened after an overlap, goes before the delimiter
+                lead = len(content) - len(content.lstrip())
+                if lead:
+                    write(start + lead)
+                    position = start + lead
+            if kind == 'MessageEntityBlockquote':
+                is_quote = 1
+                lead = '' if _at_line_start(markdown_parts) else '\n'
+                markdown_open = lead + '> '
+                if end < len(text) and text[end] != '\n':
+                    # Text on the same line would otherwise continue the quote
+                    markdown_close = '\n\n'
+        else:
+            continue  # hashtags, bot commands, custom emoji... stay plain text
+
+        html_parts.append(html_open)
+        markdown_parts.append(markdown_open)
+        strip_lead = False
+        stack.append((end, html_close, markdown_close, is_verbatim, is_quote, is_emphasis))
+        verbatim += is_verbatim
+        quoted += is_quote
+
+    write(len(text))
+    return ''.join(html_parts), ''.join(markdown_parts)
+
+
+def process_telegram_formatting(text, entities=None):
+    """Render message text with its entities to HTML."""
+    return render_text(text, entities)[0]
+
+
+def render_markdown(text, entities=None):
+    """Render message text with its entities to Markdown."""
+    return render_text(text, entities)[1]
@@ -0,0 +1,146 @@
+"""
+Stall watchdog for media downloads and Google Drive uploads
+"""
+
+import asyncio
+import threading
+import time
+
+# Import configuration
+try:
+    from config import STALL_TIMEOUT_SECONDS
+except ImportError:
+    STALL_TIMEOUT_SECONDS = 120
+
+try:
+    from config import STALL_MAX_RESTARTS
+except ImportError:
+    STALL_MAX_RESTARTS = 3
+
+
+class TransferStalledError(Exception):
+    """Raised when a transfer kept stalling after all restarts."""
+
+
+class Transfer:
+    """A single in-flight download or upload tracked by the watchdog."""
+
+    def __init__(self, name, kind, on_bytes=None):
+        self.name = name
+        self.kind = kind
+        self.started = time.monotonic()
+        self.last_progress = self.started
+        self.bytes_done = 0
+        self.on_bytes = on_bytes
+
+    def touch(self, current=None):
+        """Record progress. Called from transfer progress callbacks."""
+        self.last_progress = time.monotonic()
+        if current is not None:
+            delta = current - self.bytes_done
+            self.bytes_done = current
+            if self.on_bytes is not None and delta > 0:
+                self.on_bytes(delta)
+
+    def idle_seconds(self):
+        """Seconds since the transfer last made progress."""
+        return time.monotonic() - self.last_progress
+
+
+class TransferWatchdog:
+    """Track in-flight transfers and restart the ones that stop making progress.
+
+    Async downloads are run through ``run()``, which cancels the transfer task
+    once it has been idle for ``stall_timeout`` seconds and starts it again.
+    Synchronous uploads call ``track()``/``touch()`` themselves and report
+    stalls with ``record_stall()``.
+    """
+
+    def __init__(self, stall_timeout=STALL_TIMEOUT_SECONDS, max_restarts=STALL_MAX_RESTARTS):
+        self.stall_timeout = stall_timeout
+        self.max_restarts = max_restarts
+        self.check_interval = max(min(5.0, stall_timeout / 4), 0.05)
+        self._lock = threading.Lock()
+        self._transfers = set()
+        self.stats = {'stalls': 0, 'download_stalls': 0, 'upload_stalls': 0, 'gave_up': 0}
+
+    def track(self, name, kind='download', on_bytes=None):
+        """Start tracking a transfer and return its handle."""
+        transfer = Transfer(name, kind, on_bytes)
+        with self._lock:
+            self._transfers.add(transfer)
+        return transfer
+
+    def untrack(self, transfer):
+        """Stop tracking a finished transfer."""
+        with self._lock:
+            self._transfers.discard(transfer)
+
+    def active_transfers(self):
+        """Snapshot of the transfers currently in flight."""
+        with self._lock:
+            return list(self._transfers)
+
+    def is_stalled(self, transfer):
+        """Check whether a transfer exceeded the stall timeout."""
+        return transfer.idle_seconds() > self.stall_timeout
+
+    def record_stall(self, transfer):
+        """Count a stall event for the run statistics."""
+        with self._lock:
+            self.stats['stalls'] += 1
+            self.stats[f'{transfer.kind}_stalls'] = self.stats.get(f'{transfer.kind}_stalls', 0) + 1
+        print(f"\n    ⚠️ {transfer.kind.capitalize()} stalled: {transfer.name} "
+              f"(no progress for {transfer.idle_seconds():.0f}s)")
+
+    def record_gave_up(self):
+        """Count a transfer abandoned after exhausting its restarts."""
+        with self._lock:
+            self.stats['gave_up'] += 1
+
+    async def run(self, name, transfer_factory, kind='download', on_bytes=None, on_stall=None):
+        """Run an async transfer, restarting it whenever it stalls.
+
+        Args:
+            name: Display name of the transfer
+            transfer_factory: Callable taking the Transfer handle and returning
+                a new coroutine; it must call ``transfer.touch()`` on progress
+            kind: 'download' or 'upload'
+            on_bytes: Optional callback receiving each progress increment in bytes
+            on_stall: Optional callback invoked with the Transfer on every stall
+
+        Returns:
+            The result of the transfer coroutine
+
+        Raises:
+            TransferStalledError: If the transfer stalled on every attempt
+        """
+        for attempt in range(self.max_restarts + 1):
+            transfer = self.track(name, kind, on_bytes)
+            task = asyncio.ensure_future(transfer_factory(transfer))
+            try:
+                while True:
+                    done, _ = await asyncio.wait({task}, timeout=self.check_interval)
+                    if done:
+                        return task.result()
+                    if self.is_stalled(transfer):
+                        self.record_stall(transfer)
+                        if on_stall is not None:
+                            on_stall(transfer)
+                        task.cancel()
+                        try:
+                            await task
+                        except (asyncio.CancelledError, Exception):
+                            pass
+                        break
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            finally:
+                self.untrack(transfer)
+
+            if attempt < self.max_restarts:
+                print(f"    🔄 Restarting {kind} (attempt {attempt + 2}/{self.max_restarts + 1})...")
+
+        self.record_gave_up()
+        raise TransferStalledError(f"{kind.capitalize()} of {name} stalled {self.max_restarts + 1} times")
@@ -4,6 +4,9 @@ Utility functions for Telegram export
 
 import re
 
+# Kept importable from here; the renderer lives in text_render
+from text_render import process_telegram_formatting
+
 
 def sanitize_filename(text, max_length=50):
     """Create a safe filename from text."""
@@ -49,25 +52,88 @@ def sanitize_filename(text, max_length=50):
     return text
 
 
-def process_telegram_formatting(text):
-    """Process Telegram formatting like **bold**, `code`, etc."""
+SIZE_SUFFIXES = {'': 1, 'B': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(text):
+    """Parse a size like "50G", "512MB" or "1.5T" into bytes (binary units)."""
+    # 'iB' only follows a unit prefix ('5GiB'), so '5IB' is rejected
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(?:([KMGT])(?:I?B)?|B)?\s*', str(text), re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size '{text}', expected e.g. 500M, 50G or 1.5T")
+    number, suffix = match.groups()
+    return int(float(number) * SIZE_SUFFIXES[(suffix or '').upper()])
+
+
+DURATION_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_duration(text):
+    """Parse a duration like "2h", "90m", "1h30m" or "45s" into seconds.
+    
+    A bare number is taken as minutes.
+    """
+    text = str(text).strip().lower()
+    if re.fullmatch(r'\d+(?:\.\d+)?', text):
+        return float(text) * 60
+    parts = re.findall(r'(\d+(?:\.\d+)?)\s*([smhd])', text)
+    if not parts or re.sub(r'(\d+(?:\.\d+)?)\s*([smhd])', '', text).strip():
+        raise ValueError(f"Invalid duration '{text}', expected e.g. 2h, 90m or 1h30m")
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def write_atomic(path, content):
+    """Replace a text file in one step, so readers never see half of it.
+
+    Every writer uses its own temporary file, so backfill workers writing the
+    same file at once never take each other's.
+    """
+    import os
+    import tempfile
+    from pathlib import Path
+    path = Path(path)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+
+def folder_size(path):
+    """Total size in bytes of all files below a folder."""
+    from pathlib import Path
+    total = 0
+    for file_path in Path(path).rglob('*'):
+        try:
+            if file_path.is_file():
+                total += file_path.stat().st_size
+        except OSError:
+            pass
+    return total
+
+
+def normalize_for_search(text):
+    """Normalize text for flexible search - remove extra spaces, underscores, special chars
+
+    Examples:
+        "ha__cker" -> "hacker"
+        "test___file___name" -> "testfilename"
+        "some-text_with__symbols" -> "some text with symbols"
+    """
     if not text:
-        return ""
-    
-    import html
-    # Escape HTML first
-    text = html.escape(text)
-    
-    # Process bold text **text**
-    text = re.sub(r'\*\*(.*?)\*\*', r'<span class="bold">\1</span>', text)
-    
-    # Process code `text`
-    text = re.sub(r'`([^`]+)`', r'<span class="code">\1</span>', text)
-    
-    # Process code blocks ```text```
-    text = re.sub(r'```(.*?)```', r'<div class="code-block">\1</div>', text, flags=re.DOTALL)
-    
-    # Process links (simple http/https detection)
-    text = re.sub(r'(https?://[^\s]+)', r'<a href="\1" class="message-link" target="_blank">\1</a>', text)
-    
-    return text
\ No newline at end of file
+        return ''
+    # Convert to lowercase
+    text = text.lower()
+    # First, remove ALL underscores completely (don't replace with spaces)
+    # This allows "ha__cker" to become "hacker"
+    text = text.replace('_', '')
+    # Replace hyphens with spaces for word separation
+    text = text.replace('-', ' ')
+    # Remove multiple spaces
+    text = re.sub(r'\s+', ' ', text)
+    # Remove special characters except spaces and alphanumeric
+    text = re.sub(r'[^\w\s]', '', text, flags=re.UNICODE)
+    return text.strip()
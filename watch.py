@@ -0,0 +1,265 @@
+"""
+Watch mode: keep one connection open and export Saved Messages as they change
+"""
+
+import asyncio
+from pathlib import Path
+from telethon import events
+
+# Import configuration
+try:
+    from config import OUTPUT_DIR
+except ImportError:
+    OUTPUT_DIR = 'telegram_saved_messages_exports'
+
+try:
+    from config import WATCH_BATCH_DELAY
+except ImportError:
+    WATCH_BATCH_DELAY = 1.0
+
+try:
+    from config import WATCH_CATCHUP_INTERVAL
+except ImportError:
+    WATCH_CATCHUP_INTERVAL = 300
+
+try:
+    from config import WATCH_MAX_ATTEMPTS
+except ImportError:
+    WATCH_MAX_ATTEMPTS = 3
+
+from database import (is_message_exported, get_latest_exported_id, get_exported_media,
+                      mark_messages_deleted, record_export_failure, journal_stage)
+from exporter import safe_operation, reconnect_client, export_message_queue, message_filename_base
+from layout import new_message_folder, message_folder_path
+from media_handler import message_media_id
+
+
+class SavedMessagesWatcher:
+    """Export new, edited and deleted Saved Messages from update events.
+
+    Event handlers only put messages on a queue. A single consumer collects
+    whatever arrived within ``batch_delay`` seconds and sends it through the
+    normal export path, so bursts (albums, forwards) become one batch. New
+    messages that were already exported are skipped; edits are always
+    rendered again, keeping the downloaded media unless the edit replaced
+    it. A catch-up with ``min_id`` after start, after reconnects and
+    every ``catchup_interval`` seconds picks up anything the updates missed.
+    A batch that fails is retried up to ``max_attempts`` times, then its
+    messages go to the failed_exports table for --retry-failed.
+    """
+
+    def __init__(self, client, db_path, output_dir=None, cancel_event=None,
+                 batch_delay=WATCH_BATCH_DELAY, catchup_interval=WATCH_CATCHUP_INTERVAL,
+                 max_attempts=WATCH_MAX_ATTEMPTS):
+        self.client = client
+        self.db_path = db_path
+        self.output_path = Path(output_dir or OUTPUT_DIR)
+        self.cancel_event = cancel_event
+        self.batch_delay = batch_delay
+        self.catchup_interval = catchup_interval
+        self.max_attempts = max_attempts
+        self.entity = None
+        self.queue = asyncio.Queue()
+        self.stats = {'exported': 0, 'edited': 0, 'deleted': 0, 'failed': 0, 'catchups': 0}
+
+    def _cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    async def _on_new_message(self, event):
+        await self.queue.put((event.message, False, 0))
+
+    async def _on_message_edited(self, event):
+        await self.queue.put((event.message, True, 0))
+
+    async def _on_message_deleted(self, event):
+        # Deletions in private chats carry no chat ID; the IDs are matched against the database
+        if event.chat_id is not None and event.chat_id != self.entity.id:
+            return
+        deleted = mark_messages_deleted(self.db_path, event.deleted_ids)
+        if deleted:
+            self.stats['deleted'] += len(deleted)
+            print(f"🗑️ Deleted in Telegram: {', '.join(str(message_id) for message_id in deleted)} (export kept)")
+
+    async def catch_up(self):
+        """Queue every message newer than the latest exported one."""
+        latest_id = get_latest_exported_id(self.db_path)
+        count = 0
+        async for message in self.client.iter_messages(self.entity, min_id=latest_id, reverse=True):
+            await self.queue.put((message, False, 0))
+            count += 1
+        self.stats['catchups'] += 1
+        if count:
+            print(f"🔄 Catch-up found {count} message(s) after ID {latest_id}")
+
+    def _reuse_previous_export(self, message):
+        """Rename the existing export folder of an edited message and keep its media.
+
+        The folder name contains a text preview, so an edit would otherwise
+        leave the old export next to the new one. If the message still has
+        the media that was downloaded, the file is journaled as done, so
+        export_message only renders the pages again.
+        """
+        previous = get_exported_media(self.db_path, message.id)
+        if not previous or not previous['file_path']:
+            return
+        folder = message_folder_path(self.output_path, previous['file_path'])
+        if folder is None:
+            return
+        new_folder = new_message_folder(self.output_path, message_filename_base(message))
+        if folder != new_folder and not new_folder.exists():
+            new_folder.parent.mkdir(parents=True, exist_ok=True)
+            folder.rename(new_folder)
+            folder = new_folder
+
+        media_id = message_media_id(message)
+        if media_id is None or media_id != previous['media_id'] or not previous['media_filename']:
+            return
+        media_path = folder / previous['media_filename']
+        if media_path.is_file():
+            journal_stage(self.db_path, message.id, folder_path=str(folder), folder_created=True,
+                          media_done=True, media_filename=media_path.name, media_size=media_path.stat().st_size)
+
+    async def _next_batch(self):
+        """Wait for queued messages and return them de-duplicated.
+
+        Queued items are (message, edited, failed attempts). The latest
+        version of a message wins, except that a failed item put back never
+        replaces a version queued by an update.
+        """
+        batch = {}
+        item = await self.queue.get()
+        await asyncio.sleep(self.batch_delay)
+        while True:
+            message, edited, attempts = item
+            previous = batch.get(message.id)
+            if previous is None:
+                batch[message.id] = item
+            elif attempts and not previous[2]:
+                batch[message.id] = (previous[0], edited or previous[1], 0)
+            else:
+                batch[message.id] = (message, edited or previous[1], attempts)
+            if self.queue.empty():
+                return list(batch.values())
+            item = self.queue.get_nowait()
+
+    async def _export_batch(self, batch):
+        messages = []
+        edited_count = 0
+        for message, edited, _ in batch:
+            if edited:
+                self._reuse_previous_export(message)
+                edited_count += 1
+            elif is_message_exported(self.db_path, message.id):
+                continue
+            messages.append(message)
+        if not messages:
+            return
+
+        print(f"\n📨 {len(messages)} message(s) to export ({edited_count} edited)")
+        stats = await export_message_queue(self.client, self.entity, messages, self.db_path,
+                                           self.output_path, self.cancel_event)
+        self.stats['exported'] += stats['exported']
+        self.stats['edited'] += edited_count
+        self.stats['failed'] += stats['failed']
+
+    async def _consume(self):
+        while not self._cancelled():
+            batch = await self._next_batch()
+            try:
+                await self._export_batch(batch)
+            except Exception as e:
+                print(f"⚠️ Watch export failed: {e}")
+                # Put the batch back so the next round retries it, up to max_attempts
+                given_up = 0
+                for message, edited, attempts in batch:
+                    if attempts + 1 < self.max_attempts:
+                        await self.queue.put((message, edited, attempts + 1))
+                    else:
+                        record_export_failure(self.db_path, message.id, e)
+                        given_up += 1
+                if given_up:
+                    self.stats['failed'] += given_up
+                    print(f"❌ Gave up on {given_up} message(s) after {self.max_attempts} attempts "
+                          f"(run --retry-failed to export them later)")
+                await asyncio.sleep(5)
+
+    async def _supervise(self, wait=None):
+        """Reconnect when the connection drops and catch up periodically.
+
+        The first catch-up runs after ``wait`` seconds (default
+        ``catchup_interval``). A failed catch-up (flood wait, RPC error) is
+        retried after a backoff that doubles up to ``catchup_interval``, so
+        the watcher keeps running.
+        """
+        elapsed = 0.0
+        wait = wait or self.catchup_interval
+        backoff = 5
+        while not self._cancelled():
+            await asyncio.sleep(1)
+            elapsed += 1
+            if not self.client.is_connected():
+                print("\n⚠️ Connection lost")
+                if not await reconnect_client(self.client):
+                    continue
+            elif elapsed < wait:
+                continue
+            elapsed = 0.0
+            try:
+                await safe_operation(self.client, self.catch_up)
+            except Exception as e:
+                print(f"⚠️ Watch catch-up failed: {e} (retrying in {backoff}s)")
+                wait = backoff
+                backoff = min(backoff * 2, max(self.catchup_interval, 5))
+                continue
+            wait = self.catchup_interval
+            backoff = 5
+
+    async def run(self):
+        """Watch until cancelled.
+
+        Returns:
+            Dictionary with 'exported', 'edited', 'deleted', 'failed' and
+            'catchups' counts
+        """
+        self.entity = await safe_operation(self.client, self.client.get_entity, 'me')
+        self.output_path.mkdir(exist_ok=True)
+
+        handlers = [
+            (self._on_new_message, events.NewMessage(chats=self.entity)),
+            (self._on_message_edited, events.MessageEdited(chats=self.entity)),
+            (self._on_message_deleted, events.MessageDeleted()),
+        ]
+        for callback, event in handlers:
+            self.client.add_event_handler(callback, event)
+
+        print("👀 Watching Saved Messages for new, edited and deleted messages (Ctrl+C to stop)")
+        first_catchup = None
+        try:
+            await safe_operation(self.client, self.catch_up)
+        except Exception as e:
+            # Updates are handled meanwhile; the supervisor catches up soon
+            print(f"⚠️ Watch catch-up failed: {e} (retrying in 5s)")
+            first_catchup = 5
+
+        tasks = [asyncio.ensure_future(self._consume()), asyncio.ensure_future(self._supervise(first_catchup))]
+        try:
+            if self.cancel_event is not None:
+                while not self._cancelled():
+                    await asyncio.sleep(0.5)
+            else:
+                await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for callback, _ in handlers:
+                self.client.remove_event_handler(callback)
+            print(f"\n👋 Watch stopped: {self.stats['exported']} exported, {self.stats['edited']} edited, "
+                  f"{self.stats['deleted']} deleted, {self.stats['failed']} failed")
+        return self.stats
+
+
+async def watch_saved_messages(client, db_path, output_dir=None, cancel_event=None):
+    """Export Saved Messages continuously from update events until cancelled."""
+    watcher = SavedMessagesWatcher(client, db_path, output_dir, cancel_event)
+    return await watcher.run()
@@ -6,6 +6,7 @@ Provides REST API endpoints for the React web interface
 
 import asyncio
 import os
+import re
 import subprocess
 import sys
 from pathlib import Path
@@ -14,26 +15,27 @@ from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import uvicorn
+from fastapi.responses import JSONResponse, Response, FileResponse
 
 # Import configuration and modules
-try:
-    from config import OUTPUT_DIR
-except ImportError:
-    OUTPUT_DIR = "telegram_saved_messages_exports"
-
-from database import init_database, get_export_stats
-from exporter import export_saved_messages
-from telethon import TelegramClient
+from database import CHATS_SUBDIR, DB_FILENAME, init_database, get_export_stats, get_exported_file_path
+from page_store import page_store_path, read_message_file, content_type, check_storage_mode
+from layout import message_folder_path
+from formatters import relink_stylesheet
+from progress import ProgressAggregator
+from accounts import load_accounts, export_account
 
-# Import API credentials
+# Account profiles (one 'default' account unless ACCOUNTS is set in config.py)
 try:
-    from config import API_ID, API_HASH, PHONE, SESSION_NAME
-except ImportError:
-    print("❌ ERROR: config.py not found or incomplete!")
-    print("Please create config.py from config.py.example")
+    ACCOUNTS = {profile.name: profile for profile in load_accounts()}
+    check_storage_mode()
+except ValueError as e:
+    print(f"❌ ERROR: {e}")
     sys.exit(1)
+DEFAULT_ACCOUNT = next(iter(ACCOUNTS))
+
+# Shared stylesheets at the export root (formatters.STYLESHEET_NAME and older versions)
+STYLESHEET_PATTERN = re.compile(r'telegram-export\.[0-9a-f]+\.css')
 
 
 @asynccontextmanager
@@ -43,10 +45,12 @@ async def lifespan(app: FastAPI):
     
     # Startup
     print("🚀 Starting Telegram Exporter API Server...")
-    print(f"📁 Output directory: {OUTPUT_DIR}")
     
-    # Initialize database and get path
-    DB_PATH = init_database(OUTPUT_DIR)
+    # Initialize the database of every account
+    for name, profile in ACCOUNTS.items():
+        print(f"📁 Output directory ({name}): {profile.output_dir}")
+        DB_PATHS[name] = init_database(profile.output_dir)
+    DB_PATH = DB_PATHS[DEFAULT_ACCOUNT]
     print("✅ Database initialized")
     
     yield
@@ -66,16 +70,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global state
-export_status = {
-    "running": False,
-    "progress": 0,
-    "message": "",
-    "error": None
+# Global state, one export status per account
+account_status = {
+    name: {
+        "running": False,
+        "progress": 0,
+        "message": "",
+        "error": None,
+        # Progress of the account's latest export run, separate from other accounts
+        "aggregator": ProgressAggregator()
+    }
+    for name in ACCOUNTS
 }
+export_status = account_status[DEFAULT_ACCOUNT]
 
-# Database path (will be set at startup)
+# Database paths (will be set at startup)
 DB_PATH = None
+DB_PATHS = {}
 
 
 @app.get("/")
@@ -88,23 +99,53 @@ async def root():
             "stats": "/api/stats",
             "export": "/api/export/start",
             "status": "/api/export/status",
-            "folder": "/api/open-folder"
+            "progress": "/api/export/progress",
+            "accounts": "/api/accounts",
+            "folder": "/api/open-folder",
+            "pages": "/messages/{message_id}/message.html"
         }
     }
 
 
+def get_account_profile(name):
+    """Look up an account profile or answer 404."""
+    if name not in ACCOUNTS:
+        raise HTTPException(status_code=404, detail=f"Unknown account '{name}'")
+    return ACCOUNTS[name]
+
+
 @app.get("/api/stats")
 async def get_stats():
     """Get export statistics"""
+    return await get_account_stats(DEFAULT_ACCOUNT)
+
+
+@app.get("/api/accounts")
+async def list_accounts():
+    """List the configured accounts and whether an export is running for each"""
+    return {
+        "accounts": [
+            dict(profile.to_dict(), running=account_status[name]["running"])
+            for name, profile in ACCOUNTS.items()
+        ],
+        "default": DEFAULT_ACCOUNT
+    }
+
+
+@app.get("/api/accounts/{name}/stats")
+async def get_account_stats(name: str):
+    """Get export statistics of one account"""
+    get_account_profile(name)
+    db_path = DB_PATHS.get(name)
     try:
-        if DB_PATH is None:
+        if db_path is None:
             print("❌ Database not initialized")
             raise HTTPException(status_code=503, detail="Database not initialized")
         
-        print(f"📊 Fetching stats from: {DB_PATH}")
+        print(f"📊 Fetching stats from: {db_path}")
         
         # Get stats
-        stats = get_export_stats(DB_PATH)
+        stats = get_export_stats(db_path)
         
         print(f"✅ Stats retrieved: {stats}")
         
@@ -114,6 +155,8 @@ async def get_stats():
             "export_sessions": stats.get("total_messages", 0),
             "last_export": stats.get("newest")
         }
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"❌ Error fetching stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -122,63 +165,83 @@ async def get_stats():
 @app.get("/api/export/status")
 async def get_export_status():
     """Get current export status"""
-    print(f"📊 Export status requested: {export_status}")
-    return export_status
+    return await get_account_export_status(DEFAULT_ACCOUNT)
+
+
+@app.get("/api/accounts/{name}/export/status")
+async def get_account_export_status(name: str):
+    """Get current export status of one account"""
+    get_account_profile(name)
+    # The aggregator of the account's run is reported through its snapshot
+    status = {key: value for key, value in account_status[name].items() if key != "aggregator"}
+    print(f"📊 Export status requested ({name}): {status}")
+    if status["running"]:
+        snapshot = account_status[name]["aggregator"].snapshot()
+        status["transfers"] = snapshot
+        status["eta_seconds"] = snapshot.get("eta_seconds")
+        status["work_percent"] = snapshot.get("work_percent")
+    return status
+
+
+@app.get("/api/export/progress")
+async def get_export_progress():
+    """Get live transfer progress (per-transfer and total throughput/ETA)"""
+    return account_status[DEFAULT_ACCOUNT]["aggregator"].snapshot()
 
 
-async def run_export_task(force_reexport=False):
+async def run_export_task(force_reexport=False, account_name=None):
     """Background task to run the export
     
     Args:
         force_reexport: If True, re-export already exported messages
+        account_name: Account to export (default account if None)
     """
-    global export_status
+    profile = ACCOUNTS[account_name or DEFAULT_ACCOUNT]
+    export_status = account_status[profile.name]
+    db_path = DB_PATHS.get(profile.name)
+    client = None
     
     try:
         print("\n" + "="*60)
         print("🚀 EXPORT TASK STARTED")
+        print(f"   Account: {profile.name}")
         print(f"   Force Re-export: {force_reexport}")
-        print(f"   Database: {DB_PATH}")
-        print(f"   Output Dir: {OUTPUT_DIR}")
+        print(f"   Database: {db_path}")
+        print(f"   Output Dir: {profile.output_dir}")
         print("="*60 + "\n")
         
-        if DB_PATH is None:
+        if db_path is None:
             raise Exception("Database not initialized")
         
         export_status["running"] = True
+        export_status["aggregator"] = ProgressAggregator()
         export_status["progress"] = 10
         export_status["message"] = "Connecting to Telegram..."
         export_status["error"] = None
         
         print("📱 Creating Telegram client...")
-        # Create client
-        client = TelegramClient(SESSION_NAME, API_ID, API_HASH)
+        # Create client (each account has its own session, so flood waits stay per account)
+        client = profile.create_client()
         
         print("🔐 Starting client and authenticating...")
-        await client.start(phone=PHONE)
+        await client.start(phone=profile.phone)
         
         export_status["message"] = "Fetching messages from Telegram..."
         export_status["progress"] = 30
         
         print(f"🔄 Starting export (force_reexport={force_reexport})...")
         
-        # Run export with db_path parameter
-        await export_saved_messages(
-            client=client,
-            db_path=DB_PATH,
-            from_date=None,
-            force_reexport=force_reexport,
-            output_dir=OUTPUT_DIR
-        )
+        # Run export into the account's own database and output tree
+        result = await export_account(profile, client, force_reexport=force_reexport,
+                                      aggregator=export_status["aggregator"])
+        report = result.get('stats', result.get('chats'))
         
         print("✅ Export function completed")
         
-        await client.disconnect()
-        print("📴 Client disconnected")
-        
         export_status["running"] = False
         export_status["progress"] = 100
         export_status["message"] = "Export completed successfully!"
+        export_status["report"] = report
         
         print("\n" + "="*60)
         print("✅ EXPORT TASK COMPLETED SUCCESSFULLY")
@@ -196,20 +259,17 @@ async def run_export_task(force_reexport=False):
         print(f"❌ Export error details: {e}")
         import traceback
         traceback.print_exc()
+    finally:
+        if client is not None:
+            await client.disconnect()
+            print("📴 Client disconnected")
 
 
-@app.post("/api/export/start")
-async def start_export(background_tasks: BackgroundTasks, force_reexport: bool = False):
-    """Start the export process
+def start_account_export(background_tasks, name, force_reexport):
+    """Queue the export of one account unless it is already running."""
+    print(f"🚀 Export start requested (account={name}, force_reexport={force_reexport})")
     
-    Query Parameters:
-        force_reexport: If true, re-export already exported messages
-    """
-    global export_status
-    
-    print(f"🚀 Export start requested (force_reexport={force_reexport})")
-    
-    if export_status["running"]:
+    if account_status[name]["running"]:
         print("⚠️ Export already running, rejecting request")
         return JSONResponse(
             status_code=400,
@@ -219,19 +279,42 @@ async def start_export(background_tasks: BackgroundTasks, force_reexport: bool =
     print("✅ Starting export in background...")
     
     # Start export in background with force_reexport parameter
-    background_tasks.add_task(run_export_task, force_reexport)
+    background_tasks.add_task(run_export_task, force_reexport, name)
     
     return {
         "status": "success",
-        "message": "Export started"
+        "message": "Export started",
+        "account": name
     }
 
 
+@app.post("/api/export/start")
+async def start_export(background_tasks: BackgroundTasks, force_reexport: bool = False):
+    """Start the export process
+    
+    Query Parameters:
+        force_reexport: If true, re-export already exported messages
+    """
+    return start_account_export(background_tasks, DEFAULT_ACCOUNT, force_reexport)
+
+
+@app.post("/api/accounts/{name}/export/start")
+async def start_account_export_endpoint(name: str, background_tasks: BackgroundTasks, force_reexport: bool = False):
+    """Start the export of one account; accounts export concurrently
+    
+    Query Parameters:
+        force_reexport: If true, re-export already exported messages
+    """
+    get_account_profile(name)
+    return start_account_export(background_tasks, name, force_reexport)
+
+
 @app.post("/api/open-folder")
-async def open_output_folder():
-    """Open the output folder in file explorer"""
+async def open_output_folder(account: str = None):
+    """Open the output folder (of the given account) in file explorer"""
+    profile = get_account_profile(account or DEFAULT_ACCOUNT)
     try:
-        output_path = Path(OUTPUT_DIR).resolve()
+        output_path = Path(profile.output_dir).resolve()
         
         if not output_path.exists():
             output_path.mkdir(parents=True, exist_ok=True)
@@ -249,6 +332,81 @@ async def open_output_folder():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _export_root(account, chat=None):
+    """Export directory of an account, or of one of its chats, or 404."""
+    root = Path(get_account_profile(account).output_dir)
+    if chat is not None:
+        root = root / CHATS_SUBDIR / chat
+        if '/' in chat or '\\' in chat or chat.startswith('.') or not (root / DB_FILENAME).exists():
+            raise HTTPException(status_code=404, detail=f"Unknown chat '{chat}'")
+    return root
+
+
+def serve_message_file(export_root, message_id, name):
+    """A page or media file of an exported message.
+
+    Pages and small media come from the page store (STORAGE_MODE = 'sqlite');
+    anything else from the message folder recorded in the database, so
+    exports written in 'files' mode are served too.
+    """
+    if '/' in name or '\\' in name or name.startswith('.'):
+        raise HTTPException(status_code=404, detail="Not found")
+    content = read_message_file(page_store_path(export_root), message_id, name)
+    if content is not None:
+        return Response(content, media_type=content_type(name))
+    file_path = get_exported_file_path(export_root / DB_FILENAME, message_id)
+    folder = message_folder_path(export_root, file_path) if file_path else None
+    if folder is not None and (folder / name).is_file():
+        if name == "message.html":
+            # Written for the folder's depth (YYYY/MM/<folder> in the year_month layout);
+            # served one level below the stylesheet route
+            page = relink_stylesheet((folder / name).read_text(encoding='utf-8'), '..')
+            return Response(page, media_type=content_type(name))
+        return FileResponse(folder / name, media_type=content_type(name))
+    raise HTTPException(status_code=404, detail=f"No {name} for message {message_id}")
+
+
+def serve_stylesheet(export_root, name):
+    """The shared stylesheet the pages link as ../telegram-export.<version>.css."""
+    # Older stylesheet versions stay linked by pages that were not rendered again
+    if not STYLESHEET_PATTERN.fullmatch(name) or not (export_root / name).is_file():
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(export_root / name, media_type=content_type(name))
+
+
+@app.get("/messages/{message_id}/{name}")
+async def get_message_file(message_id: int, name: str):
+    """Serve message.html, message.md or media of a Saved Messages export"""
+    return serve_message_file(_export_root(DEFAULT_ACCOUNT), message_id, name)
+
+
+@app.get("/messages/{name}")
+async def get_stylesheet(name: str):
+    return serve_stylesheet(_export_root(DEFAULT_ACCOUNT), name)
+
+
+@app.get("/accounts/{account}/messages/{message_id}/{name}")
+async def get_account_message_file(account: str, message_id: int, name: str):
+    """Serve a page or media file of another account's export"""
+    return serve_message_file(_export_root(account), message_id, name)
+
+
+@app.get("/accounts/{account}/messages/{name}")
+async def get_account_stylesheet(account: str, name: str):
+    return serve_stylesheet(_export_root(account), name)
+
+
+@app.get("/accounts/{account}/chats/{chat}/messages/{message_id}/{name}")
+async def get_chat_message_file(account: str, chat: str, message_id: int, name: str):
+    """Serve a page or media file of an exported chat (--chats)"""
+    return serve_message_file(_export_root(account, chat), message_id, name)
+
+
+@app.get("/accounts/{account}/chats/{chat}/messages/{name}")
+async def get_chat_stylesheet(account: str, chat: str, name: str):
+    return serve_stylesheet(_export_root(account, chat), name)
+
+
 if __name__ == "__main__":
     print("=" * 50)
     print("Telegram Exporter - FastAPI Server")
@@ -257,6 +415,8 @@ if __name__ == "__main__":
     print(f"API Docs: http://localhost:8000/docs")
     print("=" * 50)
     
+    # Only needed to serve; importing the app (tests, health checks, ASGI hosts) skips it
+    import uvicorn
     uvicorn.run(
         "web_server:app",
         host="0.0.0.0",